@@ -2,19 +2,220 @@
 
 from sqlalchemy.orm import Session
 from uuid import UUID, uuid4
-from models.cms import Content, ContentItemProperty
-from schemas.cms import ContentUpdate, ContentWithProperties, ItemContentProperty, BaseContent
+from models.cms import Content, ContentItemProperty, ContentReference, ContentGcRoot
+from models.migration import DataMigration
+from schemas.cms import ContentUpdate, ContentWithProperties, ItemContentProperty, BaseContent, ContentBatchOperation
 from sqlalchemy.sql import func
 from typing import List
 import logging
 from fastapi import HTTPException
 from inflection import camelize
-from sqlalchemy import and_
+from sqlalchemy import and_, or_, exists, text, case, select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+import threading
+import os
+from collections import OrderedDict
+from fastapi.encoders import jsonable_encoder
+from crud.user import get_user
+from utils.content_cache import public_content_cache
+from utils.http_cache import make_etag
+import json
+
+load_dotenv()
+
+CMS_GC_BATCH_SIZE = int(os.getenv("CMS_GC_BATCH_SIZE", "500"))
+CMS_GC_INTERVAL_SECONDS = int(os.getenv("CMS_GC_INTERVAL_SECONDS", "30"))
+# Nové uzly se zapisují více commity, chvíli po vytvoření nemusí být ještě odkázané
+CMS_GC_GRACE_SECONDS = int(os.getenv("CMS_GC_GRACE_SECONDS", "300"))
+CMS_GC_MAX_ROOTS_PER_RUN = int(os.getenv("CMS_GC_MAX_ROOTS_PER_RUN", "100"))
+# Root převzatý workerem se po pádu uvolní po uplynutí leasu
+CMS_GC_LEASE_SECONDS = int(os.getenv("CMS_GC_LEASE_SECONDS", "600"))
+
+# Vlastník contentu ani property se nikdy nemění, záznamy stačí vyhazovat podle velikosti
+_content_owner_cache = OrderedDict()
+_content_owner_cache_lock = threading.Lock()
+
+# GC smí běžet až po dokončeném backfillu content_reference, do té doby by hrany chyběly
+_content_references_ready = threading.Event()
+
+CONTENT_BATCH_MAX_OPERATIONS = int(os.getenv("CONTENT_BATCH_MAX_OPERATIONS", "200"))
+CONTENT_OWNER_CACHE_MAX_SIZE = int(os.getenv("CONTENT_OWNER_CACHE_MAX_SIZE", "10000"))
+
+CONTENT_REFERENCE_BACKFILL_LOCK = 7210518
+CONTENT_REFERENCE_BACKFILL_MIGRATION = "content_reference_backfill"
+CONTENT_LIST_ITEM_ROWS_MIGRATION = "content_list_item_rows_backfill"
+
+# Property rootu, na které už nevede žádná hrana z content_reference
+UNUSED_PROPERTIES_QUERY = text("""
+    SELECT property.id FROM content_item_property AS property
+    WHERE property.root_content_id = :root_id
+      AND property.created_at < :created_before
+      AND NOT EXISTS (SELECT 1 FROM content_reference AS reference WHERE reference.property_id = property.id)
+    LIMIT :batch_size
+""")
+
+# Nejmladší neodkázaný uzel rootu, který GC zatím chrání grace perioda
+YOUNGEST_UNUSED_NODE_QUERY = text("""
+    SELECT GREATEST(
+        (SELECT MAX(property.created_at) FROM content_item_property AS property
+         WHERE property.root_content_id = :root_id
+           AND property.created_at >= :created_before
+           AND NOT EXISTS (SELECT 1 FROM content_reference AS reference WHERE reference.property_id = property.id)),
+        (SELECT MAX(content.created_at) FROM content
+         WHERE content.root_content_id = :root_id
+           AND content.is_root = false
+           AND content.created_at >= :created_before
+           AND NOT EXISTS (SELECT 1 FROM content_item_property AS property WHERE property.content_id = content.id))
+    )
+""")
 
 def custom_camelize(string: str) -> str:
     words = string.split()  # Split the string into words by spaces
     return words[0].lower() + ''.join(word.capitalize() for word in words[1:])
 
+def content_root_id(content) -> UUID:
+    return content.id if content.is_root else content.root_content_id
+
+# content_reference je zdroj pravdy pro odkazy na property, item_content/list_item_content se z hran jen skládají
+def item_reference_rows(parent_content_id: UUID, item_content) -> list:
+    return [
+        {"id": uuid4(), "parent_content_id": parent_content_id, "row_index": None, "position": position, "property_id": as_uuid(prop_id)}
+        for position, prop_id in enumerate(item_content or [])
+    ]
+
+def list_item_reference_rows(parent_content_id: UUID, list_item_content) -> list:
+    return [
+        {"id": uuid4(), "parent_content_id": parent_content_id, "row_index": row_index, "position": position, "property_id": as_uuid(prop_id)}
+        for row_index, item_list in enumerate(list_item_content or [])
+        for position, prop_id in enumerate(item_list)
+    ]
+
+def replace_content_references(db: Session, content: Content, update_data: dict):
+    # ContentUpdate posílá pole celá, přepíšeme jen hrany části, která v požadavku je
+    if "item_content" in update_data:
+        db.query(ContentReference)\
+            .filter(ContentReference.parent_content_id == content.id, ContentReference.row_index == None)\
+            .delete(synchronize_session=False)
+        rows = item_reference_rows(content.id, update_data["item_content"])
+        if rows:
+            db.execute(insert(ContentReference), rows)
+
+    if "list_item_content" in update_data:
+        db.query(ContentReference)\
+            .filter(ContentReference.parent_content_id == content.id, ContentReference.row_index != None)\
+            .delete(synchronize_session=False)
+        rows = list_item_reference_rows(content.id, update_data["list_item_content"])
+        if rows:
+            db.execute(insert(ContentReference), rows)
+        content.list_item_rows = len(update_data["list_item_content"] or [])
+
+def next_reference_position(db: Session, parent_content_id: UUID, row_index: int = None) -> int:
+    # MAX přes index (parent_content_id, row_index, position), mezery po smazání nevadí
+    position = db.query(func.max(ContentReference.position))\
+        .filter(ContentReference.parent_content_id == parent_content_id, ContentReference.row_index == row_index)\
+        .scalar()
+    return 0 if position is None else position + 1
+
+def load_content_references(db: Session, contents) -> dict:
+    # {content_id: (item_content, list_item_content)} jedním dotazem nad hranami, prázdné řádky drží list_item_rows
+    references = {content.id: ([], [[] for _ in range(content.list_item_rows or 0)]) for content in contents}
+    if not references:
+        return references
+
+    edges = db.query(ContentReference.parent_content_id, ContentReference.row_index, ContentReference.property_id)\
+        .filter(ContentReference.parent_content_id.in_(list(references.keys())))\
+        .order_by(ContentReference.parent_content_id, ContentReference.row_index, ContentReference.position)\
+        .all()
+
+    for parent_content_id, row_index, property_id in edges:
+        item_content, list_item_content = references[parent_content_id]
+        if row_index is None:
+            item_content.append(property_id)
+            continue
+        while len(list_item_content) <= row_index:
+            list_item_content.append([])
+        list_item_content[row_index].append(property_id)
+
+    return references
+
+def add_content_reference(db: Session, parent_content_id: UUID, property_id: UUID, row_index: int, position: int):
+    db.add(ContentReference(
+        id=uuid4(),
+        parent_content_id=parent_content_id,
+        row_index=row_index,
+        position=position,
+        property_id=property_id
+    ))
+
+def delete_content_references(db: Session, parent_content_ids: list):
+    db.query(ContentReference).filter(ContentReference.parent_content_id.in_(parent_content_ids)).delete(synchronize_session=False)
+
+def is_content_reference_backfill_completed(db: Session) -> bool:
+    if _content_references_ready.is_set():
+        return True
+    if db.query(DataMigration.name).filter(DataMigration.name == CONTENT_REFERENCE_BACKFILL_MIGRATION).first() is None:
+        return False
+    _content_references_ready.set()
+    return True
+
+def backfill_content_references(db: Session):
+    # Jednorázová migrace z item_content/list_item_content, zámek brání souběhu více workerů
+    db.execute(text("SELECT pg_advisory_xact_lock(:lock_key)"), {"lock_key": CONTENT_REFERENCE_BACKFILL_LOCK})
+
+    if is_content_reference_backfill_completed(db):
+        db.rollback()
+        return 0
+
+    # Jen parenty bez hran, hrany zapsané mezitím editorem ani opakovaný start nezdvojí
+    contents = db.query(Content).filter(
+        or_(Content.item_content != None, Content.list_item_content != None),
+        ~exists().where(ContentReference.parent_content_id == Content.id)
+    ).all()
+
+    migrated = 0
+    for content in contents:
+        try:
+            rows = item_reference_rows(content.id, content.item_content) + list_item_reference_rows(content.id, content.list_item_content)
+        except ValueError as e:
+            # Bez hran by GC smazal property, na které pole odkazuje; migrace se nedokončí
+            db.rollback()
+            raise ValueError(f"Content {content.id} has invalid property ids, content references not migrated") from e
+        if rows:
+            db.execute(insert(ContentReference), rows)
+            migrated += len(rows)
+
+    db.add(DataMigration(name=CONTENT_REFERENCE_BACKFILL_MIGRATION))
+    db.commit()
+    logging.info(f"Migrated {migrated} content references")
+
+    return migrated
+
+def backfill_content_list_item_rows(db: Session):
+    # Počet řádků list_item_content z legacy JSON pole, prázdné řádky v content_reference nejsou
+    db.execute(text("SELECT pg_advisory_xact_lock(:lock_key)"), {"lock_key": CONTENT_REFERENCE_BACKFILL_LOCK})
+
+    if db.query(DataMigration.name).filter(DataMigration.name == CONTENT_LIST_ITEM_ROWS_MIGRATION).first():
+        db.rollback()
+        return 0
+
+    migrated = db.execute(text("""
+        UPDATE content SET list_item_rows = json_array_length(list_item_content)
+        WHERE list_item_rows IS NULL AND json_typeof(list_item_content) = 'array'
+    """)).rowcount
+
+    db.add(DataMigration(name=CONTENT_LIST_ITEM_ROWS_MIGRATION))
+    db.commit()
+    logging.info(f"Migrated list_item_rows of {migrated} contents")
+
+    return migrated
+
+def invalidate_public_content(root_id: UUID):
+    # Veřejný snapshot se po změně sestaví znovu při dalším čtení
+    if root_id:
+        public_content_cache.invalidate(root_id)
+
 def create_root_content(db: Session, user_id: UUID):
     max_position = db.query(func.max(Content.position)).filter(Content.user_id == user_id).scalar() or 0
     new_position = max_position + 1
@@ -30,6 +231,42 @@ def create_root_content(db: Session, user_id: UUID):
     db.refresh(db_root_content)
     return db_root_content
 
+def get_cached_owner(entity_id: UUID):
+    with _content_owner_cache_lock:
+        owner_id = _content_owner_cache.get(entity_id)
+        if owner_id:
+            _content_owner_cache.move_to_end(entity_id)
+        return owner_id
+
+def cache_owner(entity_id: UUID, owner_id: UUID):
+    with _content_owner_cache_lock:
+        _content_owner_cache[entity_id] = owner_id
+        while len(_content_owner_cache) > CONTENT_OWNER_CACHE_MAX_SIZE:
+            _content_owner_cache.popitem(last=False)
+
+def get_content_owner(db: Session, content_id: UUID):
+    # Jen user_id sloupec místo celého get_content, smazaný content v cache nevadí, CRUD pak vrátí 404
+    owner_id = get_cached_owner(content_id)
+    if owner_id:
+        return owner_id
+
+    owner_id = db.query(Content.user_id).filter(Content.id == content_id).scalar()
+    if owner_id:
+        cache_owner(content_id, owner_id)
+
+    return owner_id
+
+def get_property_owner(db: Session, property_id: UUID):
+    owner_id = get_cached_owner(property_id)
+    if owner_id:
+        return owner_id
+
+    owner_id = db.query(ContentItemProperty.user_id).filter(ContentItemProperty.id == property_id).scalar()
+    if owner_id:
+        cache_owner(property_id, owner_id)
+
+    return owner_id
+
 def get_root_content(db: Session, content_id: UUID):
     db_root_content = db.query(Content).filter(Content.id == content_id).first()
 
@@ -58,6 +295,7 @@ def update_root_content(db: Session, content_id: UUID, alias: str):
     db_root_content.alias = alias
     db.commit()
     db.refresh(db_root_content)
+    invalidate_public_content(db_root_content.id)
     
     return db_root_content, 200
 
@@ -66,27 +304,39 @@ def delete_root_content(db: Session, content_id: UUID):
     db_root_content_id = db_root_content.id
     if db_root_content:
         db.delete(db_root_content)
+        delete_content_references(db, [db_root_content_id])
+        schedule_unused_content_gc(db, db_root_content_id)
         db.commit()
         
         db.query(Content).filter(Content.user_id == db_root_content.user_id, Content.position > db_root_content.position)\
             .update({Content.position: Content.position - 1})
         db.commit()
 
-        delete_unused_properties_and_contents(db, db_root_content_id)
+        invalidate_public_content(db_root_content_id)
 
         return 200, True
     return 404, False
 
+def apply_update_content(db: Session, db_content: Content, update_data: dict):
+    for key, value in update_data.items():
+        if key not in ("item_content", "list_item_content"):
+            setattr(db_content, key, value)
+
+    replace_content_references(db, db_content, update_data)
+
+    return db_content, 200
+
 def update_content(db: Session, content_id: UUID, content: ContentUpdate):
     db_content = db.query(Content).filter(Content.id == content_id).first()
     
     if not db_content:
         return None, 404
 
-    for key, value in content.dict(exclude_unset=True).items():
-        setattr(db_content, key, value)
+    apply_update_content(db, db_content, content.dict(exclude_unset=True))
+
     db.commit()
     db.refresh(db_content)
+    invalidate_public_content(content_root_id(db_content))
     return db_content
 
 def get_content(db: Session, content_id: UUID):
@@ -95,47 +345,34 @@ def get_content(db: Session, content_id: UUID):
     if not db_content:
         raise HTTPException(status_code=404, detail="Content not found")
 
-    # Fetch properties for item_content
-    if db_content.item_content:
-        properties = db.query(ContentItemProperty)\
-            .filter(ContentItemProperty.id.in_(db_content.item_content))\
-            .all()
-        
-        item_content_properties = [
-            ItemContentProperty(
-                content_id=prop.content_id,
-                id=prop.id,
-                key=prop.key
-            )
-            for prop in properties
+    # Pole se skládají z hran v pořadí position, property všech řádků jedním dotazem
+    item_content, list_item_content = load_content_references(db, [db_content])[db_content.id]
+    property_ids = item_content + [prop_id for item_list in list_item_content for prop_id in item_list]
+    properties = {
+        prop.id: prop
+        for prop in db.query(ContentItemProperty).filter(ContentItemProperty.id.in_(property_ids)).all()
+    } if property_ids else {}
+
+    item_content_properties = [
+        ItemContentProperty(
+            content_id=properties[prop_id].content_id,
+            id=prop_id,
+            key=properties[prop_id].key
+        )
+        for prop_id in item_content if prop_id in properties
+    ]
+
+    list_item_content_properties = [
+        [
+            {
+                "id": str(prop_id),
+                "content_id": str(properties[prop_id].content_id),
+                "key": properties[prop_id].key
+            }
+            for prop_id in item_list if prop_id in properties
         ]
-    else:
-        item_content_properties = []
-
-    # Fetch properties for list_item_content (2D array of UUIDs)
-    list_item_content_properties = []
-    
-    if db_content.list_item_content:
-        # Iterate over the 2D array of UUIDs
-        for item_list in db_content.list_item_content:
-            resolved_item_list = []
-            
-            # Fetch properties for each UUID in the current list
-            properties = db.query(ContentItemProperty)\
-                .filter(ContentItemProperty.id.in_(item_list))\
-                .all()
-
-            resolved_item_list = [
-                {
-                    "id": str(prop.id),
-                    "content_id": str(prop.content_id),
-                    "key": prop.key
-                }
-                for prop in properties
-            ]
-            
-            # Append the resolved properties for this list to the final 2D array
-            list_item_content_properties.append(resolved_item_list)
+        for item_list in list_item_content
+    ]
 
     content_response = ContentWithProperties(
         id=db_content.id,
@@ -152,46 +389,51 @@ def get_content(db: Session, content_id: UUID):
 
     return content_response
 
-def create_new_item_property(db: Session, content_id: UUID, root_id: UUID):
-    parent_content = db.query(Content).filter(Content.id == content_id).first()
-
-    if not parent_content:
-        return None, 404
-
+def new_child_property(db: Session, parent_content: Content, root_id: UUID, key: str):
+    # Content i property se zapíší stejným flush, bez mezicommitů
     new_content = Content(
         id=uuid4(),
         user_id=parent_content.user_id,
-        parent_content_id=content_id,
+        parent_content_id=parent_content.id,
         root_content_id=root_id,
         position=0,
         is_root=False
     )
-    db.add(new_content)
-    db.commit()
-    db.refresh(new_content)
 
     new_property = ContentItemProperty(
         id=uuid4(),
-        parent_content_id=content_id,
+        parent_content_id=parent_content.id,
         root_content_id=root_id,
         user_id=parent_content.user_id,
         content_id=new_content.id,
-        key="Klíč"
+        key=key
     )
-    db.add(new_property)
-    db.commit()
-    db.refresh(new_property)
 
-    if parent_content.item_content is None:
-        parent_content.item_content = []
-    
-    parent_content.item_content = parent_content.item_content + [new_property.id]
-    
-    db.commit()
-    db.refresh(parent_content)
+    db.add_all([new_content, new_property])
+
+    return new_property
+
+def apply_create_item_property(db: Session, parent_content: Content, root_id: UUID):
+    new_property = new_child_property(db, parent_content, root_id, "Klíč")
+
+    add_content_reference(db, parent_content.id, new_property.id, None, next_reference_position(db, parent_content.id))
 
     return new_property, 201
 
+def create_new_item_property(db: Session, content_id: UUID, root_id: UUID):
+    parent_content = db.query(Content).filter(Content.id == content_id).first()
+
+    if not parent_content:
+        return None, 404
+
+    new_property, status = apply_create_item_property(db, parent_content, root_id)
+
+    db.commit()
+    db.refresh(new_property)
+    invalidate_public_content(content_root_id(parent_content))
+
+    return new_property, status
+
 def update_property(db: Session, property_id: UUID, key: str):
     prop = db.query(ContentItemProperty).filter(ContentItemProperty.id == property_id).first()
 
@@ -202,27 +444,44 @@ def update_property(db: Session, property_id: UUID, key: str):
 
     db.commit()
     db.refresh(prop)
+    invalidate_public_content(prop.root_content_id)
     
     return prop, 200
 
+def apply_create_empty_list_item(db: Session, db_content: Content):
+    # Prázdný řádek nemá hrany, jen se zvýší počet řádků; výraz v SQL, souběžné zápisy se nepřepíšou
+    db_content.list_item_rows = func.coalesce(Content.list_item_rows, 0) + 1
+
+    return db_content, 200
+
 def create_empty_list_item_property_at_index(db: Session, content_id: UUID):
     db_content = db.query(Content).filter(Content.id == content_id).first()
 
     if not db_content:
         return 404
 
-    # Initialize as an empty 2D array if None
-    if db_content.list_item_content is None:
-        db_content.list_item_content = [[]]  # Initialize with a single empty list
-    else:
-        # Use the approach to add a new empty list without mutating the original
-        db_content.list_item_content = db_content.list_item_content + [[]]
+    apply_create_empty_list_item(db, db_content)
 
     db.commit()
     db.refresh(db_content)
+    invalidate_public_content(content_root_id(db_content))
 
     return 200
 
+def apply_add_list_item_property(db: Session, db_content: Content, index: int, root_id: UUID):
+    if index < 0:
+        return None, 400
+
+    # Chybějící řádky až do požadovaného indexu vzniknou jako prázdné
+    db_content.list_item_rows = func.greatest(func.coalesce(Content.list_item_rows, 0), index + 1)
+
+    new_property = new_child_property(db, db_content, root_id, "")
+
+    # Nová hrana na konec řádku
+    add_content_reference(db, db_content.id, new_property.id, index, next_reference_position(db, db_content.id, index))
+
+    return new_property, 200
+
 def add_property_to_list_item_content_at_index(db: Session, content_id: UUID, index: int, root_id: UUID):
     # Načteme obsah z databáze
     db_content = db.query(Content).filter(Content.id == content_id).first()
@@ -230,49 +489,62 @@ def add_property_to_list_item_content_at_index(db: Session, content_id: UUID, in
     if not db_content:
         return 404
 
-    # Zkontrolujeme, jestli `list_item_content` je None, pokud ano, inicializujeme jako prázdné dvourozměrné pole
-    if db_content.list_item_content is None:
-        db_content.list_item_content = []
-
-    # Zajistíme, že pole má dostatečnou délku, přidáme prázdné pole až do požadovaného indexu
-    while len(db_content.list_item_content) <= index:
-        db_content.list_item_content.append([])
-
-    new_content = Content(
-        id=uuid4(),  # Vytvoření nového contentu s UUID
-        user_id=db_content.user_id,
-        root_content_id=root_id,
-        parent_content_id=content_id,
-        position=0,  # Nastav hodnotu podle potřeby
-        is_root=False
-    )
-    db.add(new_content)
-    db.commit()
-    db.refresh(new_content)
-
-    new_property = ContentItemProperty(
-        id=uuid4(),
-        root_content_id=root_id,
-        parent_content_id=content_id,
-        user_id=db_content.user_id,
-        key="",
-        content_id=new_content.id  # Použijeme ID nového contentu místo uuid4()
-    )
-    db.add(new_property)
-    db.commit()
-    db.refresh(new_property)
-
-    # Přidáme nové ID do pole na daném indexu
-    updated_list = db_content.list_item_content.copy()  # Vytvoříme kopii pole
-    updated_list[index] = updated_list[index] + [str(new_property.id)]  # Přidáme nové ID
-    db_content.list_item_content = updated_list  # Nastavíme kopii jako novou hodnotu
+    new_property, status = apply_add_list_item_property(db, db_content, index, root_id)
+    if status != 200:
+        return status
 
     # Uložíme změny do databáze
     db.commit()
     db.refresh(db_content)
+    invalidate_public_content(content_root_id(db_content))
 
     return 200
 
+def apply_delete_list_item(db: Session, db_content: Content, index: int):
+    if not 0 <= index < (db_content.list_item_rows or 0):
+        return None, 400
+
+    # Property smazaného řádku z hran
+    property_ids = [row[0] for row in db.query(ContentReference.property_id).filter(
+        ContentReference.parent_content_id == db_content.id,
+        ContentReference.row_index == index
+    )]
+
+    db_content.list_item_rows = Content.list_item_rows - 1
+
+    # Hrany smazaného řádku pryč, následující řádky se posunou o jeden
+    db.query(ContentReference)\
+        .filter(ContentReference.parent_content_id == db_content.id, ContentReference.row_index == index)\
+        .delete(synchronize_session=False)
+    db.query(ContentReference)\
+        .filter(ContentReference.parent_content_id == db_content.id, ContentReference.row_index > index)\
+        .update({ContentReference.row_index: ContentReference.row_index - 1}, synchronize_session=False)
+
+    # Property, na které už nevede žádná hrana, smažeme i s jejich contentem
+    still_referenced = {
+        row[0] for row in db.query(ContentReference.property_id).filter(ContentReference.property_id.in_(property_ids)).distinct()
+    }
+    unused_properties = db.query(ContentItemProperty)\
+        .filter(ContentItemProperty.id.in_([property_id for property_id in property_ids if property_id not in still_referenced]))\
+        .all()
+
+    related_content_ids = [prop.content_id for prop in unused_properties if prop.content_id]
+    for prop in unused_properties:
+        db.delete(prop)
+    db.flush()
+
+    if related_content_ids:
+        unused_content_ids = [row[0] for row in db.query(Content.id).filter(
+            Content.id.in_(related_content_ids),
+            Content.is_root == False,
+            ~exists().where(ContentItemProperty.content_id == Content.id)
+        )]
+        if unused_content_ids:
+            db.query(Content).filter(Content.id.in_(unused_content_ids)).delete(synchronize_session=False)
+            delete_content_references(db, unused_content_ids)
+
+    return db_content, 200
+
 def delete_item_from_list_item_content(db: Session, content_id: UUID, index: int):
     # Fetch the content by ID
     db_content = db.query(Content).filter(Content.id == content_id).first()
@@ -280,99 +552,107 @@ def delete_item_from_list_item_content(db: Session, content_id: UUID, index: int
     if not db_content:
         return 404, "Content not found"
 
-    if not db_content.list_item_content or len(db_content.list_item_content) <= index:
+    result, status = apply_delete_list_item(db, db_content, index)
+    if status == 400:
         return 400, "Invalid index or list_item_content does not exist"
 
-    # Get the properties that are about to be deleted
-    properties_to_check = db_content.list_item_content[index]
-
-    # Remove the item from list_item_content
-    updated_list = db_content.list_item_content[:index] + db_content.list_item_content[index + 1:]
-    db_content.list_item_content = updated_list
+    # Hlubší potomci smazaných contentů dojdou do GC
+    schedule_unused_content_gc(db, content_root_id(db_content))
 
-    # Commit the changes
     db.commit()
-    db.refresh(db_content)
-
-    # Explicitly check and delete properties and their content if unused
-    for property_id in properties_to_check:
-        prop = db.query(ContentItemProperty).filter(ContentItemProperty.id == property_id).first()
-        if prop:
-            # Check if this property is used anywhere else in list_item_content or item_content
-            used_in_other_content = db.query(Content).filter(
-                and_(
-                    Content.id != content_id,
-                    or_(
-                        Content.list_item_content.contains([property_id]),
-                        Content.item_content.contains([property_id])
-                    )
-                )
-            ).count()
-
-            # If the property is not used elsewhere, delete it and its related content
-            if used_in_other_content == 0:
-                related_content_id = prop.content_id
-                db.delete(prop)
-                db.commit()
-
-                # If related content exists and is not used elsewhere, delete it
-                if related_content_id:
-                    related_content = db.query(Content).filter(Content.id == related_content_id).first()
-                    if related_content:
-                        content_used_elsewhere = db.query(ContentItemProperty).filter(ContentItemProperty.content_id == related_content_id).count()
-                        if content_used_elsewhere == 0 and not related_content.is_root:
-                            db.delete(related_content)
-                            db.commit()
+    invalidate_public_content(content_root_id(db_content))
 
     return 200, f"Item removed from list_item_content successfully, removed properties and content"
 
-def reorder_list_item_content_in_db(db: Session, content_id: UUID, new_order: List[int]):
-    db_content = db.query(Content).filter(Content.id == content_id).first()
+def apply_reorder_list_item_content(db: Session, db_content: Content, new_order: List[int]):
+    if db_content.list_item_rows is None:
+        return None, 404
 
-    if not db_content or db_content.list_item_content is None:
-        return 404
-    
-    if len(db_content.list_item_content) != len(new_order):
-        return 400
-    
-    content_map = {index: db_content.list_item_content[index] for index in range(len(db_content.list_item_content))}
-    
-    new_ordered_content = [content_map[new_index] for new_index in new_order]
-    
-    # Uložíme nově seřazený obsah
-    db_content.list_item_content = new_ordered_content
-    db.commit()
-    db.refresh(db_content)
+    if sorted(new_order) != list(range(db_content.list_item_rows)):
+        return None, 400
+
+    # Řádky přečíslujeme jedním UPDATE nad hranami parentu
+    if new_order:
+        db.query(ContentReference)\
+            .filter(ContentReference.parent_content_id == db_content.id, ContentReference.row_index != None)\
+            .update({
+                ContentReference.row_index: case(
+                    {old_index: new_index for new_index, old_index in enumerate(new_order)},
+                    value=ContentReference.row_index
+                )
+            }, synchronize_session=False)
 
-    return 200
+    return db_content, 200
 
-# TODO: Deleting property ids from item_content ain't working as it should, find out why the id is still in the array
-# TODO: deleting all child properties ain't solved yet
-def delete_property_from_content(db: Session, content_id: UUID, property_id: UUID):
+def reorder_list_item_content_in_db(db: Session, content_id: UUID, new_order: List[int]):
     db_content = db.query(Content).filter(Content.id == content_id).first()
 
     if not db_content:
-        return 404, "Content not found"
-
-    if db_content.item_content:
-        db_content.item_content = db.query(func.array_remove(db_content.item_content, property_id)).scalar()
+        return 404
 
-    if db_content.list_item_content:
-        updated_list_item_content = []
-        for item_list in db_content.list_item_content:
-            updated_item_list = [item for item in item_list if str(item) != str(property_id)]
-            updated_list_item_content.append(updated_item_list)
-        db_content.list_item_content = updated_list_item_content
+    result, status = apply_reorder_list_item_content(db, db_content, new_order)
+    if status != 200:
+        return status
 
     db.commit()
     db.refresh(db_content)
+    invalidate_public_content(content_root_id(db_content))
 
-    delete_unused_properties_and_contents(db, db_content.root_content_id)
+    return 200
 
-    return 200, "Property ID removed from content arrays successfully"
+def as_uuid(value) -> UUID:
+    # list_item_content je JSON, ID v něm jsou uložená jako stringy
+    return value if isinstance(value, UUID) else UUID(str(value))
+
+def referenced_property_ids(content_references: tuple) -> list:
+    item_content, list_item_content = content_references
+    return item_content + [prop_id for item_list in list_item_content for prop_id in item_list]
+
+def load_content_tree(db: Session, root_content: Content):
+    # Celý strom rootu třemi dotazy přes root_content_id a hrany
+    contents = {content.id: content for content in db.query(Content).filter(Content.root_content_id == root_content.id).all()}
+    contents[root_content.id] = root_content
+    properties = {prop.id: prop for prop in db.query(ContentItemProperty).filter(ContentItemProperty.root_content_id == root_content.id).all()}
+    references = load_content_references(db, contents.values())
+
+    # Reference mimo root_content_id (např. špatně zadaný root_id) dočteme po úrovních
+    pending = [root_content.id]
+    visited = set()
+    while pending:
+        visited.update(pending)
+
+        missing_property_ids = {
+            prop_id
+            for content_id in pending if content_id in references
+            for prop_id in referenced_property_ids(references[content_id])
+            if prop_id not in properties
+        }
+        if missing_property_ids:
+            for prop in db.query(ContentItemProperty).filter(ContentItemProperty.id.in_(missing_property_ids)).all():
+                properties[prop.id] = prop
+
+        child_content_ids = {
+            properties[prop_id].content_id
+            for content_id in pending if content_id in references
+            for prop_id in referenced_property_ids(references[content_id])
+            if prop_id in properties and properties[prop_id].content_id
+        }
+        missing_content_ids = child_content_ids - contents.keys()
+        if missing_content_ids:
+            missing_contents = db.query(Content).filter(Content.id.in_(missing_content_ids)).all()
+            for content in missing_contents:
+                contents[content.id] = content
+            references.update(load_content_references(db, missing_contents))
+
+        pending = list(child_content_ids - visited)
+
+    return contents, properties, references
+
+def transform_content(contents: dict, properties: dict, references: dict, content_id: UUID):
+    db_content = contents.get(content_id)
 
-def transform_content(db: Session, content_id: UUID):
-    db_content = db.query(Content).filter(Content.id == content_id).first()
+    if not db_content:
+        return None
 
     if db_content.content_type == "text":
         return db_content.text
@@ -385,33 +665,36 @@ def transform_content(db: Session, content_id: UUID):
 
     if db_content.content_type == "list_text_content":
         return db_content.list_text_content
-    
-    if db_content.content_type == "item_content":
-        item_content_ids = db_content.item_content
-
-        db_properties = db.query(ContentItemProperty).filter(ContentItemProperty.id.in_(item_content_ids)).all()
 
+    def transform_properties(property_ids):
         transformed_item_content = {}
 
-        for prop in db_properties:
-            transformed_item_content[custom_camelize(prop.key)] = transform_content(db, prop.content_id)
+        for prop_id in property_ids:
+            prop = properties.get(as_uuid(prop_id))
+            if prop:
+                transformed_item_content[custom_camelize(prop.key)] = transform_content(contents, properties, references, prop.content_id)
 
         return transformed_item_content
 
+    item_content, list_item_content = references.get(content_id, ([], []))
+
+    if db_content.content_type == "item_content":
+        return transform_properties(item_content)
+
     if db_content.content_type == "list_item_content":
-        list_item_content_ids = db_content.list_item_content
+        return [transform_properties(item_content_ids) for item_content_ids in list_item_content]
 
-        transformed_list_item_content = []
-        for item_content_ids in list_item_content_ids:  # Iterate over the 2D array
-            transformed_item_content = {}
-            db_properties = db.query(ContentItemProperty).filter(ContentItemProperty.id.in_(item_content_ids)).all()
+def render_root_public_content(db: Session, db_content: Content):
+    contents, properties, references = load_content_tree(db, db_content)
 
-            for prop in db_properties:
-                transformed_item_content[custom_camelize(prop.key)] = transform_content(db, prop.content_id)
+    output = {}
 
-            transformed_list_item_content.append(transformed_item_content)
+    if not db_content.alias:
+        output[db_content.id] = transform_content(contents, properties, references, db_content.id)
+    else:
+        output[custom_camelize(db_content.alias)] = transform_content(contents, properties, references, db_content.id)
 
-        return transformed_list_item_content
+    return output
 
 def get_root_public_content(db: Session, content_id: UUID):
     db_content = db.query(Content).filter(Content.id == content_id, Content.is_root == True).first()
@@ -419,44 +702,45 @@ def get_root_public_content(db: Session, content_id: UUID):
     if not db_content:
         return None, 404
 
-    output = {}
+    return render_root_public_content(db, db_content)
 
-    if not db_content.alias:
-        output[db_content.id] = transform_content(db, db_content.id)
-    else:
-        output[custom_camelize(db_content.alias)] = transform_content(db, db_content.id)
+def build_public_content_snapshot(db: Session, content_id: UUID):
+    db_content = db.query(Content).filter(Content.id == content_id, Content.is_root == True).first()
 
-    return output
+    if not db_content:
+        return None
 
-def delete_property_from_content(db: Session, content_id: UUID, property_id: UUID):
-    db_content = db.query(Content).filter(Content.id == content_id).first()
+    user = get_user(db, db_content.user_id)
 
-    if not db_content:
-        return 404, "Content not found"
+    body = json.dumps(jsonable_encoder(render_root_public_content(db, db_content)))
 
-    # Remove property from `item_content`
-    if db_content.item_content:
-        db_content.item_content = [prop_id for prop_id in db_content.item_content if prop_id != property_id]
+    # Hotové JSON tělo a vše potřebné pro kontrolu originu, čtení pak nesahá do DB
+    return {
+        "body": body,
+        "etag": make_etag(body),
+        "user_id": str(db_content.user_id),
+        "web_url": user.web_url if user else None,
+    }
 
-    # Remove property from `list_item_content`
-    if db_content.list_item_content:
-        updated_list_item_content = []
-        for item_list in db_content.list_item_content:
-            updated_item_list = [item for item in item_list if str(item) != str(property_id)]
-            updated_list_item_content.append(updated_item_list)
-        db_content.list_item_content = updated_list_item_content
+def get_public_content_snapshot(db: Session, content_id: UUID):
+    return public_content_cache.get_or_build(content_id, lambda: build_public_content_snapshot(db, content_id))
 
-    # Commit after removing the property references from content
-    db.commit()
+def apply_delete_property(db: Session, db_content: Content, property_id: UUID):
+    # Odebrání z item_content i ze všech řádků list_item_content je smazání hran
+    db.query(ContentReference)\
+        .filter(ContentReference.parent_content_id == db_content.id, ContentReference.property_id == property_id)\
+        .delete(synchronize_session=False)
 
     # Delete the property from the `ContentItemProperty` table
     prop_to_delete = db.query(ContentItemProperty).filter(ContentItemProperty.id == property_id).first()
-    if prop_to_delete:
-        db.delete(prop_to_delete)
-        db.commit()
+    if not prop_to_delete:
+        return db_content, 200
+
+    related_content_id = prop_to_delete.content_id
+    db.delete(prop_to_delete)
+    db.flush()
 
     # Check if the related content still exists and remove if unused
-    related_content_id = prop_to_delete.content_id if prop_to_delete else None
     if related_content_id:
         related_content = db.query(Content).filter(Content.id == related_content_id).first()
         if related_content:
@@ -464,76 +748,248 @@ def delete_property_from_content(db: Session, content_id: UUID, property_id: UUI
             other_properties = db.query(ContentItemProperty).filter(ContentItemProperty.content_id == related_content_id).count()
             if other_properties == 0 and not related_content.is_root:
                 db.delete(related_content)
-                db.commit()
+                delete_content_references(db, [related_content_id])
+
+    return db_content, 200
+
+def delete_property_from_content(db: Session, content_id: UUID, property_id: UUID):
+    db_content = db.query(Content).filter(Content.id == content_id).first()
+
+    if not db_content:
+        return 404, "Content not found"
+
+    apply_delete_property(db, db_content, property_id)
+    schedule_unused_content_gc(db, content_root_id(db_content))
+
+    db.commit()
+    invalidate_public_content(content_root_id(db_content))
 
     return 200, "Property and associated content deleted successfully"
 
-def delete_unused_properties_and_contents(db: Session, root_content_id: UUID):
-    # Fetch all properties and contents with the given root_content_id
-    properties = db.query(ContentItemProperty).filter(ContentItemProperty.root_content_id == root_content_id).all()
-    contents = db.query(Content).filter(Content.root_content_id == root_content_id).all()
+def is_batch_ref(value) -> bool:
+    return isinstance(value, str) and value.startswith("$")
 
-    # Identify all used property IDs by scanning through item_content and list_item_content across all content
-    used_property_ids = set()
+def parse_batch_id(value) -> UUID:
+    try:
+        return as_uuid(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid id: {value}")
 
-    # Query all the content globally to check for any references to properties
-    all_contents = db.query(Content).all()
+def resolve_batch_id(value, refs: dict, attribute: str):
+    if value is None:
+        return None
 
-    for content in all_contents:
-        # Check item_content for used properties
-        if content.item_content:
-            used_property_ids.update(content.item_content)
+    if is_batch_ref(value):
+        created_property = refs.get(value[1:])
+        if not created_property:
+            raise HTTPException(status_code=400, detail=f"Unknown reference: {value}")
+        return getattr(created_property, attribute)
 
-        # Check list_item_content (list of lists) for used properties
-        if content.list_item_content:
-            for item_list in content.list_item_content:
-                used_property_ids.update(item_list)
+    return parse_batch_id(value)
 
-    # Log used property ids for debugging
-    logging.info(f"Used property ids: {used_property_ids}")
+def get_batch_owner(db: Session, operations: List[ContentBatchOperation]) -> UUID:
+    # Autorizace celé dávky dvěma dotazy, všechno musí patřit jednomu uživateli
+    content_ids = {parse_batch_id(op.content_id) for op in operations if op.content_id is not None and not is_batch_ref(op.content_id)}
+    content_ids.update(op.root_id for op in operations if op.root_id)
+    property_ids = {parse_batch_id(op.property_id) for op in operations if op.property_id is not None and not is_batch_ref(op.property_id)}
 
-    # Find unused properties (those not in used_property_ids)
-    unused_properties = [prop for prop in properties if prop.id not in used_property_ids]
+    content_owners = db.query(Content.id, Content.user_id).filter(Content.id.in_(content_ids)).all() if content_ids else []
+    property_owners = db.query(ContentItemProperty.id, ContentItemProperty.user_id).filter(ContentItemProperty.id.in_(property_ids)).all() if property_ids else []
 
-    # Log unused properties for debugging
-    logging.info(f"Unused properties: {unused_properties}")
+    if len(content_owners) != len(content_ids) or len(property_owners) != len(property_ids):
+        raise HTTPException(status_code=404, detail="Content not found")
 
-    # Delete unused properties
-    for prop in unused_properties:
-        logging.info(f"Deleting unused property: {prop.id}")
-        db.delete(prop)
+    owners = {owner_id for _, owner_id in content_owners + property_owners}
+    if len(owners) != 1:
+        raise HTTPException(status_code=400, detail="Batch must target content of exactly one user")
+
+    return owners.pop()
+
+def apply_content_operation(db: Session, operation: ContentBatchOperation, refs: dict):
+    content_id = resolve_batch_id(operation.content_id, refs, "content_id")
+    property_id = resolve_batch_id(operation.property_id, refs, "id")
+
+    if operation.op == "update_property":
+        prop = db.get(ContentItemProperty, property_id) if property_id else None
+        if not prop:
+            return None, 404, None
+        if operation.key is None:
+            return None, 400, None
+
+        prop.key = operation.key
+        return prop, 200, prop.root_content_id
+
+    db_content = db.get(Content, content_id) if content_id else None
+    if not db_content:
+        return None, 404, None
+
+    root_id = content_root_id(db_content)
+
+    if operation.op == "update_content":
+        if operation.content is None:
+            return None, 400, root_id
+        result, status = apply_update_content(db, db_content, operation.content.dict(exclude_unset=True))
+
+    elif operation.op == "create_property":
+        result, status = apply_create_item_property(db, db_content, operation.root_id or root_id)
+
+    elif operation.op == "delete_property":
+        if not property_id:
+            return None, 400, root_id
+        result, status = apply_delete_property(db, db_content, property_id)
+
+    elif operation.op == "create_list_item":
+        result, status = apply_create_empty_list_item(db, db_content)
+
+    elif operation.op == "add_list_item_property":
+        if operation.index is None:
+            return None, 400, root_id
+        result, status = apply_add_list_item_property(db, db_content, operation.index, operation.root_id or root_id)
+
+    elif operation.op == "delete_list_item":
+        if operation.index is None:
+            return None, 400, root_id
+        result, status = apply_delete_list_item(db, db_content, operation.index)
+
+    elif operation.op == "reorder_list_item_content":
+        if operation.new_order is None:
+            return None, 400, root_id
+        result, status = apply_reorder_list_item_content(db, db_content, operation.new_order)
+
+    return result, status, root_id
+
+def apply_content_batch(db: Session, operations: List[ContentBatchOperation]):
+    # Operace jdou popořadě v jedné transakci, při chybě se nic nezapíše (rollback při zavření session)
+    refs = {}
+    results = []
+    touched_roots = set()
 
-        # Check if the content associated with this property is also unused and can be deleted
-        if prop.content_id:
-            related_content = db.query(Content).filter(Content.id == prop.content_id).first()
-            if related_content:
-                # Check if any other properties reference this content
-                other_properties_referencing_content = db.query(ContentItemProperty).filter(
-                    ContentItemProperty.content_id == related_content.id
-                ).count()
+    for position, operation in enumerate(operations):
+        result, status, root_id = apply_content_operation(db, operation, refs)
 
-                if other_properties_referencing_content == 0 and not related_content.is_root:
-                    logging.info(f"Deleting related content: {related_content.id}")
-                    db.delete(related_content)
+        if status >= 400:
+            raise HTTPException(status_code=status, detail=f"Operation {position} ({operation.op}) failed")
 
-    # Identify used content IDs by checking if any property refers to its content_id
-    used_content_ids = set([prop.content_id for prop in properties if prop.content_id is not None])
+        if isinstance(result, ContentItemProperty):
+            if operation.ref:
+                refs[operation.ref] = result
+            results.append({"op": operation.op, "ref": operation.ref, "property_id": result.id, "content_id": result.content_id})
+        else:
+            results.append({"op": operation.op, "ref": operation.ref, "property_id": None, "content_id": result.id if result else None})
 
-    # Log used content ids for debugging
-    logging.info(f"Used content ids: {used_content_ids}")
+        touched_roots.add(root_id)
 
-    # Find unused contents (no property refers to their content_id and they are not the root)
-    unused_contents = [content for content in contents if content.id not in used_content_ids and not content.is_root]
+        # Další operace musí vidět změny předchozích, hromadné UPDATE/DELETE jdou mimo session
+        db.flush()
 
-    # Log unused contents for debugging
-    logging.info(f"Unused contents: {unused_contents}")
+    has_deletes = any(operation.op in ("delete_property", "delete_list_item") for operation in operations)
+    if has_deletes:
+        for root_id in touched_roots:
+            schedule_unused_content_gc(db, root_id)
 
-    # Delete unused contents
-    for content in unused_contents:
-        logging.info(f"Deleting unused content: {content.id}")
-        db.delete(content)
+    db.commit()
+
+    for root_id in touched_roots:
+        invalidate_public_content(root_id)
+
+    return results
 
-    # Commit the changes to the database
+def delete_unused_properties_and_contents(db: Session, root_content_id: UUID):
+    # Set-based GC jen nad podstromem jednoho rootu přes content_reference, maže po dávkách
+    # až do ustálení, smazaný content uvolní své property a ty zase svůj content
+    created_before = datetime.now(timezone.utc) - timedelta(seconds=CMS_GC_GRACE_SECONDS)
+    deleted_properties = 0
+    deleted_contents = 0
+
+    while True:
+        unused_property_ids = [row[0] for row in db.execute(UNUSED_PROPERTIES_QUERY, {
+            "root_id": root_content_id,
+            "created_before": created_before,
+            "batch_size": CMS_GC_BATCH_SIZE,
+        })]
+
+        if unused_property_ids:
+            db.query(ContentItemProperty)\
+                .filter(ContentItemProperty.id.in_(unused_property_ids))\
+                .delete(synchronize_session=False)
+            db.commit()
+            deleted_properties += len(unused_property_ids)
+
+        unused_content_ids = [row[0] for row in db.query(Content.id).filter(
+            Content.root_content_id == root_content_id,
+            Content.is_root == False,
+            Content.created_at < created_before,
+            ~exists().where(ContentItemProperty.content_id == Content.id)
+        ).limit(CMS_GC_BATCH_SIZE).all()]
+
+        if unused_content_ids:
+            db.query(Content)\
+                .filter(Content.id.in_(unused_content_ids))\
+                .delete(synchronize_session=False)
+            delete_content_references(db, unused_content_ids)
+            db.commit()
+            deleted_contents += len(unused_content_ids)
+
+        if not unused_property_ids and not unused_content_ids:
+            break
+
+    logging.info(f"CMS GC for root {root_content_id}: deleted {deleted_properties} properties, {deleted_contents} contents")
+
+    # Uzly mladší než grace (např. přidání a hned undo) počkají na další běh, jinak by zůstaly viset
+    youngest = db.execute(YOUNGEST_UNUSED_NODE_QUERY, {"root_id": root_content_id, "created_before": created_before}).scalar()
+
+    return youngest + timedelta(seconds=CMS_GC_GRACE_SECONDS) if youngest else None
+
+def schedule_unused_content_gc(db: Session, root_content_id: UUID, due_at: datetime = None):
+    # Úklid běží na pozadí v collect_unused_contents, editor na něj nečeká; zapisuje se ve transakci volajícího
+    if not root_content_id:
+        return
+
+    statement = insert(ContentGcRoot).values(root_content_id=root_content_id, due_at=due_at or datetime.now(timezone.utc))
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[ContentGcRoot.root_content_id],
+        set_={"due_at": func.least(ContentGcRoot.due_at, statement.excluded.due_at)}
+    ))
+
+def claim_unused_content_gc_roots(db: Session, leased_until: datetime) -> list:
+    # Posunutím due_at si root převezme jeden worker, SKIP LOCKED rozdělí roots mezi workery
+    due_roots = select(ContentGcRoot.root_content_id)\
+        .where(ContentGcRoot.due_at <= datetime.now(timezone.utc))\
+        .order_by(ContentGcRoot.due_at)\
+        .limit(CMS_GC_MAX_ROOTS_PER_RUN)\
+        .with_for_update(skip_locked=True)
+
+    root_ids = db.execute(
+        update(ContentGcRoot)
+        .where(ContentGcRoot.root_content_id.in_(due_roots.scalar_subquery()))
+        .values(due_at=leased_until)
+        .returning(ContentGcRoot.root_content_id)
+    ).scalars().all()
     db.commit()
 
-    return {"detail": "Unused properties and contents deleted successfully"}
+    return root_ids
+
+def release_unused_content_gc_root(db: Session, root_content_id: UUID, leased_until: datetime, next_due_at: datetime = None):
+    # Změněné due_at znamená nové naplánování během úklidu, takový záznam necháme být
+    leased = and_(ContentGcRoot.root_content_id == root_content_id, ContentGcRoot.due_at == leased_until)
+
+    if next_due_at:
+        db.execute(update(ContentGcRoot).where(leased).values(due_at=next_due_at))
+    else:
+        db.execute(delete(ContentGcRoot).where(leased))
+    db.commit()
+
+def collect_unused_contents(db: Session):
+    if not is_content_reference_backfill_completed(db):
+        return
+
+    leased_until = datetime.now(timezone.utc) + timedelta(seconds=CMS_GC_LEASE_SECONDS)
+
+    for root_id in claim_unused_content_gc_roots(db, leased_until):
+        try:
+            next_due_at = delete_unused_properties_and_contents(db, root_id)
+            release_unused_content_gc_root(db, root_id, leased_until, next_due_at)
+        except Exception as e:
+            # Root zůstane převzatý do konce leasu, pak ho zkusí další běh
+            db.rollback()
+            logging.error(f"CMS GC for root {root_id} failed: {e}")
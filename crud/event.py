@@ -6,7 +6,7 @@ from schemas.event import FormResponseEventManageSchema
 from uuid import UUID, uuid4
 from fastapi import HTTPException
 from crud.user import get_user
-from utils.security import rsa_encrypt_data, rsa_decrypt_data
+from utils.security import rsa_encrypt_data, rsa_decrypt_data, decrypt_in_parallel
 from models.event import Event
 from datetime import datetime
 import json
@@ -167,9 +167,9 @@ def get_event_by_id(db: Session, event_id: UUID, private_key: str):
 def get_events_by_response_id(db: Session, response_id: UUID, private_key: str):
     events = db.query(Event).filter(Event.response_id == response_id).all()
     
-    return [decrypt_event_data(event, private_key) for event in events]
+    return decrypt_in_parallel(lambda event: decrypt_event_data(event, private_key), events)
 
 def get_events_by_user_id(db: Session, user_id: UUID, private_key: str):
     events = db.query(Event).filter(Event.user_id == user_id).all()
     
-    return [decrypt_event_data(event, private_key) for event in events]
+    return decrypt_in_parallel(lambda event: decrypt_event_data(event, private_key), events)
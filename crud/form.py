@@ -1,13 +1,20 @@
 # crud/form.py
 
 from sqlalchemy.orm import Session, joinedload, join
-from models.form import Form, FormProperty, FormResponse, FormValue
+from models.form import Form, FormProperty, FormResponse, FormValue, FormResponseSearchToken
 from schemas.form import CreateForm, UpdateForm, FormResponseMessageCreate, FormResponseMessageUpdate
 from uuid import UUID, uuid4
 from fastapi import HTTPException
 from crud.user import get_user
-from utils.security import rsa_encrypt_data, rsa_decrypt_data
+from utils.security import rsa_encrypt_data, rsa_decrypt_data, generate_data_key, wrap_data_key, unwrap_data_key, aes_encrypt_data, decrypt_value, decrypt_in_parallel
 from models.form import FormResponseMessage
+from utils.search import index_tokens, query_tokens
+from sqlalchemy import func, tuple_, insert, select
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+import threading
+from collections import OrderedDict
+from utils.ingest import ingest_queue, FORM_INGEST_BATCH_SIZE
+from utils.email import send_business_improvement_tip_email, send_extra_tip_video_email, send_form_for_our_services
 import ast
 from datetime import datetime, timezone
 import time
@@ -25,6 +32,17 @@ SFTP_USERNAME = os.getenv("SFTP_USERNAME")
 SFTP_PASSWORD = os.getenv("SFTP_PASSWORD")
 SFTP_UPLOAD_DIR = os.getenv("SFTP_UPLOAD_DIR")
 
+RESPONSE_COUNT_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_COUNT_CACHE_TTL_SECONDS", "60"))
+RESPONSE_COUNT_CACHE_MAX_SIZE = int(os.getenv("RESPONSE_COUNT_CACHE_MAX_SIZE", "10000"))
+
+FORM_METADATA_CACHE_TTL_SECONDS = int(os.getenv("FORM_METADATA_CACHE_TTL_SECONDS", "60"))
+
+_response_count_cache = OrderedDict()
+_response_count_cache_lock = threading.Lock()
+
+_form_metadata_cache = {}
+_form_metadata_cache_lock = threading.Lock()
+
 def validate_iso_format(date_str):
     try:
         return datetime.fromisoformat(date_str)
@@ -53,6 +71,14 @@ def get_form(db: Session, form_id: UUID):
 
     return form
 
+def get_form_version(db: Session, form_id: UUID):
+    # Levný dotaz na verzi formuláře pro ETag, smazání property mění počet
+    return db.query(Form.updated_at, Form.user_id, func.max(FormProperty.updated_at), func.count(FormProperty.id))\
+        .outerjoin(FormProperty, FormProperty.form_id == Form.id)\
+        .filter(Form.id == form_id)\
+        .group_by(Form.id)\
+        .first()
+
 def get_property(db: Session, property_id: UUID):
     prop = db.query(FormProperty).filter(FormProperty.id == property_id).first()
 
@@ -61,6 +87,44 @@ def get_property(db: Session, property_id: UUID):
 
     return prop, 200
 
+def build_form_metadata(form: Form, user):
+    # Vše, co veřejný create-response potřebuje k ověření originu a povinných klíčů
+    return {
+        "user_id": form.user_id,
+        "web_url": user.web_url if user else None,
+        "required_keys": [prop.key for prop in form.properties if prop.required],
+    }
+
+def get_cached_form_metadata(form_id: UUID):
+    with _form_metadata_cache_lock:
+        entry = _form_metadata_cache.get(form_id)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+
+    return None
+
+def cache_form_metadata(form_id: UUID, metadata: dict):
+    with _form_metadata_cache_lock:
+        _form_metadata_cache[form_id] = (metadata, time.monotonic() + FORM_METADATA_CACHE_TTL_SECONDS)
+
+def get_form_metadata(db: Session, form_id: UUID):
+    metadata = get_cached_form_metadata(form_id)
+    if metadata:
+        return metadata
+
+    form = get_form(db, form_id)
+    if not form:
+        return None
+
+    metadata = build_form_metadata(form, get_user(db, form.user_id))
+    cache_form_metadata(form_id, metadata)
+
+    return metadata
+
+def invalidate_form_metadata(form_id: UUID):
+    with _form_metadata_cache_lock:
+        _form_metadata_cache.pop(form_id, None)
+
 def update_form(db: Session, form_id: UUID, update_data: UpdateForm):
     form = db.query(Form).filter(Form.id == form_id).first()
 
@@ -105,6 +169,8 @@ def update_form(db: Session, form_id: UUID, update_data: UpdateForm):
     db.commit()
     db.refresh(form)
 
+    invalidate_form_metadata(form_id)
+
     return form
 
 def delete_form(db: Session, form_id: UUID):
@@ -116,10 +182,14 @@ def delete_form(db: Session, form_id: UUID):
     db.query(FormProperty).filter(FormProperty.form_id == form_id).delete()
     db.query(FormResponse).filter(FormResponse.form_id == form_id).delete()
     db.query(FormValue).filter(FormValue.form_id == form_id).delete()
+    db.query(FormResponseSearchToken).filter(FormResponseSearchToken.form_id == form_id).delete()
 
     db.delete(form)
     db.commit()
 
+    invalidate_response_counts(form_id, form.user_id)
+    invalidate_form_metadata(form_id)
+
     return form
 
 def get_users_form_menu(db: Session, user_id: UUID):
@@ -138,61 +208,164 @@ def get_users_form_menu(db: Session, user_id: UUID):
 
     return forms
 
-def create_response(db: Session, form_id: UUID, data: dict):
-    form = db.query(Form).options(joinedload(Form.properties)).filter(Form.id == form_id).first()
-    user = get_user(db, form.user_id)
+# Soubory se neindexují, ostatní typy jsou text nebo jeho serializace
+SEARCHABLE_PROPERTY_TYPES = {
+    "short_text",
+    "long_text",
+    "string_array",
+    "radio",
+    "checkbox",
+    "selection",
+    "date_time",
+    "time",
+}
+
+def build_search_tokens(response: FormResponse, tokens: set):
+    return [
+        {
+            "id": uuid4(),
+            "user_id": response.user_id,
+            "form_id": response.form_id,
+            "response_id": response.id,
+            "token": token
+        }
+        for token in tokens
+    ]
+
+def search_response_ids(user_id: UUID, search_query: str, form_id: UUID = None):
+    tokens = query_tokens(user_id, search_query)
+
+    if not tokens:
+        return None
 
-    if not form:
-        raise HTTPException(status_code=404, detail="Form not found")
+    # Odpověď musí obsahovat všechna hledaná slova, vrací select použitelný v sync i async dotazu
+    statement = select(FormResponseSearchToken.response_id)\
+        .where(FormResponseSearchToken.user_id == user_id, FormResponseSearchToken.token.in_(tokens))
+
+    if form_id:
+        statement = statement.where(FormResponseSearchToken.form_id == form_id)
 
+    return statement\
+        .group_by(FormResponseSearchToken.response_id)\
+        .having(func.count(func.distinct(FormResponseSearchToken.token)) == len(tokens))
+
+def prepare_response(form: Form, user, data: dict, response_id: UUID = None):
     user_id = form.user_id
 
-    required_properties = {prop.key: prop for prop in form.properties if prop.required}
-    missing_keys = [key for key in required_properties.keys() if key not in data.keys()]
+    properties_by_key = {prop.key: prop for prop in form.properties}
+    missing_keys = [prop.key for prop in form.properties if prop.required and prop.key not in data]
 
     if missing_keys:
         raise HTTPException(status_code=400, detail=f"Missing required keys: {', '.join(missing_keys)}")
 
-    response_id = uuid4()
+    data_key = generate_data_key()
+    response_id = response_id or uuid4()
+
+    form_values = []
+    search_tokens = set()
+    for key, value in data.items():
+        prop = properties_by_key.get(key)
+        if not prop:
+            continue
+
+        value_str = str(value)
+
+        form_values.append({
+            "id": uuid4(),
+            "user_id": user_id,
+            "form_id": form.id,
+            "property_id": prop.id,
+            "response_id": response_id,
+            "property_key": key,
+            "property_type": prop.property_type,
+            "value": aes_encrypt_data(value_str, data_key)
+        })
+
+        if prop.property_type in SEARCHABLE_PROPERTY_TYPES:
+            search_tokens.update(index_tokens(user_id, value_str))
+
     new_response = FormResponse(
         id=response_id,
         user_id=user_id,
-        form_id=form_id,
-        form_values_ids=[],
+        form_id=form.id,
+        form_values_ids=[form_value["id"] for form_value in form_values],
         labels=[],
         seen=False,
+        data_key=wrap_data_key(data_key, user.public_key),
     )
-    db.add(new_response)
-    db.commit()
 
-    form_value_ids = []
-    for key, value in data.items():
-        prop = next((p for p in form.properties if p.key == key), None)
-        if not prop:
-            continue
+    return new_response, form_values, build_search_tokens(new_response, search_tokens)
 
-        value_str = str(value)
-        
-        form_value = FormValue(
-            id=uuid4(),
-            user_id=user_id,
-            form_id=form_id,
-            property_id=prop.id,
-            response_id=response_id,
-            property_key=key,
-            property_type=prop.property_type,
-            value=rsa_encrypt_data(value_str, user.public_key)
-        )
+def create_response(db: Session, form_id: UUID, data: dict, response_id: UUID = None):
+    form = db.query(Form).options(joinedload(Form.properties)).filter(Form.id == form_id).first()
 
-        db.add(form_value)
-        db.commit()
-        form_value_ids.append(form_value.id)
+    if not form:
+        raise HTTPException(status_code=404, detail="Form not found")
+
+    new_response, form_values, token_rows = prepare_response(form, get_user(db, form.user_id), data, response_id)
+
+    # Odpověď, hodnoty i search tokeny v jedné transakci, hodnoty jedním multi-row INSERTem
+    db.add(new_response)
+    db.flush()
+
+    if form_values:
+        db.execute(insert(FormValue), form_values)
+
+    if token_rows:
+        db.execute(insert(FormResponseSearchToken), token_rows)
 
-    new_response.form_values_ids = form_value_ids
     db.commit()
 
+    invalidate_response_counts(form_id, form.user_id)
+
     return new_response.id
 
+def send_form_follow_up_emails(form_id: UUID, data: dict):
+    if str(form_id) == "2aa1a8f2-a82d-4d8f-94b4-dd97abce4981":
+        send_business_improvement_tip_email(data['email'])
+        send_extra_tip_video_email(data['email'])
+
+    if str(form_id) == "5893c160-908e-4f3e-ab51-5a574aa5da70":
+        send_form_for_our_services(data['email'])
+
+def drain_form_ingest_queue(db: Session):
+    processed = 0
+
+    while True:
+        batch = ingest_queue.claim_batch(FORM_INGEST_BATCH_SIZE)
+        if not batch:
+            break
+
+        for entry_id, form_id, data in batch:
+            try:
+                # ID odpovědi je ID položky fronty, po pádu před complete() se odpověď neuloží podruhé
+                if db.query(FormResponse.id).filter(FormResponse.id == UUID(entry_id)).first():
+                    ingest_queue.complete(entry_id, entry_id)
+                    continue
+
+                response_id = create_response(db, UUID(form_id), data, UUID(entry_id))
+                ingest_queue.complete(entry_id, response_id)
+                processed += 1
+            except HTTPException as e:
+                # Formulář mezitím zmizel nebo se změnily povinné klíče, opakování nepomůže
+                db.rollback()
+                ingest_queue.fail(entry_id, str(e.detail), retry=False)
+                continue
+            except Exception as e:
+                db.rollback()
+                logging.error(f"Error while ingesting form response {entry_id}: {e}")
+                ingest_queue.fail(entry_id, str(e))
+                continue
+
+            try:
+                send_form_follow_up_emails(form_id, data)
+            except Exception as e:
+                logging.error(f"Error sending follow-up emails for {entry_id}: {e}")
+
+    ingest_queue.prune()
+
+    return processed
+
 def delete_response(db: Session, response_id: UUID):
     response = db.query(FormResponse).filter(FormResponse.id == response_id).first()
 
@@ -200,10 +373,13 @@ def delete_response(db: Session, response_id: UUID):
         return None
 
     db.query(FormValue).filter(FormValue.response_id == response_id).delete()
+    db.query(FormResponseSearchToken).filter(FormResponseSearchToken.response_id == response_id).delete()
 
     db.delete(response)
     db.commit()
 
+    invalidate_response_counts(response.form_id, response.user_id)
+
     return response
 
 def get_plain_response(db: Session, response_id):
@@ -234,50 +410,72 @@ def update_response(db: Session, response_id: UUID, response_update: dict):
     
     return response
 
-def get_response_by_id(db: Session, response_id: UUID, private_key: str):
-    response = db.query(FormResponse).options(joinedload(FormResponse.form)).filter(FormResponse.id == response_id).first()
+def deserialize_form_value(property_type: str, decrypted_value: str):
+    # Deserializace na základě typu property
+    if property_type == "boolean":
+        return decrypted_value.lower() == 'true'
+    elif property_type == "checkbox":
+        try:
+            return ast.literal_eval(decrypted_value)  # Deserializace na seznam
+        except (ValueError, SyntaxError) as e:
+            return decrypted_value.split(',')  # Fallback metoda
+    elif property_type == "file":
+        try:
+            return ast.literal_eval(decrypted_value)  # Deserializace na seznam
+        except (ValueError, SyntaxError) as e:
+            return decrypted_value.strip("[]").replace('"', '').split(',')  # Fallback metoda
+    elif property_type == "date_time":
+        return datetime.fromisoformat(decrypted_value)
+    elif property_type == "time":
+        try:
+            return datetime.strptime(decrypted_value, "%H:%M:%S").time()
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid time format: {decrypted_value}")
+
+    return decrypted_value
+
+def decrypt_responses(responses: list, form_values: list, private_key: str):
+    values_by_response = {}
+    for form_value in form_values:
+        values_by_response.setdefault(form_value.response_id, []).append(form_value)
+
+    def decrypt_response(response):
+        # Jeden RSA unwrap na odpověď, hodnoty jsou pak šifrované AES klíčem
+        data_key = unwrap_data_key(response.data_key, private_key) if response.data_key else None
+
+        value_order = {value_id: index for index, value_id in enumerate(response.form_values_ids or [])}
+        response_values = sorted(
+            values_by_response.get(response.id, []),
+            key=lambda v: value_order.get(v.id, len(value_order))
+        )
 
-    if not response:
-        raise HTTPException(status_code=404, detail="Response not found")
+        decrypted_data = {}
+        for form_value in response_values:
+            decrypted_value = decrypt_value(form_value.value, private_key, data_key)
+            decrypted_data[form_value.property_key] = deserialize_form_value(form_value.property_type, decrypted_value)
 
-    form = response.form
-    user = get_user(db, response.user_id)
+        return decrypted_data
 
-    decrypted_data = {}
-    for form_value_id in response.form_values_ids:
-        form_value = db.query(FormValue).filter(FormValue.id == form_value_id).first()
-        if not form_value:
-            continue
+    decrypted = decrypt_in_parallel(decrypt_response, responses)
 
-        # Dešifrování
-        decrypted_value = rsa_decrypt_data(form_value.value, private_key)
+    return {response.id: decrypted_data for response, decrypted_data in zip(responses, decrypted)}
 
-        # Deserializace na základě typu property
-        if form_value.property_type == "boolean":
-            decrypted_value = decrypted_value.lower() == 'true'
-        elif form_value.property_type == "checkbox":
-            try:
-                decrypted_value = ast.literal_eval(decrypted_value)  # Deserializace na seznam
-            except (ValueError, SyntaxError) as e:
-                decrypted_value = decrypted_value.split(',')  # Fallback metoda
-        elif form_value.property_type == "file":
-            try:
-                decrypted_value = ast.literal_eval(decrypted_value)  # Deserializace na seznam
-            except (ValueError, SyntaxError) as e:
-                decrypted_value = decrypted_value.strip("[]").replace('"', '').split(',')  # Fallback metoda
-        elif form_value.property_type == "date_time":
-            decrypted_value = datetime.fromisoformat(decrypted_value)
-        elif form_value.property_type == "time":
-            try:
-                decrypted_value = datetime.strptime(decrypted_value, "%H:%M:%S").time()
-            except ValueError:
-                raise HTTPException(status_code=400, detail=f"Invalid time format: {decrypted_value}")
-        else:
-            decrypted_value = decrypted_value
+def get_decrypted_responses(db: Session, responses: list, private_key: str):
+    if not responses:
+        return {}
+
+    # Všechny hodnoty celé stránky jedním IN dotazem
+    form_values = db.query(FormValue).filter(FormValue.response_id.in_([r.id for r in responses])).all()
 
-        decrypted_data[form_value.property_key] = decrypted_value
+    return decrypt_responses(responses, form_values, private_key)
 
-    return decrypted_data
+def get_response_by_id(db: Session, response_id: UUID, private_key: str):
+    response = db.query(FormResponse).filter(FormResponse.id == response_id).first()
+
+    if not response:
+        raise HTTPException(status_code=404, detail="Response not found")
+
+    return get_decrypted_responses(db, [response], private_key)[response.id]
 
 def create_form_response_message(db: Session, message_data: FormResponseMessageCreate):
     user = get_user(db, message_data.user_id)
@@ -320,6 +518,114 @@ def delete_all_responses_from_form(db: Session, form_id: UUID):
         return None
 
     db.query(FormResponse).filter(FormResponse.form_id == form_id).delete()
+    db.query(FormResponseSearchToken).filter(FormResponseSearchToken.form_id == form_id).delete()
+    db.commit()
+
+    invalidate_response_counts(form_id, form.user_id)
+
+    return form
+
+def reindex_form_responses(db: Session, form_id: UUID, private_key: str):
+    # Odpovědi vytvořené před zavedením indexu, přeindexovat jde jen s privátním klíčem
+    responses = db.query(FormResponse).filter(FormResponse.form_id == form_id).all()
+    form_values = db.query(FormValue).filter(FormValue.form_id == form_id).all()
+
+    values_by_response = {}
+    for form_value in form_values:
+        if form_value.property_type in SEARCHABLE_PROPERTY_TYPES:
+            values_by_response.setdefault(form_value.response_id, []).append(form_value)
+
+    def tokenize_response(response):
+        data_key = unwrap_data_key(response.data_key, private_key) if response.data_key else None
+        tokens = set()
+        for form_value in values_by_response.get(response.id, []):
+            tokens.update(index_tokens(response.user_id, decrypt_value(form_value.value, private_key, data_key)))
+        return tokens
+
+    response_tokens = decrypt_in_parallel(tokenize_response, responses)
+
+    db.query(FormResponseSearchToken).filter(FormResponseSearchToken.form_id == form_id).delete()
+
+    token_rows = [row for response, tokens in zip(responses, response_tokens) for row in build_search_tokens(response, tokens)]
+    if token_rows:
+        db.execute(insert(FormResponseSearchToken), token_rows)
+
     db.commit()
 
-    return form
\ No newline at end of file
+    return len(responses)
+
+def encode_response_cursor(response: FormResponse) -> str:
+    payload = json.dumps({"created_at": response.created_at.isoformat(), "id": str(response.id)})
+    return urlsafe_b64encode(payload.encode()).decode()
+
+def decode_response_cursor(cursor: str):
+    try:
+        payload = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+        return datetime.fromisoformat(payload["created_at"]), UUID(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def apply_response_cursor(query, cursor: str, sort_order: str):
+    # Keyset stránkování přes (created_at, id), prázdný cursor znamená první stránku
+    # Funguje nad Query i nad select(), obojí má filter a order_by
+    ascending = sort_order == "asc"
+
+    if cursor:
+        created_at, response_id = decode_response_cursor(cursor)
+        position = tuple_(FormResponse.created_at, FormResponse.id)
+        query = query.filter(position > (created_at, response_id) if ascending else position < (created_at, response_id))
+
+    if ascending:
+        return query.order_by(FormResponse.created_at.asc(), FormResponse.id.asc())
+
+    return query.order_by(FormResponse.created_at.desc(), FormResponse.id.desc())
+
+def split_cursor_page(responses: list, per_page: int):
+    # Načítá se per_page + 1 řádků, přebývající řádek znamená další stránku
+    next_cursor = encode_response_cursor(responses[per_page - 1]) if len(responses) > per_page else None
+    return responses[:per_page], next_cursor
+
+def paginate_responses_by_cursor(query, cursor: str, per_page: int, sort_order: str):
+    responses = apply_response_cursor(query, cursor, sort_order).limit(per_page + 1).all()
+    return split_cursor_page(responses, per_page)
+
+def get_cached_response_count(cache_key: tuple):
+    with _response_count_cache_lock:
+        entry = _response_count_cache.get(cache_key)
+        if entry and entry[1] > time.monotonic():
+            _response_count_cache.move_to_end(cache_key)
+            return entry[0]
+        if entry:
+            del _response_count_cache[cache_key]
+
+    return None
+
+def cache_response_count(cache_key: tuple, total: int):
+    now = time.monotonic()
+
+    with _response_count_cache_lock:
+        _response_count_cache[cache_key] = (total, now + RESPONSE_COUNT_CACHE_TTL_SECONDS)
+        _response_count_cache.move_to_end(cache_key)
+
+        # Nejdéle nepoužité záznamy jsou na začátku, prošlé odtud odmažeme a pak ořízneme na maximální velikost
+        while _response_count_cache:
+            oldest_key, (_, expires_at) = next(iter(_response_count_cache.items()))
+            if expires_at > now and len(_response_count_cache) <= RESPONSE_COUNT_CACHE_MAX_SIZE:
+                break
+            del _response_count_cache[oldest_key]
+
+def count_responses_cached(query, cache_key: tuple) -> int:
+    total = get_cached_response_count(cache_key)
+    if total is not None:
+        return total
+
+    total = query.order_by(None).count()
+    cache_response_count(cache_key, total)
+
+    return total
+
+def invalidate_response_counts(*owners):
+    # Klíče cache začínají form_id nebo user_id, kterého se počet týká
+    with _response_count_cache_lock:
+        for cache_key in [key for key in _response_count_cache if key[0] in owners]:
+            del _response_count_cache[cache_key]
@@ -0,0 +1,116 @@
+# crud/form_async.py
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select, func, insert
+from models.form import Form, FormProperty, FormResponse, FormValue, FormResponseSearchToken
+from models.user import User
+from uuid import UUID
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from crud.form import build_form_metadata, get_cached_form_metadata, cache_form_metadata, prepare_response, decrypt_responses, apply_response_cursor, split_cursor_page, get_cached_response_count, cache_response_count, invalidate_response_counts
+
+# Async varianty dotazů pro veřejné a tabulkové endpointy, sdílí logiku s crud/form.py
+
+async def get_user(db: AsyncSession, user_id: UUID):
+    return await db.get(User, user_id)
+
+async def get_form(db: AsyncSession, form_id: UUID):
+    result = await db.execute(select(Form).options(selectinload(Form.properties)).where(Form.id == form_id))
+    form = result.scalars().first()
+
+    if form:
+        form.properties = sorted(form.properties, key=lambda prop: prop.position)
+
+    return form
+
+async def get_users_forms(db: AsyncSession, user_id: UUID):
+    result = await db.execute(select(Form).options(selectinload(Form.properties)).where(Form.user_id == user_id))
+    return result.scalars().all()
+
+async def get_property(db: AsyncSession, property_id: UUID):
+    prop = await db.get(FormProperty, property_id)
+
+    if not prop:
+        return None, 404
+
+    return prop, 200
+
+async def get_property_options_version(db: AsyncSession, property_id: UUID):
+    # Vše pro kontrolu originu a ETag jedním dotazem, bez načítání property a formuláře
+    result = await db.execute(
+        select(User.id, User.web_url, FormProperty.updated_at, Form.updated_at)
+        .select_from(FormProperty)
+        .join(Form, Form.id == FormProperty.form_id)
+        .join(User, User.id == Form.user_id)
+        .where(FormProperty.id == property_id)
+    )
+    return result.first()
+
+async def get_form_metadata(db: AsyncSession, form_id: UUID):
+    metadata = get_cached_form_metadata(form_id)
+    if metadata:
+        return metadata
+
+    form = await get_form(db, form_id)
+    if not form:
+        return None
+
+    metadata = build_form_metadata(form, await get_user(db, form.user_id))
+    cache_form_metadata(form_id, metadata)
+
+    return metadata
+
+async def create_response(db: AsyncSession, form_id: UUID, data: dict, response_id: UUID = None):
+    form = await get_form(db, form_id)
+
+    if not form:
+        raise HTTPException(status_code=404, detail="Form not found")
+
+    new_response, form_values, token_rows = prepare_response(form, await get_user(db, form.user_id), data, response_id)
+
+    db.add(new_response)
+    await db.flush()
+
+    if form_values:
+        await db.execute(insert(FormValue), form_values)
+
+    if token_rows:
+        await db.execute(insert(FormResponseSearchToken), token_rows)
+
+    await db.commit()
+
+    invalidate_response_counts(form_id, form.user_id)
+
+    return new_response.id
+
+async def count_responses_cached(db: AsyncSession, statement, cache_key: tuple) -> int:
+    total = get_cached_response_count(cache_key)
+    if total is not None:
+        return total
+
+    result = await db.execute(select(func.count()).select_from(statement.order_by(None).subquery()))
+    total = result.scalar_one()
+    cache_response_count(cache_key, total)
+
+    return total
+
+async def paginate_responses(db: AsyncSession, statement, page: int, per_page: int, sort_by: str, sort_order: str, cursor: str = None):
+    if cursor is not None:
+        result = await db.execute(apply_response_cursor(statement, cursor, sort_order).limit(per_page + 1))
+        return split_cursor_page(result.scalars().all(), per_page)
+
+    if sort_by == "created_at":
+        statement = statement.order_by(FormResponse.created_at.asc() if sort_order == "asc" else FormResponse.created_at.desc())
+
+    result = await db.execute(statement.offset((page - 1) * per_page).limit(per_page))
+    return result.scalars().all(), None
+
+async def get_decrypted_responses(db: AsyncSession, responses: list, private_key: str):
+    if not responses:
+        return {}
+
+    result = await db.execute(select(FormValue).where(FormValue.response_id.in_([r.id for r in responses])))
+
+    # Dešifrování je CPU práce, event loop mezitím obsluhuje další requesty
+    return await run_in_threadpool(decrypt_responses, responses, result.scalars().all(), private_key)
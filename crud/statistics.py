@@ -1,11 +1,41 @@
 # crud/statistics.py
 
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models.statistics import Statistic, StatisticValue
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, select, update, delete, literal, literal_column, text, true, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from models.statistics import Statistic, StatisticValue, StatisticRollup, StatisticPurge, StatisticFlushedJournal
+from models.user import User
 from schemas.statistics import StatisticCreate, StatisticUpdate, StatisticValueCreate
+from crud.form import encode_response_cursor, decode_response_cursor
+from utils.statistics_buffer import statistic_buffer, make_statistic_event, rollup_increments, stores_raw_value, truncate_to_bucket, ROLLUP_BUCKETS, ROLLUP_FIELDS
+from fastapi import HTTPException
+from datetime import datetime, timedelta, timezone
 from uuid import UUID
+from dotenv import load_dotenv
+import os
+import time
 import uuid
+import logging
+import threading
+
+load_dotenv()
+
+STATISTIC_METADATA_CACHE_TTL_SECONDS = int(os.getenv("STATISTIC_METADATA_CACHE_TTL_SECONDS", "60"))
+STATISTIC_ROLLUP_UPSERT_BATCH_SIZE = 1000
+STATISTIC_ROLLUP_BACKFILL_LOCK = 7210519
+STATISTIC_SERIES_MAX_BUCKETS = int(os.getenv("STATISTIC_SERIES_MAX_BUCKETS", "2000"))
+STATISTIC_SUMMARY_VALUES_LIMIT = int(os.getenv("STATISTIC_SUMMARY_VALUES_LIMIT", "10"))
+STATISTIC_SUMMARY_MAX_VALUES_LIMIT = 100
+STATISTIC_PURGE_BATCH_SIZE = int(os.getenv("STATISTIC_PURGE_BATCH_SIZE", "5000"))
+STATISTIC_PURGE_SYNC_MAX_VALUES = int(os.getenv("STATISTIC_PURGE_SYNC_MAX_VALUES", "50000"))
+STATISTIC_PURGE_INTERVAL_SECONDS = int(os.getenv("STATISTIC_PURGE_INTERVAL_SECONDS", "10"))
+STATISTIC_FLUSHED_JOURNAL_RETENTION_DAYS = int(os.getenv("STATISTIC_FLUSHED_JOURNAL_RETENTION_DAYS", "30"))
+
+STATISTIC_SERIES_BUCKETS = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}
+STATISTIC_SERIES_DEFAULT_RANGES = {"hour": timedelta(days=2), "day": timedelta(days=30), "week": timedelta(weeks=26)}
+
+_statistic_metadata_cache = {}
+_statistic_metadata_cache_lock = threading.Lock()
 
 def create_statistic(db: Session, statistic: StatisticCreate, user_id: UUID):
     db_statistic = Statistic(
@@ -22,10 +52,10 @@ def create_statistic(db: Session, statistic: StatisticCreate, user_id: UUID):
     return db_statistic
 
 def get_statistic(db: Session, statistic_id: UUID):
-    return db.query(Statistic).filter(Statistic.id == statistic_id).first()
+    return db.query(Statistic).filter(Statistic.id == statistic_id, Statistic.deleted_at == None).first()
 
 def get_user_statistics(db: Session, user_id: UUID):
-    return db.query(Statistic).filter(Statistic.user_id == user_id).all()
+    return db.query(Statistic).filter(Statistic.user_id == user_id, Statistic.deleted_at == None).all()
 
 def update_statistic(db: Session, statistic_id: UUID, statistic_update: StatisticUpdate):
     db_statistic = get_statistic(db, statistic_id)
@@ -35,83 +65,465 @@ def update_statistic(db: Session, statistic_id: UUID, statistic_update: Statisti
         setattr(db_statistic, key, value)
     db.commit()
     db.refresh(db_statistic)
+    invalidate_statistic_metadata(statistic_id)
     return db_statistic
 
 def delete_statistic(db: Session, statistic_id: UUID):
-    db_statistic = get_statistic(db, statistic_id)
-    if db_statistic:
-        db.delete(db_statistic)
+    if not db.query(Statistic.id).filter(Statistic.id == statistic_id, Statistic.deleted_at == None).first():
+        return 404
+
+    if purge_in_background(db, [statistic_id]):
+        # Statistika zmizí z dotazů a přestane přijímat hodnoty ještě před odpovědí
+        db.query(Statistic).filter(Statistic.id == statistic_id).update({"deleted_at": func.now()}, synchronize_session=False)
+        schedule_statistic_purge(db, [statistic_id], delete_statistic=True)
+        invalidate_statistic_metadata(statistic_id)
+        return 202
+
+    # Hodnoty po dávkách, zbytek (rollupy, purge záznamy) smaže ON DELETE CASCADE
+    purge_statistic_values(db, [statistic_id])
+    db.query(Statistic).filter(Statistic.id == statistic_id).delete(synchronize_session=False)
+    db.commit()
+    invalidate_statistic_metadata(statistic_id)
+
+    return 200
+
+def get_statistic_metadata(db: Session, statistic_id: UUID):
+    with _statistic_metadata_cache_lock:
+        entry = _statistic_metadata_cache.get(statistic_id)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+
+    # Typ, vlastník a web_url pro kontrolu originu jedním dotazem
+    row = db.query(Statistic.type, User.id, User.web_url).outerjoin(User, User.id == Statistic.user_id).filter(Statistic.id == statistic_id, Statistic.deleted_at == None).first()
+    if not row:
+        return None
+
+    metadata = {"type": row[0], "user_id": row[1], "web_url": row[2]}
+
+    with _statistic_metadata_cache_lock:
+        _statistic_metadata_cache[statistic_id] = (metadata, time.monotonic() + STATISTIC_METADATA_CACHE_TTL_SECONDS)
+
+    return metadata
+
+def invalidate_statistic_metadata(statistic_id: UUID):
+    with _statistic_metadata_cache_lock:
+        _statistic_metadata_cache.pop(statistic_id, None)
+
+def bucket_start_expression(column, bucket: str):
+    # Buckety se počítají v UTC stejně jako v utils/statistics_buffer, literály kvůli shodě s GROUP BY
+    utc = literal_column("'UTC'")
+    return func.timezone(utc, func.date_trunc(literal_column(f"'{bucket}'"), func.timezone(utc, column)))
+
+def statistic_value_row(event: dict) -> dict:
+    return {
+        "id": UUID(event["id"]),
+        "statistic_id": UUID(event["statistic_id"]),
+        "created_at": datetime.fromisoformat(event["created_at"]),
+        "time": event["time"],
+        "number": event["number"],
+        "boolean": event["boolean"],
+        "text": event["text"],
+    }
+
+def statistic_value_event(db_value: StatisticValue) -> dict:
+    return {
+        "id": str(db_value.id),
+        "statistic_id": str(db_value.statistic_id),
+        "created_at": db_value.created_at.isoformat(),
+        "time": db_value.time.strftime("%H:%M:%S") if db_value.time else None,
+        "number": db_value.number,
+        "boolean": db_value.boolean,
+        "text": db_value.text,
+    }
+
+def upsert_statistic_rollups(db: Session, increments: dict):
+    # Seřazené klíče, aby souběžné flushe z více workerů nezamykaly řádky křížem
+    rows = [
+        {"statistic_id": UUID(str(statistic_id)), "bucket": bucket, "bucket_start": bucket_start, **dict(zip(ROLLUP_FIELDS, deltas))}
+        for (statistic_id, bucket, bucket_start), deltas in sorted(increments.items())
+    ]
+
+    for start in range(0, len(rows), STATISTIC_ROLLUP_UPSERT_BATCH_SIZE):
+        statement = insert(StatisticRollup).values(rows[start:start + STATISTIC_ROLLUP_UPSERT_BATCH_SIZE])
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[StatisticRollup.statistic_id, StatisticRollup.bucket, StatisticRollup.bucket_start],
+            set_={field: getattr(StatisticRollup, field) + getattr(statement.excluded, field) for field in ROLLUP_FIELDS}
+        ))
+
+def insert_statistic_values(db: Session, events: list):
+    # Po pádu mezi commitem a smazáním journalu se hodnoty přehrají znovu, duplicitní id přeskočíme
+    rows = [statistic_value_row(event) for event in events]
+    if rows:
+        db.execute(insert(StatisticValue).on_conflict_do_nothing(index_elements=[StatisticValue.id]), rows)
+
+def write_statistic_events(db: Session, events: list) -> int:
+    # FOR SHARE na statistikách: reset čeká na rozepsaný zápis a zápis po resetu už vidí nový reset_at
+    statistic_ids = sorted({UUID(event["statistic_id"]) for event in events})
+    reset_at = {
+        str(statistic_id): statistic_reset_at
+        for statistic_id, statistic_reset_at in db.query(Statistic.id, Statistic.reset_at)
+            .filter(Statistic.id.in_(statistic_ids), Statistic.deleted_at == None)
+            .order_by(Statistic.id)
+            .with_for_update(read=True)
+            .all()
+    } if statistic_ids else {}
+
+    # Statistiky smazané mezi přijetím hodnoty a zápisem přeskočíme, jinak by zápis padal na FK;
+    # hodnoty přijaté před resetem zahodíme, buffer jiného workeru je mohl držet ještě během resetu
+    events = [
+        event for event in events
+        if event["statistic_id"] in reset_at
+        and (reset_at[event["statistic_id"]] is None or datetime.fromisoformat(event["created_at"]) >= reset_at[event["statistic_id"]])
+    ]
+
+    insert_statistic_values(db, [event for event in events if stores_raw_value(event["type"])])
+    upsert_statistic_rollups(db, rollup_increments(events))
+
+    return len(events)
+
+def create_statistic_value(db: Session, statistic_id: UUID, statistic_type: str, value: StatisticValueCreate):
+    event = make_statistic_event(statistic_id, statistic_type, value)
+
+    write_statistic_events(db, [event])
+    db.commit()
+
+    return event
+
+def write_buffered_statistics(db: Session, events: list, journal_names: list):
+    try:
+        write_statistic_events(db, events)
+
+        # Ve stejné transakci jako rollupy, recover() podle toho přeskočí journal, který worker nestihl smazat
+        if journal_names:
+            db.execute(insert(StatisticFlushedJournal).on_conflict_do_nothing(), [{"name": name} for name in journal_names])
+        db.query(StatisticFlushedJournal).filter(
+            StatisticFlushedJournal.flushed_at < datetime.now(timezone.utc) - timedelta(days=STATISTIC_FLUSHED_JOURNAL_RETENTION_DAYS)
+        ).delete(synchronize_session=False)
+
         db.commit()
-        return True
-    return False
-    
-def create_statistic_value(db: Session, statistic_id: UUID, value: StatisticValueCreate):
-    db_value = StatisticValue(
-        id=uuid.uuid4(),
-        statistic_id=statistic_id,
-        time=value.time,
-        number=value.number,
-        boolean=value.boolean,
-        text=value.text
-    )
-    db.add(db_value)
+    except Exception:
+        db.rollback()
+        raise
+
+def get_flushed_journals(db: Session, journal_names: list) -> set:
+    return {name for (name,) in db.query(StatisticFlushedJournal.name).filter(StatisticFlushedJournal.name.in_(journal_names)).all()}
+
+def flush_statistic_buffer(db: Session, wait: bool = False):
+    flushed = statistic_buffer.flush(lambda events, journal_names: write_buffered_statistics(db, events, journal_names), wait)
+    if flushed:
+        logging.info(f"Flushed {flushed} buffered statistic values")
+    return flushed
+
+def backfill_statistic_rollups(db: Session):
+    # Jednorázově z existujících statistic_value, zámek brání souběhu více workerů
+    db.execute(text("SELECT pg_advisory_xact_lock(:lock_key)"), {"lock_key": STATISTIC_ROLLUP_BACKFILL_LOCK})
+
+    migrated = 0
+
+    if not db.query(StatisticRollup.statistic_id).first():
+        bucket_start = bucket_start_expression(StatisticValue.created_at, "hour")
+        rollups = select(
+            StatisticValue.statistic_id,
+            literal("hour"),
+            bucket_start,
+            func.count(),
+            func.coalesce(func.sum(StatisticValue.number), 0),
+            func.coalesce(func.sum(func.extract("epoch", StatisticValue.time)), 0),
+            func.count().filter(StatisticValue.boolean == True),
+            func.count().filter(StatisticValue.boolean == False),
+        ).where(StatisticValue.created_at != None).group_by(StatisticValue.statistic_id, bucket_start)
+
+        migrated += db.execute(insert(StatisticRollup).from_select(
+            ["statistic_id", "bucket", "bucket_start", *ROLLUP_FIELDS],
+            rollups
+        )).rowcount
+
+    # Hrubší buckety se dopočítají z hodinových, ty pokrývají i hodnoty bez surových řádků
+    for bucket in ROLLUP_BUCKETS[1:]:
+        if db.query(StatisticRollup.statistic_id).filter(StatisticRollup.bucket == bucket).first():
+            continue
+
+        bucket_start = bucket_start_expression(StatisticRollup.bucket_start, bucket)
+        rollups = select(
+            StatisticRollup.statistic_id,
+            literal(bucket),
+            bucket_start,
+            *[func.sum(getattr(StatisticRollup, field)) for field in ROLLUP_FIELDS],
+        ).where(StatisticRollup.bucket == "hour").group_by(StatisticRollup.statistic_id, bucket_start)
+
+        migrated += db.execute(insert(StatisticRollup).from_select(
+            ["statistic_id", "bucket", "bucket_start", *ROLLUP_FIELDS],
+            rollups
+        )).rowcount
+
     db.commit()
-    db.refresh(db_value)
-    return db_value
+    if migrated:
+        logging.info(f"Migrated {migrated} statistic rollups")
+
+    return migrated
 
 def delete_statistic_value(db: Session, statistic_id: UUID):
     db_value = db.query(StatisticValue).filter(StatisticValue.statistic_id == statistic_id).first()
     if db_value:
+        upsert_statistic_rollups(db, rollup_increments([statistic_value_event(db_value)], sign=-1))
         db.delete(db_value)
         db.commit()
         return True
-    return False    
+    return False
 
 def get_statistic_type(db: Session, statistic_id: UUID):
-    statistic = db.query(Statistic).filter(Statistic.id == statistic_id).first()
+    statistic = db.query(Statistic).filter(Statistic.id == statistic_id, Statistic.deleted_at == None).first()
     return statistic.type if statistic else None
 
-def delete_statistic_value(db: Session, statistic_id: UUID):
-    db_value = db.query(StatisticValue).filter(StatisticValue.statistic_id == statistic_id).first()
-    if db_value:
-        db.delete(db_value)
+def delete_statistic_value_batch(db: Session, statistic_ids, purge_before: datetime = None) -> int:
+    # statistic_ids může být seznam i select, DELETE ... WHERE id IN (SELECT ... LIMIT) bez načítání do session
+    batch = select(StatisticValue.id).where(StatisticValue.statistic_id.in_(statistic_ids)).limit(STATISTIC_PURGE_BATCH_SIZE)
+    if purge_before is not None:
+        batch = batch.where(StatisticValue.created_at < purge_before)
+
+    return db.execute(delete(StatisticValue).where(StatisticValue.id.in_(batch.scalar_subquery())).execution_options(synchronize_session=False)).rowcount
+
+def purge_statistic_values(db: Session, statistic_ids, purge_before: datetime = None) -> int:
+    # Každá dávka ve vlastní krátké transakci
+    purged = 0
+    while True:
+        deleted = delete_statistic_value_batch(db, statistic_ids, purge_before)
         db.commit()
-        return True
-    return False
+        purged += deleted
+        if deleted < STATISTIC_PURGE_BATCH_SIZE:
+            return purged
 
-def reset_statistic(db: Session, statistic_id: UUID):
-    db.query(StatisticValue).filter(StatisticValue.statistic_id == statistic_id).delete()
+def purge_in_background(db: Session, statistic_ids) -> bool:
+    # Velikost historie z rollupů, velké mazání nedržíme v requestu
+    value_count = db.query(func.sum(StatisticRollup.value_count)).filter(StatisticRollup.statistic_id.in_(statistic_ids), StatisticRollup.bucket == "day").scalar()
+    return int(value_count or 0) > STATISTIC_PURGE_SYNC_MAX_VALUES
+
+def schedule_statistic_purge(db: Session, statistic_ids, delete_statistic: bool = False, purge_before: datetime = None):
+    purge_before = purge_before or datetime.now(timezone.utc)
+    rows = [
+        {"id": uuid.uuid4(), "statistic_id": statistic_id, "purge_before": purge_before, "delete_statistic": delete_statistic}
+        for (statistic_id,) in db.query(Statistic.id).filter(Statistic.id.in_(statistic_ids)).all()
+    ]
+    if rows:
+        db.execute(insert(StatisticPurge), rows)
     db.commit()
 
-def get_aggregated_statistic_value(db: Session, statistic_id: UUID):
-    statistic = db.query(Statistic).filter(Statistic.id == statistic_id).first()
-    if not statistic:
-        return None
+def process_statistic_purges(db: Session) -> int:
+    # Zámek záznamu jen po dobu jedné dávky, SKIP LOCKED rozdělí práci mezi workery
+    purged = 0
+    while True:
+        purge = db.query(StatisticPurge).order_by(StatisticPurge.created_at).with_for_update(skip_locked=True).first()
+        if not purge:
+            db.rollback()
+            if purged:
+                logging.info(f"Purged {purged} statistic values")
+            return purged
+
+        deleted = delete_statistic_value_batch(db, [purge.statistic_id], purge.purge_before)
+        if deleted < STATISTIC_PURGE_BATCH_SIZE:
+            if purge.delete_statistic:
+                db.query(Statistic).filter(Statistic.id == purge.statistic_id).delete(synchronize_session=False)
+                invalidate_statistic_metadata(purge.statistic_id)
+            else:
+                db.delete(purge)
+        db.commit()
+        purged += deleted
+
+def reset_statistics(db: Session, statistic_ids):
+    # Zámek statistik před určením okamžiku resetu: rozepsané zápisy doběhnou a obsahují jen starší hodnoty
+    db.query(Statistic.id).filter(Statistic.id.in_(statistic_ids)).order_by(Statistic.id).with_for_update().all()
+
+    # Agregáty se vynulují hned, surové hodnoty se mažou po dávkách, případně na pozadí; obojí ke stejnému okamžiku.
+    # Starší hodnoty, které ještě čekají v bufferech workerů, zahodí write_statistic_events podle reset_at
+    purge_before = datetime.now(timezone.utc)
+    background = purge_in_background(db, statistic_ids)
+
+    db.execute(update(Statistic).where(Statistic.id.in_(statistic_ids)).values(reset_at=purge_before).execution_options(synchronize_session=False))
+    db.execute(delete(StatisticRollup).where(StatisticRollup.statistic_id.in_(statistic_ids)).execution_options(synchronize_session=False))
+
+    if background:
+        schedule_statistic_purge(db, statistic_ids, purge_before=purge_before)
+        return 202
+
+    db.commit()
+    purge_statistic_values(db, statistic_ids, purge_before)
+
+    return 200
+
+def reset_statistic(db: Session, statistic_id: UUID):
+    return reset_statistics(db, [statistic_id])
 
-    statistic_type = statistic.type
+def get_statistic_totals(db: Session, statistic_ids: list) -> dict:
+    # Celkové součty z denních bucketů, jeden dotaz pro libovolný počet statistik
+    rows = db.query(
+        StatisticRollup.statistic_id,
+        *[func.sum(getattr(StatisticRollup, field)) for field in ROLLUP_FIELDS],
+    ).filter(StatisticRollup.statistic_id.in_(statistic_ids), StatisticRollup.bucket == "day").group_by(StatisticRollup.statistic_id).all()
+
+    return {row[0]: dict(zip(ROLLUP_FIELDS, (value or 0 for value in row[1:]))) for row in rows}
+
+def format_aggregated_value(statistic_type: str, totals: dict):
+    value_count = int(totals["value_count"]) if totals else 0
 
     if statistic_type == "number":
-        result = db.query(func.sum(StatisticValue.number)).filter(StatisticValue.statistic_id == statistic_id).scalar()
-        return {"value": result}
+        return {"value": int(totals["number_sum"]) if value_count else None}
 
     elif statistic_type == "time":
-        result = db.query(func.avg(func.extract("epoch", StatisticValue.time))).filter(StatisticValue.statistic_id == statistic_id).scalar()
         average_time = None
-        if result is not None:
-            average_time = timedelta(seconds=result)
+        if value_count:
+            average_time = timedelta(seconds=float(totals["time_seconds_sum"]) / value_count)
         return {"value": str(average_time)}
 
     elif statistic_type == "boolean":
-        true_count = db.query(func.count()).filter(StatisticValue.statistic_id == statistic_id, StatisticValue.boolean == True).scalar()
-        false_count = db.query(func.count()).filter(StatisticValue.statistic_id == statistic_id, StatisticValue.boolean == False).scalar()
-        return {"value": { "true": true_count, "false": false_count } }
+        return {"value": { "true": int(totals["true_count"]) if totals else 0, "false": int(totals["false_count"]) if totals else 0 } }
 
     return None
 
+def get_aggregated_statistic_value(db: Session, statistic_id: UUID):
+    statistic = db.query(Statistic).filter(Statistic.id == statistic_id, Statistic.deleted_at == None).first()
+    if not statistic:
+        return None
+
+    if statistic.type not in ("number", "time", "boolean"):
+        return None
+
+    return format_aggregated_value(statistic.type, get_statistic_totals(db, [statistic_id]).get(statistic_id))
+
+def resolve_series_range(bucket: str, start: datetime = None, end: datetime = None):
+    end = end or datetime.now(timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+
+    start = start or end - STATISTIC_SERIES_DEFAULT_RANGES[bucket]
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+
+    # První bucket celý, i když "from" padne doprostřed
+    start = truncate_to_bucket(start, bucket)
+
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+
+    if (end - start) / STATISTIC_SERIES_BUCKETS[bucket] > STATISTIC_SERIES_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range is too long, at most {STATISTIC_SERIES_MAX_BUCKETS} buckets are allowed")
+
+    return start, end
+
+def get_statistic_series(db: Session, statistic_id: UUID, statistic_type: str, bucket: str, start: datetime, end: datetime):
+    # hour a day jsou přímo v rollupech, week se seskupí z denních
+    source_bucket = "hour" if bucket == "hour" else "day"
+    bucket_start = StatisticRollup.bucket_start if bucket == source_bucket else bucket_start_expression(StatisticRollup.bucket_start, bucket)
+
+    rows = db.query(
+        bucket_start,
+        *[func.sum(getattr(StatisticRollup, field)) for field in ROLLUP_FIELDS],
+    ).filter(
+        StatisticRollup.statistic_id == statistic_id,
+        StatisticRollup.bucket == source_bucket,
+        StatisticRollup.bucket_start >= start,
+        StatisticRollup.bucket_start < end,
+    ).group_by(bucket_start).order_by(bucket_start).all()
+
+    series = {"timestamps": [], "counts": [], "values": []}
+    if statistic_type == "boolean":
+        series["false_values"] = []
+
+    for bucket_time, value_count, number_sum, time_seconds_sum, true_count, false_count in rows:
+        series["timestamps"].append(bucket_time)
+        series["counts"].append(int(value_count))
+
+        if statistic_type == "number":
+            series["values"].append(int(number_sum))
+        elif statistic_type == "time":
+            series["values"].append(float(time_seconds_sum) / int(value_count) if value_count else None)
+        elif statistic_type == "boolean":
+            series["values"].append(int(true_count))
+            series["false_values"].append(int(false_count))
+        else:
+            series["values"].append(int(value_count))
+
+    return series
+
+def get_statistic_values_by_statistic(db: Session, statistic_ids: list, limit: int = None) -> dict:
+    if not statistic_ids or limit == 0:
+        return {}
+
+    if limit is None:
+        values = db.query(StatisticValue).filter(StatisticValue.statistic_id.in_(statistic_ids)).order_by(StatisticValue.created_at).all()
+    else:
+        # Posledních N hodnot každé statistiky přes LATERAL, čte jen N řádků z indexu (statistic_id, created_at)
+        statistics = select(Statistic.id).where(Statistic.id.in_(statistic_ids)).subquery()
+        latest = select(StatisticValue).where(StatisticValue.statistic_id == statistics.c.id).order_by(StatisticValue.created_at.desc()).limit(limit).lateral()
+        latest_value = aliased(StatisticValue, latest)
+        values = db.execute(select(latest_value).select_from(statistics).join(latest, true())).scalars().all()
+        values = sorted(values, key=lambda value: value.created_at)
+
+    values_by_statistic = {}
+    for value in values:
+        values_by_statistic.setdefault(value.statistic_id, []).append(value)
+
+    return values_by_statistic
+
+def build_statistic_summaries(db: Session, statistics: list, values_limit: int = None) -> list:
+    # Agregát z rollupů a omezený počet hodnot, velikost odpovědi nezávisí na délce historie
+    statistic_ids = [statistic.id for statistic in statistics]
+    totals = get_statistic_totals(db, statistic_ids)
+    values = get_statistic_values_by_statistic(db, statistic_ids, values_limit)
+
+    summaries = []
+    for statistic in statistics:
+        statistic_totals = totals.get(statistic.id)
+        value_count = int(statistic_totals["value_count"]) if statistic_totals else 0
+        aggregated = format_aggregated_value(statistic.type, statistic_totals) if value_count else None
+
+        summaries.append({
+            "id": statistic.id,
+            "name": statistic.name,
+            "description": statistic.description,
+            "icon": statistic.icon,
+            "type": statistic.type,
+            "user_id": statistic.user_id,
+            "created_at": statistic.created_at,
+            "updated_at": statistic.updated_at,
+            "value_count": value_count,
+            "aggregate": aggregated["value"] if aggregated else None,
+            "values": values.get(statistic.id, []),
+        })
+
+    return summaries
+
+def get_recently_active_statistics(db: Session, user_id: UUID, since: datetime):
+    # EXISTS nad hodinovými rollupy místo joinu na všechny hodnoty, statistika se neopakuje
+    recent_rollup = db.query(StatisticRollup.statistic_id).filter(
+        StatisticRollup.statistic_id == Statistic.id,
+        StatisticRollup.bucket == "hour",
+        StatisticRollup.bucket_start >= truncate_to_bucket(since, "hour"),
+    ).exists()
+
+    return db.query(Statistic).filter(Statistic.user_id == user_id, Statistic.deleted_at == None, recent_rollup).all()
+
+def paginate_statistic_values(db: Session, statistic_id: UUID, page: int, per_page: int, sort_order: str, cursor: str = None):
+    query = db.query(StatisticValue).filter(StatisticValue.statistic_id == statistic_id)
+    ascending = sort_order == "asc"
+
+    # Keyset přes (created_at, id) jako u odpovědí formulářů, bez cursoru klasický offset
+    if cursor:
+        created_at, value_id = decode_response_cursor(cursor)
+        position = tuple_(StatisticValue.created_at, StatisticValue.id)
+        query = query.filter(position > (created_at, value_id) if ascending else position < (created_at, value_id))
+
+    if ascending:
+        query = query.order_by(StatisticValue.created_at.asc(), StatisticValue.id.asc())
+    else:
+        query = query.order_by(StatisticValue.created_at.desc(), StatisticValue.id.desc())
+
+    if cursor is None:
+        query = query.offset((page - 1) * per_page)
+
+    values = query.limit(per_page + 1).all()
+    next_cursor = encode_response_cursor(values[per_page - 1]) if len(values) > per_page else None
+
+    return values[:per_page], next_cursor
+
 def reset_user_statistics(db: Session, user_id: UUID):
-    user_statistics = db.query(Statistic).filter(Statistic.user_id == user_id).all()
-    
-    for statistic in user_statistics:
-        db.query(StatisticValue).filter(StatisticValue.statistic_id == statistic.id).delete()
-    
-    db.commit()
\ No newline at end of file
+    return reset_statistics(db, select(Statistic.id).where(Statistic.user_id == user_id, Statistic.deleted_at == None))
@@ -8,7 +8,9 @@ from utils.security import get_password_hash, verify_password, create_access_tok
 from datetime import datetime, timezone, timedelta
 from cryptography.fernet import Fernet 
 from utils.email import send_delete_user_email
-from utils.security import decrypt_private_key_via_password, encrypt_private_key_via_password, generate_key_pair
+from utils.security import decrypt_private_key_via_password, encrypt_private_key_via_password, generate_key_pair, invalidate_token_cache
+from utils.content_cache import public_content_cache
+from models.cms import Content
 import uuid
 from cryptography.hazmat.primitives import serialization
 
@@ -77,6 +79,12 @@ def update_user(db: Session, user_id: UUID, user_update: UserUpdate):
         setattr(db_user, key, value)
     db.commit()
     db.refresh(db_user)
+
+    # Veřejné CMS snapshoty nesou web_url pro kontrolu originu
+    if "web_url" in user_update.dict(exclude_unset=True):
+        for (root_id,) in db.query(Content.id).filter(Content.user_id == user_id, Content.is_root == True).all():
+            public_content_cache.invalidate(root_id)
+
     return db_user
 
 def delete_user(db: Session, user_id: UUID):
@@ -84,6 +92,7 @@ def delete_user(db: Session, user_id: UUID):
     if db_user:
         db.delete(db_user)
         db.commit()
+        invalidate_token_cache(user_id)
         return True
     return False
 
@@ -112,6 +121,7 @@ def create_token_via_id(db: Session, user_id: UUID):
     db.add(db_token)
     db.commit()
     db.refresh(db_token)
+    invalidate_token_cache(user_id)
     return db_token
 
 def refresh_all_auth_tokens(db: Session):
@@ -127,6 +137,9 @@ def refresh_all_auth_tokens(db: Session):
     
     db.commit()
 
+    for token in db_tokens:
+        invalidate_token_cache(token.user_id)
+
 def get_token(db: Session, user_id: UUID):
     return db.query(Token).filter(Token.user_id == user_id).first()
 
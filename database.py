@@ -1,14 +1,189 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 import os
+import time
+import logging
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# Každý uvicorn worker má dva pooly, sync (Session) a async (asyncpg pro veřejné formuláře);
+# celkový počet spojení na Postgres je (DB_POOL_SIZE + DB_MAX_OVERFLOW + DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW) * počet workerů
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "5"))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+class PoolMetrics:
+    def __init__(self, max_overflow: int):
+        self.max_overflow = max_overflow
+        self.checkouts = 0
+        self.connections_created = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+        self.connection_age_total = 0.0
+        self.connection_age_max = 0.0
+        self.overflow_max = 0
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_wait_total += seconds
+            self.checkout_wait_max = max(self.checkout_wait_max, seconds)
+
+    def record_checkout(self, connection_age: float, overflow: int):
+        with self._lock:
+            self.connection_age_total += connection_age
+            self.connection_age_max = max(self.connection_age_max, connection_age)
+            self.overflow_max = max(self.overflow_max, overflow)
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_created += 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            checkouts = self.checkouts or 1
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "overflow_max": self.overflow_max,
+                "max_overflow": self.max_overflow,
+                "checkouts": self.checkouts,
+                "connections_created": self.connections_created,
+                "checkout_wait_avg_ms": self.checkout_wait_total / checkouts * 1000,
+                "checkout_wait_max_ms": self.checkout_wait_max * 1000,
+                "connection_age_avg_seconds": self.connection_age_total / checkouts,
+                "connection_age_max_seconds": self.connection_age_max,
+            }
+
+pool_metrics = PoolMetrics(DB_MAX_OVERFLOW)
+async_pool_metrics = PoolMetrics(DB_ASYNC_MAX_OVERFLOW)
+
+class InstrumentedPoolMixin:
+    # Čas strávený čekáním na volné spojení z poolu
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.metrics.record_wait(time.perf_counter() - started)
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    metrics = pool_metrics
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics = async_pool_metrics
+
+def instrument_engine(db_engine, metrics: PoolMetrics):
+    @event.listens_for(db_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info["created_at"] = time.monotonic()
+        metrics.record_connect()
+
+    @event.listens_for(db_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_age = time.monotonic() - connection_record.info.get("created_at", time.monotonic())
+        metrics.record_checkout(connection_age, max(db_engine.pool.overflow(), 0))
+
+def create_db_engine(database_url: str = DATABASE_URL):
+    connect_args = {}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    db_engine = create_engine(
+        database_url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+    instrument_engine(db_engine, pool_metrics)
+
+    return db_engine
+
+def create_async_db_engine(database_url: str = DATABASE_URL):
+    # Stejné DATABASE_URL, jen přes asyncpg driver; sslmode z psycopg2 URL převádíme na ssl
+    url = make_url(database_url).set(drivername="postgresql+asyncpg")
+    sslmode = url.query.get("sslmode")
+    url = url.difference_update_query(["sslmode"])
+
+    connect_args = {}
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = sslmode
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+
+    db_engine = create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=DB_ASYNC_POOL_SIZE,
+        max_overflow=DB_ASYNC_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+    # Eventy poolu visí na sync_engine, async engine je jen obaluje
+    instrument_engine(db_engine.sync_engine, async_pool_metrics)
+
+    return db_engine
+
+def add_missing_columns(bind, table, column_names: list):
+    # create_all nepřidává sloupce do existujících tabulek, nové nullable sloupce doplníme idempotentně
+    with bind.begin() as connection:
+        for column_name in column_names:
+            column = table.c[column_name]
+            column_type = column.type.compile(dialect=bind.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {column.name} {column_type}"))
+
+def create_missing_indexes(bind, tables: list):
+    # create_all vytváří indexy jen s novou tabulkou, na existující tabulky je doplníme bez blokování zápisů
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for table in tables:
+            for index in table.indexes:
+                # Přerušené CREATE INDEX CONCURRENTLY nechá nevalidní index, IF NOT EXISTS by ho přeskočil
+                invalid = connection.execute(text(
+                    "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+                    "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+                ), {"name": index.name}).first()
+
+                columns = ", ".join(column.name for column in index.columns)
+                try:
+                    if invalid:
+                        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+                    connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {table.name} ({columns})"))
+                except Exception as e:
+                    logging.error(f"Creating index {index.name} failed: {e}")
+
+def get_pool_metrics() -> dict:
+    return {
+        "sync": pool_metrics.snapshot(engine.pool),
+        "async": async_pool_metrics.snapshot(async_engine.pool),
+    }
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
@@ -1,5 +1,6 @@
 import logging
-from fastapi import FastAPI, Request, APIRouter, File, UploadFile, HTTPException, Query, status
+from fastapi import FastAPI, Request, APIRouter, File, UploadFile, HTTPException, Query, Depends, status
+from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
@@ -18,8 +19,11 @@ from dotenv import load_dotenv
 from tenacity import retry, wait_fixed, stop_after_attempt
 import re
 
-from database import SessionLocal, engine, Base
+from database import SessionLocal, engine, Base, get_pool_metrics, add_missing_columns, create_missing_indexes
 from models.user import User, Code
+from models.form import FormResponse
+from models.statistics import Statistic, StatisticValue
+from models.cms import Content, ContentItemProperty
 from routers.user import router as user_router
 from routers.statistics import router as statistics_router
 from routers.form import router as form_router
@@ -27,26 +31,36 @@ from routers.event import router as event_router
 from routers.label import router as label_router
 from routers.cms import router as content_router
 from crud.user import delete_unverified_users, delete_expired_code, refresh_all_auth_tokens
+from crud.form import drain_form_ingest_queue
+from crud.cms import collect_unused_contents, backfill_content_references, backfill_content_list_item_rows, is_content_reference_backfill_completed, CMS_GC_INTERVAL_SECONDS
+from crud.statistics import flush_statistic_buffer, get_flushed_journals, backfill_statistic_rollups, process_statistic_purges, STATISTIC_PURGE_INTERVAL_SECONDS
+from utils.security import verify_metrics_token
+from utils.ingest import FORM_INGEST_QUEUE_ENABLED, FORM_INGEST_POLL_SECONDS, FORM_INGEST_WORKERS
+from utils.statistics_buffer import statistic_buffer, STATISTICS_BUFFER_ENABLED, STATISTICS_FLUSH_SECONDS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=10,
-    max_overflow=20,  # Allow extra connections if needed
-    pool_timeout=30,  # Adjust connection timeout
-    pool_recycle=3600,  # Recycle connections after 1 hour
-)
+Base.metadata.create_all(bind=engine)
+add_missing_columns(engine, FormResponse.__table__, ["data_key"])
+add_missing_columns(engine, Statistic.__table__, ["deleted_at", "reset_at"])
+add_missing_columns(engine, Content.__table__, ["list_item_rows"])
+create_missing_indexes(engine, [FormResponse.__table__, StatisticValue.__table__, Content.__table__, ContentItemProperty.__table__])
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Hrany content_reference se naplní z polí, dokud migrace není označená jako dokončená; GC na nich závisí
+with SessionLocal() as migration_db:
+    try:
+        backfill_content_references(migration_db)
+    except Exception as e:
+        migration_db.rollback()
+        logger.error(f"Content reference backfill failed, CMS GC disabled: {e}")
+    content_gc_enabled = is_content_reference_backfill_completed(migration_db)
+    backfill_content_list_item_rows(migration_db)
+    backfill_statistic_rollups(migration_db)
 
-Base.metadata.create_all(bind=engine)
+# Hodnoty z journalů workeru, který spadl před flushem
+with SessionLocal() as recovery_db:
+    recovered_statistic_values = statistic_buffer.recover(lambda journal_names: get_flushed_journals(recovery_db, journal_names))
 
 app = FastAPI(
     title="Brandoo API"
@@ -113,8 +127,60 @@ def refresh_hook():
     finally:
         db.close()
 
+def ingest_hook():
+    db = SessionLocal()
+    try:
+        drain_form_ingest_queue(db)
+    except Exception as e:
+        logger.error(f"Error in ingest_hook: {e}")
+    finally:
+        db.close()
+
+def content_gc_hook():
+    db = SessionLocal()
+    try:
+        collect_unused_contents(db)
+    except Exception as e:
+        logger.error(f"Error in content_gc_hook: {e}")
+    finally:
+        db.close()
+
+def statistics_flush_hook():
+    db = SessionLocal()
+    try:
+        flush_statistic_buffer(db)
+    except Exception as e:
+        logger.error(f"Error in statistics_flush_hook: {e}")
+    finally:
+        db.close()
+
+def statistics_purge_hook():
+    db = SessionLocal()
+    try:
+        process_statistic_purges(db)
+    except Exception as e:
+        logger.error(f"Error in statistics_purge_hook: {e}")
+    finally:
+        db.close()
+
 scheduler = BackgroundScheduler()
 scheduler.add_job(refresh_hook, trigger=IntervalTrigger(hours=1))
+if content_gc_enabled:
+    scheduler.add_job(content_gc_hook, trigger=IntervalTrigger(seconds=CMS_GC_INTERVAL_SECONDS), coalesce=True)
+scheduler.add_job(statistics_purge_hook, trigger=IntervalTrigger(seconds=STATISTIC_PURGE_INTERVAL_SECONDS), coalesce=True)
+
+if FORM_INGEST_QUEUE_ENABLED:
+    scheduler.add_job(
+        ingest_hook,
+        trigger=IntervalTrigger(seconds=FORM_INGEST_POLL_SECONDS),
+        max_instances=FORM_INGEST_WORKERS,
+        coalesce=True,
+    )
+
+if STATISTICS_BUFFER_ENABLED or recovered_statistic_values:
+    scheduler.add_job(statistics_flush_hook, trigger=IntervalTrigger(seconds=STATISTICS_FLUSH_SECONDS), coalesce=True)
+    # Při dosažení limitu se flush spustí hned, nečeká na interval
+    statistic_buffer.on_full = lambda: scheduler.add_job(statistics_flush_hook)
 scheduler.start()
 
 router = APIRouter()
@@ -123,6 +189,19 @@ router = APIRouter()
 def read_root():
     return "Success! Go to /docs for Swagger API"
 
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+@router.get("/api/metrics/db-pool")
+def read_db_pool_metrics(token: str = Depends(oauth2_scheme)):
+    if not verify_metrics_token(token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return get_pool_metrics()
+
+@app.on_event("shutdown")
+def flush_statistics_on_shutdown():
+    statistics_flush_hook()
+
 app.include_router(router)
 app.include_router(user_router, prefix="/api/user", tags=["User"])
 app.include_router(statistics_router, prefix="/api/statistics", tags=["Statistics"])
@@ -1,6 +1,6 @@
 # models/cms.py
 
-from sqlalchemy import Column, String, DateTime, Enum, Boolean, Integer, ARRAY, JSON
+from sqlalchemy import Column, String, DateTime, Enum, Boolean, Integer, ARRAY, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -14,7 +14,7 @@ class Content(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), nullable=False)
     position = Column(Integer, nullable=False)
-    root_content_id = Column(UUID(as_uuid=True), nullable=True)
+    root_content_id = Column(UUID(as_uuid=True), nullable=True, index=True)  # GC a načtení stromu jdou přes root
     parent_content_id = Column(UUID(as_uuid=True), nullable=True)
 
     is_root = Column(Boolean, default=False)
@@ -34,8 +34,10 @@ class Content(Base):
     image = Column(String, nullable=True)  # Path
     html = Column(String, nullable=True)
     list_text_content = Column(ARRAY(String), nullable=True)
+    # Legacy pole, čte je jen migrace do content_reference; odkazy na property drží hrany
     item_content = Column(ARRAY(UUID(as_uuid=True)), default=[])
     list_item_content = Column(JSON, nullable=True)
+    list_item_rows = Column(Integer, nullable=True)  # Počet řádků list_item_content včetně prázdných
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -45,12 +47,32 @@ class ContentItemProperty(Base): # Object property
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     parent_content_id = Column(UUID(as_uuid=True), nullable=False)
-    root_content_id = Column(UUID(as_uuid=True), nullable=False)
+    root_content_id = Column(UUID(as_uuid=True), nullable=False, index=True)
 
     user_id = Column(UUID(as_uuid=True), nullable=False)
 
     key = Column(String, nullable=True)
-    content_id = Column(UUID(as_uuid=True), nullable=True)
+    content_id = Column(UUID(as_uuid=True), nullable=True, index=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ContentReference(Base): # Edge parent content -> property
+    # Zdroj pravdy pro item_content/list_item_content, pole v odpovědích se z hran skládají
+    __tablename__ = "content_reference"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    parent_content_id = Column(UUID(as_uuid=True), nullable=False)
+    row_index = Column(Integer, nullable=True)  # None pro item_content, jinak řádek list_item_content
+    position = Column(Integer, nullable=False)  # Pořadí v rámci řádku, mezery po smazání nevadí
+    property_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_content_reference_parent_row_position", "parent_content_id", "row_index", "position"),
+    )
+
+class ContentGcRoot(Base): # Root čekající na úklid osiřelých uzlů
+    __tablename__ = "content_gc_root"
+
+    root_content_id = Column(UUID(as_uuid=True), primary_key=True)
+    due_at = Column(DateTime(timezone=True), nullable=False, index=True)  # Nejdřív po uplynutí grace nejmladšího kandidáta
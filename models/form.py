@@ -1,6 +1,6 @@
 # models/form.py
 
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Enum, ARRAY, Boolean, Time
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Enum, ARRAY, Boolean, Time, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship 
 from sqlalchemy.sql import func
@@ -98,9 +98,27 @@ class FormResponse(Base):
     labels = Column(ARRAY(String), nullable=False)
     seen = Column(Boolean, default=False)
     alias = Column(String, nullable=True)
+    data_key = Column(String, nullable=True)  # AES data key zašifrovaný veřejným RSA klíčem uživatele
 
     form = relationship("Form", back_populates="responses")
 
+    __table_args__ = (
+        Index("ix_form_response_form_created_id", "form_id", "created_at", "id"),
+    )
+
+class FormResponseSearchToken(Base):
+    __tablename__ = "form_response_search_token"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    form_id = Column(UUID(as_uuid=True), nullable=False)
+    response_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    token = Column(String, nullable=False)  # HMAC normalizovaného slova, hodnota samotná se neukládá
+
+    __table_args__ = (
+        Index("ix_form_response_search_token_user_token", "user_id", "token"),
+    )
+
 class FormResponseMessage(Base):
     __tablename__ = "form_response_message"
 
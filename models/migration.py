@@ -0,0 +1,11 @@
+# models/migration.py
+
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from database import Base
+
+class DataMigration(Base): # Dokončená jednorázová datová migrace
+    __tablename__ = "data_migration"
+
+    name = Column(String, primary_key=True)
+    completed_at = Column(DateTime(timezone=True), server_default=func.now())
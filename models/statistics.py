@@ -1,6 +1,6 @@
 # models/statistics.py
 
-from sqlalchemy import Column, String, DateTime, Integer, Boolean, ForeignKey, Time
+from sqlalchemy import Column, String, DateTime, Integer, BigInteger, Float, Boolean, ForeignKey, Time, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -18,8 +18,13 @@ class Statistic(Base):
     type = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Nastaví se hned při smazání na pozadí, řádek zmizí až po dokončení purge
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # Hodnoty přijaté před posledním resetem se při zápisu z bufferu zahodí
+    reset_at = Column(DateTime(timezone=True), nullable=True)
 
-    values = relationship("StatisticValue", back_populates="statistic", cascade="all, delete-orphan")
+    # Hodnoty maže databáze přes ON DELETE CASCADE, ORM je nenačítá
+    values = relationship("StatisticValue", back_populates="statistic", cascade="all, delete-orphan", passive_deletes=True)
 
 class StatisticValue(Base):
     __tablename__ = "statistic_value"
@@ -34,3 +39,34 @@ class StatisticValue(Base):
     text = Column(String, nullable=True)
 
     statistic = relationship("Statistic", back_populates="values")
+
+    __table_args__ = (
+        Index("ix_statistic_value_statistic_created_at", "statistic_id", "created_at"),
+    )
+
+class StatisticRollup(Base): # Agregace hodnot po časových bucketech
+    __tablename__ = "statistic_rollup"
+
+    statistic_id = Column(UUID(as_uuid=True), ForeignKey('statistic.id', ondelete='CASCADE'), primary_key=True)
+    bucket = Column(String, primary_key=True)  # hour | day, celkové součty se počítají z day
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    value_count = Column(BigInteger, nullable=False, default=0)
+    number_sum = Column(BigInteger, nullable=False, default=0)
+    time_seconds_sum = Column(Float, nullable=False, default=0)
+    true_count = Column(BigInteger, nullable=False, default=0)
+    false_count = Column(BigInteger, nullable=False, default=0)
+
+class StatisticPurge(Base): # Čekající dávkové mazání hodnot statistiky
+    __tablename__ = "statistic_purge"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    statistic_id = Column(UUID(as_uuid=True), ForeignKey('statistic.id', ondelete='CASCADE'), nullable=False)
+    purge_before = Column(DateTime(timezone=True), nullable=False)  # Maže se jen historie před resetem
+    delete_statistic = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class StatisticFlushedJournal(Base): # Journal bufferu už zapsaný do DB
+    __tablename__ = "statistic_flushed_journal"
+
+    name = Column(String, primary_key=True)
+    flushed_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
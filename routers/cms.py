@@ -19,14 +19,21 @@ from crud.cms import (
     add_property_to_list_item_content_at_index,
     reorder_list_item_content_in_db,
     delete_property_from_content,
-    get_root_public_content,
-    delete_item_from_list_item_content
+    get_public_content_snapshot,
+    delete_item_from_list_item_content,
+    get_batch_owner,
+    get_content_owner,
+    get_property_owner,
+    apply_content_batch,
+    CONTENT_BATCH_MAX_OPERATIONS
 )
-from schemas.cms import RootContentLight, ContentUpdate, BaseContent, ContentWithProperties, ReorderRequest
+from schemas.cms import RootContentLight, ContentUpdate, BaseContent, ContentWithProperties, ReorderRequest, ContentBatchRequest
 from fastapi import Query
 from typing import List, Optional
 from crud.user import get_user
 from fastapi import HTTPException
+from starlette.responses import Response
+from utils.http_cache import etag_matches, not_modified, cache_headers, PUBLIC_CONTENT_CACHE_CONTROL
 
 from uuid import UUID
 
@@ -99,12 +106,29 @@ def fetch_users_root_contents(user_id: UUID, token: str = Depends(oauth2_scheme)
     
     return root_content_light_list
 
+@router.post("/batch")
+def apply_content_batch_endpoint(batch: ContentBatchRequest, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    if not batch.operations:
+        raise HTTPException(status_code=400, detail="No operations")
+
+    if len(batch.operations) > CONTENT_BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"Too many operations, maximum is {CONTENT_BATCH_MAX_OPERATIONS}")
+
+    owner_id = get_batch_owner(db, batch.operations)
+
+    if not verify_token(db, owner_id, token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    results = apply_content_batch(db, batch.operations)
+
+    return {"detail": "Successfully applied batch", "results": results}
+
 @router.put("/{content_id}")
 def put_content(content_id: UUID, content_to_update: ContentUpdate, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    content, status = get_root_content(db, content_id)
-    if not content:
+    owner_id = get_content_owner(db, content_id)
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Content not found")
-    if not verify_token(db, content.user_id, token):
+    if not verify_token(db, owner_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
     update_content(db, content_id, content_to_update)
     return {"detail": "Succcessfuly updated root content!"}
@@ -120,11 +144,11 @@ def get_content_ep(content_id: UUID, token: str = Depends(oauth2_scheme), db: Se
 
 @router.post("/property/{content_id}/{root_id}")
 def create_property(content_id: UUID, root_id: UUID, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    content = get_content(db, content_id)
-    if not content:
+    owner_id = get_content_owner(db, content_id)
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Content not found")
     
-    if not verify_token(db, content.user_id, token):
+    if not verify_token(db, owner_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     prop, status = create_new_item_property(db, content_id, root_id)
@@ -138,26 +162,32 @@ def update_property_endpoint(
     key: str = Query(None), 
     db: Session = Depends(get_db)
 ):
-    prop, status = update_property(db, property_id, key)
+    owner_id = get_property_owner(db, property_id)
 
-    if status == 404:
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Property not found")
     
-    if not verify_token(db, prop.user_id, token):
+    # Vlastníka ověřujeme před zápisem, ne až po něm
+    if not verify_token(db, owner_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
+
+    prop, status = update_property(db, property_id, key)
+
+    if status == 404:
+        raise HTTPException(status_code=404, detail="Property not found")
     
     return {"detail": "Successfully updated property"}
 
 @router.post("/list_item_content/{content_id}")
 def create_empty_list_item_content(content_id: UUID, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    content = get_content(db, content_id)
-    if not content:
+    owner_id = get_content_owner(db, content_id)
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Content not found")
     
-    if not verify_token(db, content.user_id, token):
+    if not verify_token(db, owner_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
     
-    status = initialize_empty_list_item_content(db, content_id)
+    status = create_empty_list_item_property_at_index(db, content_id)
     
     if status == 200:
         return {"detail": "Successfully created new empty list item content!"}
@@ -166,11 +196,11 @@ def create_empty_list_item_content(content_id: UUID, token: str = Depends(oauth2
 
 @router.post("/list-item-content/{content_id}")
 def create_empty_list_item_content(content_id: UUID, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    content = get_content(db, content_id)
-    if not content:
+    owner_id = get_content_owner(db, content_id)
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Content not found")
     
-    if not verify_token(db, content.user_id, token):
+    if not verify_token(db, owner_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     status = create_empty_list_item_property_at_index(db, content_id)
@@ -182,11 +212,11 @@ def create_empty_list_item_content(content_id: UUID, token: str = Depends(oauth2
 
 @router.post("/list-item-content/{content_id}/{index}/{root_id}/property")
 def add_property_to_list_item_content(content_id: UUID, root_id: UUID, index: int, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    content = get_content(db, content_id)
-    if not content:
+    owner_id = get_content_owner(db, content_id)
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Content not found")
     
-    if not verify_token(db, content.user_id, token):
+    if not verify_token(db, owner_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     status = add_property_to_list_item_content_at_index(db, content_id, index, root_id)
@@ -200,11 +230,11 @@ def add_property_to_list_item_content(content_id: UUID, root_id: UUID, index: in
 
 @router.delete("/list-item-content/{content_id}/{index}")
 def delete_property_from_list_item(content_id: UUID, index: int, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    content = get_content(db, content_id)
-    if not content:
+    owner_id = get_content_owner(db, content_id)
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Content not found")
     
-    if not verify_token(db, content.user_id, token):
+    if not verify_token(db, owner_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     status, message = delete_item_from_list_item_content(db, content_id, index)
@@ -218,12 +248,11 @@ def delete_property_from_list_item(content_id: UUID, index: int, token: str = De
 
 @router.put("/list-item-content/{content_id}/reorder")
 def reorder_list_item_content(content_id: UUID, request: ReorderRequest, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    content = get_content(db, content_id)
-    
-    if not content:
+    owner_id = get_content_owner(db, content_id)
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Content not found")
     
-    if not verify_token(db, content.user_id, token):
+    if not verify_token(db, owner_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     # Extrahuj new_order z requestu
@@ -238,30 +267,35 @@ def reorder_list_item_content(content_id: UUID, request: ReorderRequest, token:
 
 @router.get("/{content_id}/public")
 def get_root_content_endpoint(content_id: UUID, request: Request, token: Optional[str] = Depends(get_optional_token), db: Session = Depends(get_db)):
-    content = get_root_public_content(db, content_id)
-    raw_content = get_content(db, content_id)
-    user = get_user(db, raw_content.user_id)
+    snapshot = get_public_content_snapshot(db, content_id)
+
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Content not found")
 
     request_origin = request.headers.get("origin")
 
     if request_origin and "localhost" in request_origin:
-        if not verify_token(db, user.id, token):
+        if not verify_token(db, snapshot["user_id"], token):
             raise HTTPException(status_code=401, detail="Unauthorized for localhost")
-    elif request_origin not in origins and request_origin != f"https://{user.web_url}":
+    elif request_origin not in origins and request_origin != f"https://{snapshot['web_url']}":
         raise HTTPException(status_code=403, detail="Forbidden: Origin not allowed")
 
-    if not content:
-        raise HTTPException(status_code=404, detail="Content not found")
-    
-    return content
+    if etag_matches(request, snapshot["etag"]):
+        return not_modified(snapshot["etag"], PUBLIC_CONTENT_CACHE_CONTROL)
+
+    return Response(
+        content=snapshot["body"],
+        media_type="application/json",
+        headers=cache_headers(snapshot["etag"], PUBLIC_CONTENT_CACHE_CONTROL)
+    )
 
 @router.delete("/{content_id}/property/{property_id}")
 def delete_item_property(content_id: UUID, property_id: UUID, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    content = get_content(db, content_id)
-    if not content:
+    owner_id = get_content_owner(db, content_id)
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Content not found")
     
-    if not verify_token(db, content.user_id, token):
+    if not verify_token(db, owner_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     deleted_property = delete_property_from_content(db, content_id, property_id)
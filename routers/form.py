@@ -4,18 +4,26 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError
 from sqlalchemy import desc
-from database import SessionLocal
-from utils.security import verify_token, rsa_decrypt_data, decrypt_private_key_for_fe
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from database import SessionLocal, AsyncSessionLocal
+from utils.security import verify_token, verify_token_async, verify_metrics_token, rsa_decrypt_data, decrypt_private_key_for_fe
 from utils.email import send_free_subscription_on_month_email, send_form_for_our_services, send_thank_you, send_business_improvement_tip_email, send_extra_tip_video_email
 from fastapi.security import OAuth2PasswordBearer
 from schemas.form import CreateForm, FormModel, FormModelPublic, UpdateForm, FormWithoutProperties, FormResponseMessagePublic, FormResponseMessageCreate, FormResponseMessageUpdate, UpdateContactLabels, FormPropertyManageModel, TermsAndConditions, PublicOptions
-from crud.form import create_form, get_form, update_form, delete_form, get_users_form_menu, create_response, get_response_by_id, get_plain_response, update_response, create_form_response_message, get_messages_by_response_id, update_form_response_message, count_unseen_responses_by_user_id, delete_response, get_property, delete_all_responses_from_form
+from crud.form import create_form, get_form, update_form, delete_form, get_users_form_menu, create_response, get_response_by_id, get_plain_response, update_response, create_form_response_message, get_messages_by_response_id, update_form_response_message, count_unseen_responses_by_user_id, delete_response, get_property, delete_all_responses_from_form, search_response_ids, reindex_form_responses, send_form_follow_up_emails, get_form_version
+from crud import form_async
 from crud.user import get_user, create_code_for_new_user
 from models.form import Form
+from models.user import User
 from uuid import UUID
 from typing import List, Optional
 from models.form import FormResponse, FormValue
 from fastapi import Query
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from utils.http_cache import make_etag, etag_matches, not_modified, set_cache_headers, PUBLIC_FORM_CACHE_CONTROL
+from utils.ingest import ingest_queue, FORM_INGEST_QUEUE_ENABLED
 from datetime import datetime
 from sqlalchemy.orm import selectinload
 import base64
@@ -46,6 +54,10 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def validate_iso_format(date_str: str) -> datetime:
     try:
         return datetime.fromisoformat(date_str)
@@ -100,11 +112,18 @@ def get_form_by_id(form_id: UUID, token: str = Depends(oauth2_scheme), db: Sessi
     return form
     
 @router.get("/get-public-form/{form_id}", response_model=FormModelPublic)
-def get_form_by_id(form_id: UUID, db: Session = Depends(get_db)):
-    form = get_form(db, form_id)
-    
-    if not form:
+def get_form_by_id(form_id: UUID, request: Request, response: Response, db: Session = Depends(get_db)):
+    form_version = get_form_version(db, form_id)
+
+    if not form_version:
         raise HTTPException(status_code=404, detail="Form not found")
+
+    etag = make_etag("public-form", form_id, *form_version)
+    if etag_matches(request, etag):
+        return not_modified(etag, PUBLIC_FORM_CACHE_CONTROL)
+
+    form = get_form(db, form_id)
+    set_cache_headers(response, etag, PUBLIC_FORM_CACHE_CONTROL)
     return form
     
 @router.put("/update-form/{form_id}", response_model=FormModel)
@@ -141,56 +160,107 @@ async def create_form_response(
     form_id: UUID, 
     request: Request, 
     token: Optional[str] = Depends(get_optional_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    form = get_form(db, form_id)
-    user = get_user(db, form.user_id)
+    form_metadata = await form_async.get_form_metadata(db, form_id)
+    if not form_metadata:
+        raise HTTPException(status_code=404, detail="Form not found")
 
     request_origin = request.headers.get("origin")
 
     if request_origin and "localhost" in request_origin:
-        if not verify_token(db, user.id, token):
+        if not await verify_token_async(db, form_metadata["user_id"], token):
             raise HTTPException(status_code=401, detail="Unauthorized for localhost")
 
-    elif request_origin not in origins and request_origin != f"https://{user.web_url}":
+    elif request_origin not in origins and request_origin != f"https://{form_metadata['web_url']}":
         raise HTTPException(status_code=403, detail="Forbidden: Origin not allowed")
 
     try:
         data = await request.json()
-        create_response(db, form_id, data)
 
-        if str(form_id) == "2aa1a8f2-a82d-4d8f-94b4-dd97abce4981":
-            send_business_improvement_tip_email(data['email'])
-            send_extra_tip_video_email(data['email'])
+        if FORM_INGEST_QUEUE_ENABLED:
+            missing_keys = [key for key in form_metadata["required_keys"] if key not in data]
+            if missing_keys:
+                raise HTTPException(status_code=400, detail=f"Missing required keys: {', '.join(missing_keys)}")
+
+            # Při plné frontě se odpověď uloží synchronně, aby se neztratila
+            if not await run_in_threadpool(ingest_queue.is_full):
+                entry_id, created = await run_in_threadpool(ingest_queue.enqueue, form_id, data, request.headers.get("Idempotency-Key"))
+                return JSONResponse(
+                    status_code=202,
+                    content={"message": "Response accepted", "id": entry_id, "duplicate": not created}
+                )
+
+            ingest_queue.record_overflow()
+
+            idempotency_key = request.headers.get("Idempotency-Key")
+            if idempotency_key:
+                entry_id, created = await run_in_threadpool(ingest_queue.reserve, form_id, idempotency_key)
+                if not created:
+                    return JSONResponse(
+                        status_code=202,
+                        content={"message": "Response accepted", "id": entry_id, "duplicate": True}
+                    )
 
-        if str(form_id) == "5893c160-908e-4f3e-ab51-5a574aa5da70":
-            send_form_for_our_services(data['email'])
+                try:
+                    await form_async.create_response(db, form_id, data, UUID(entry_id))
+                except Exception:
+                    await run_in_threadpool(ingest_queue.release, entry_id)
+                    raise
+
+                await run_in_threadpool(ingest_queue.complete, entry_id, entry_id)
+                send_form_follow_up_emails(form_id, data)
+
+                return {"message": "Successfully created a response"}
+
+        await form_async.create_response(db, form_id, data)
+        send_form_follow_up_emails(form_id, data)
 
         return {"message": "Successfully created a response"}
 
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
+@router.get("/ingest-metrics")
+def get_ingest_metrics(token: str = Depends(oauth2_scheme)):
+    if not verify_metrics_token(token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return ingest_queue.metrics()
+
 @router.get("/property/options/{property_id}", response_model=PublicOptions)
 async def get_form_property_options(
     property_id: UUID, 
     request: Request, 
+    response: Response,
     token: Optional[str] = Depends(get_optional_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    prop, status = get_property(db, property_id)
-    form = get_form(db, prop.form_id)
-    user = get_user(db, form.user_id)
+    options_version = await form_async.get_property_options_version(db, property_id)
+    if not options_version:
+        raise HTTPException(status_code=404, detail="Property not found")
+
+    user_id, web_url, property_updated_at, form_updated_at = options_version
 
     request_origin = request.headers.get("origin")
 
     if request_origin and "localhost" in request_origin:
-        if not verify_token(db, user.id, token):
+        if not await verify_token_async(db, user_id, token):
             raise HTTPException(status_code=401, detail="Unauthorized for localhost")
 
-    elif request_origin not in origins and request_origin != f"https://{user.web_url}":
+    elif request_origin not in origins and request_origin != f"https://{web_url}":
         raise HTTPException(status_code=403, detail="Forbidden: Origin not allowed")
 
+    etag = make_etag("property-options", property_id, property_updated_at, form_updated_at)
+    if etag_matches(request, etag):
+        return not_modified(etag, PUBLIC_FORM_CACHE_CONTROL)
+
+    prop, status = await form_async.get_property(db, property_id)
+    form = await form_async.get_form(db, prop.form_id)
+
+    set_cache_headers(response, etag, PUBLIC_FORM_CACHE_CONTROL)
     return PublicOptions(
         options=prop.options,
         property_name=prop.label,
@@ -233,40 +303,35 @@ def get_form_response(response_id: UUID, request: Request, db: Session = Depends
 async def get_form_table(
     form_id: UUID, 
     request: Request, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     page: int = Query(1, ge=1, description="Page number to retrieve"),
     per_page: int = Query(10, ge=1, le=100, description="Number of items per page"),
     search_query: Optional[str] = Query(None, description="Search query to filter responses"),
     sort_by: Optional[str] = Query("created_at", description="Field to sort by"),
-    sort_order: Optional[str] = Query("desc", description="Sort order: asc or desc")
+    sort_order: Optional[str] = Query("desc", description="Sort order: asc or desc"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor for keyset pagination, empty for the first page")
 ):
     try:
         private_key = request.headers.get("X-Private-Key")
         if not private_key:
             raise HTTPException(status_code=400, detail="Missing X-Private-Key header")
 
-        form = get_form(db, form_id)
+        form = await form_async.get_form(db, form_id)
         if not form:
             raise HTTPException(status_code=404, detail="Form not found")
 
-        query = db.query(FormResponse).filter(FormResponse.form_id == form_id)
+        statement = select(FormResponse).where(FormResponse.form_id == form_id)
 
         if search_query:
-            query = query.filter(
-                FormResponse.some_field.ilike(f"%{search_query}%")
-            )
-
-        if sort_by == "created_at":
-            query = query.order_by(FormResponse.created_at.asc() if sort_order == "asc" else FormResponse.created_at.desc())
-
-        total_responses = query.count()
+            matching_response_ids = search_response_ids(form.user_id, search_query, form_id)
+            if matching_response_ids is not None:
+                statement = statement.where(FormResponse.id.in_(matching_response_ids))
 
-        responses = query.offset((page - 1) * per_page).limit(per_page).all()
+        total_responses = await form_async.count_responses_cached(db, statement, (form_id, search_query))
+        responses, next_cursor = await form_async.paginate_responses(db, statement, page, per_page, sort_by, sort_order, cursor)
 
-        decrypted_responses = []
-        for response in responses:
-            decrypted_response = get_response_by_id(db, response.id, decrypt_private_key_for_fe(private_key))
-            decrypted_responses.append((response, decrypted_response))
+        decrypted_by_id = await form_async.get_decrypted_responses(db, responses, decrypt_private_key_for_fe(private_key))
+        decrypted_responses = [(response, decrypted_by_id[response.id]) for response in responses]
 
         header = [
             {"key": prop.key, "label": prop.label, "position": prop.position, "property_type": prop.property_type}
@@ -297,7 +362,8 @@ async def get_form_table(
                 "page": page,
                 "per_page": per_page,
                 "total_pages": (total_responses + per_page - 1) // per_page,
-                "total_items": total_responses
+                "total_items": total_responses,
+                "next_cursor": next_cursor
             }
         }
 
@@ -310,41 +376,36 @@ async def get_form_table(
 async def get_users_forms_table(
     user_id: UUID, 
     request: Request, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     page: int = Query(1, ge=1, description="Page number to retrieve"),
     per_page: int = Query(10, ge=1, le=100, description="Number of items per page"),
     search_query: Optional[str] = Query(None, description="Search query to filter responses"),
     sort_by: Optional[str] = Query("created_at", description="Field to sort by"),
-    sort_order: Optional[str] = Query("desc", description="Sort order: asc or desc")
+    sort_order: Optional[str] = Query("desc", description="Sort order: asc or desc"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor for keyset pagination, empty for the first page")
 ):
     try:
         private_key = request.headers.get("X-Private-Key")
         if not private_key:
             raise HTTPException(status_code=400, detail="Missing X-Private-Key header")
 
-        forms = db.query(Form).filter(Form.user_id == user_id).options(selectinload(Form.properties)).all()
+        forms = await form_async.get_users_forms(db, user_id)
 
         if not forms:
             raise HTTPException(status_code=404, detail="No forms found for user")
 
-        responses_query = db.query(FormResponse).filter(FormResponse.form_id.in_([f.id for f in forms]))
+        statement = select(FormResponse).where(FormResponse.form_id.in_([f.id for f in forms]))
 
-        if sort_by == "created_at":
-            responses_query = responses_query.order_by(
-                FormResponse.created_at.asc() if sort_order == "asc" else FormResponse.created_at.desc()
-            )
-
-        responses = responses_query.offset((page - 1) * per_page).limit(per_page).all()
+        if search_query:
+            matching_response_ids = search_response_ids(user_id, search_query)
+            if matching_response_ids is not None:
+                statement = statement.where(FormResponse.id.in_(matching_response_ids))
 
-        decrypted_responses = []
-        for response in responses:
-            decrypted_data = get_response_by_id(db, response.id, decrypt_private_key_for_fe(private_key))
-            decrypted_responses.append((response, decrypted_data))
+        total_responses = await form_async.count_responses_cached(db, statement, (user_id, search_query))
+        responses, next_cursor = await form_async.paginate_responses(db, statement, page, per_page, sort_by, sort_order, cursor)
 
-        filtered_responses = []
-        for response, decrypted_response in decrypted_responses:
-            if not search_query or any(search_query.lower() in str(value).lower() for value in decrypted_response.values()):
-                filtered_responses.append((response, decrypted_response))
+        decrypted_by_id = await form_async.get_decrypted_responses(db, responses, decrypt_private_key_for_fe(private_key))
+        decrypted_responses = [(response, decrypted_by_id[response.id]) for response in responses]
 
         common_keys = set(decrypted_responses[0][1].keys()) if decrypted_responses else set()
         for _, decrypted_response in decrypted_responses:
@@ -363,7 +424,7 @@ async def get_users_forms_table(
         ]
 
         body = []
-        for response, decrypted_response in filtered_responses:
+        for response, decrypted_response in decrypted_responses:
             row = {key: decrypted_response.get(key, None) for key in common_keys}
             row["labels"] = response.labels
             row["seen"] = response.seen
@@ -371,7 +432,6 @@ async def get_users_forms_table(
             row["id"] = response.id
             body.append(row)
 
-        total_responses = len(filtered_responses)
         total_pages = (total_responses + per_page - 1) // per_page
 
         return {
@@ -383,7 +443,8 @@ async def get_users_forms_table(
                 "page": page,
                 "per_page": per_page,
                 "total_pages": total_pages,
-                "total_items": total_responses
+                "total_items": total_responses,
+                "next_cursor": next_cursor
             }
         }
 
@@ -392,6 +453,29 @@ async def get_users_forms_table(
     except OperationalError as e:
         raise HTTPException(status_code=500, detail="Database connection failed, please try again later")
 
+@router.post("/reindex/{form_id}")
+def reindex_form(form_id: UUID, request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    try:
+        private_key = request.headers.get("X-Private-Key")
+        if not private_key:
+            raise HTTPException(status_code=400, detail="Missing X-Private-Key header")
+
+        form = get_form(db, form_id)
+        if not form:
+            raise HTTPException(status_code=404, detail="Form not found")
+
+        if not verify_token(db, form.user_id, token):
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+        reindexed_count = reindex_form_responses(db, form_id, decrypt_private_key_for_fe(private_key))
+
+        return {"detail": "Successfully reindexed form responses", "count": reindexed_count}
+
+    except HTTPException as e:
+        raise e
+    except OperationalError as e:
+        raise HTTPException(status_code=500, detail="Database connection failed, please try again later")
+
 @router.get("/get-single-response/{response_id}")
 def get_single_response(response_id: UUID, request: Request, db: Session = Depends(get_db)):
     try:
@@ -523,15 +607,24 @@ def count_unseen_responses_user(user_id: UUID, token: str = Depends(oauth2_schem
     return unseen_count
 
 @router.get("/terms-and-conditions/{form_id}", response_model=TermsAndConditions)
-def count_unseen_responses_user(form_id: UUID, db: Session = Depends(get_db)):
-    form = get_form(db, form_id)
-    if not form:
+def count_unseen_responses_user(form_id: UUID, request: Request, response: Response, db: Session = Depends(get_db)):
+    form_version = get_form_version(db, form_id)
+    if not form_version:
         raise HTTPException(status_code=404, detail="Form not found")
 
-    user = get_user(db, form.user_id)
-    if not user:
+    # Kontaktní údaje patří uživateli, jeho updated_at je součástí verze
+    user_updated_at = db.query(User.updated_at).filter(User.id == form_version[1]).scalar()
+    if not user_updated_at:
         raise HTTPException(status_code=404, detail="User not found")
 
+    etag = make_etag("terms-and-conditions", form_id, *form_version, user_updated_at)
+    if etag_matches(request, etag):
+        return not_modified(etag, PUBLIC_FORM_CACHE_CONTROL)
+
+    form = get_form(db, form_id)
+    user = get_user(db, form.user_id)
+    set_cache_headers(response, etag, PUBLIC_FORM_CACHE_CONTROL)
+
     props = []
 
     for prop in form.properties:
@@ -2,17 +2,19 @@
 
 import random
 from fastapi import APIRouter, Depends, HTTPException, Request, Depends, Query
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 from database import SessionLocal
-from schemas.statistics import StatisticCreate, StatisticUpdate, StatisticValueCreate, Statistic as StatisticSchema, StatisticValue as StatisticValueSchema
-from crud.statistics import create_statistic, get_statistic, get_user_statistics, update_statistic, delete_statistic, create_statistic_value, delete_statistic_value, get_statistic_type, reset_statistic, get_aggregated_statistic_value, reset_user_statistics
-from utils.security import verify_token
+from schemas.statistics import StatisticCreate, StatisticUpdate, StatisticValueCreate, Statistic as StatisticSchema, StatisticValue as StatisticValueSchema, StatisticSeries as StatisticSeriesSchema, StatisticSummary as StatisticSummarySchema, StatisticValuePage as StatisticValuePageSchema
+from crud.statistics import create_statistic, get_statistic, get_user_statistics, update_statistic, delete_statistic, create_statistic_value, delete_statistic_value, get_statistic_metadata, reset_statistic, get_aggregated_statistic_value, reset_user_statistics, resolve_series_range, get_statistic_series, build_statistic_summaries, get_recently_active_statistics, paginate_statistic_values, get_statistic_totals, STATISTIC_SUMMARY_VALUES_LIMIT, STATISTIC_SUMMARY_MAX_VALUES_LIMIT
+from utils.security import verify_token, verify_metrics_token
+from utils.statistics_buffer import statistic_buffer, make_statistic_event, stores_raw_value, STATISTICS_BUFFER_ENABLED
+from starlette.responses import JSONResponse
 from uuid import UUID
 from fastapi.security import OAuth2PasswordBearer
 from models.statistics import Statistic, StatisticValue
 from models.user import User
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 origins = [
     "http://localhost",
@@ -51,9 +53,15 @@ def create_new_statistic(user_id: UUID, statistic: StatisticCreate, token: str =
     new_statistic = create_statistic(db, statistic, user_id)
     return new_statistic
 
-@router.get("/get-statistic/{statistic_id}", response_model=StatisticSchema)
-def read_statistic(statistic_id: UUID, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    statistic = db.query(Statistic).options(joinedload(Statistic.values)).filter(Statistic.id == statistic_id).first()
+@router.get("/get-statistic/{statistic_id}", response_model=StatisticSummarySchema)
+def read_statistic(
+    statistic_id: UUID, 
+    mode: str = Query("full", pattern="^(summary|full)$", description="full (default) returns every value, summary returns the aggregate and the last values_limit values"),
+    values_limit: int = Query(STATISTIC_SUMMARY_VALUES_LIMIT, ge=0, le=STATISTIC_SUMMARY_MAX_VALUES_LIMIT),
+    token: str = Depends(oauth2_scheme), 
+    db: Session = Depends(get_db)
+):
+    statistic = get_statistic(db, statistic_id)
 
     if not statistic:
         raise HTTPException(status_code=404, detail="Statistic not found")
@@ -61,25 +69,63 @@ def read_statistic(statistic_id: UUID, token: str = Depends(oauth2_scheme), db:
     if not verify_token(db, statistic.user_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    return statistic
+    return build_statistic_summaries(db, [statistic], None if mode == "full" else values_limit)[0]
 
-@router.get("/get-users-statistics/{user_id}", response_model=List[StatisticSchema])
+@router.get("/get-users-statistics/{user_id}", response_model=List[StatisticSummarySchema])
 def read_user_statistics(
     user_id: UUID, 
     token: str = Depends(oauth2_scheme), 
     db: Session = Depends(get_db),
-    searchQuery: Optional[str] = Query(None, alias="searchQuery")
+    searchQuery: Optional[str] = Query(None, alias="searchQuery"),
+    mode: str = Query("full", pattern="^(summary|full)$", description="full (default) returns every value, summary returns the aggregate and the last values_limit values"),
+    values_limit: int = Query(STATISTIC_SUMMARY_VALUES_LIMIT, ge=0, le=STATISTIC_SUMMARY_MAX_VALUES_LIMIT)
 ):
     if not verify_token(db, user_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    query = db.query(Statistic).options(joinedload(Statistic.values)).filter(Statistic.user_id == user_id)
+    query = db.query(Statistic).filter(Statistic.user_id == user_id, Statistic.deleted_at == None)
     
     if searchQuery:
         query = query.filter(Statistic.name.ilike(f"%{searchQuery}%"))
     
     statistics = query.all()
-    return statistics
+    return build_statistic_summaries(db, statistics, None if mode == "full" else values_limit)
+
+@router.get("/{statistic_id}/values", response_model=StatisticValuePageSchema)
+def read_statistic_values(
+    statistic_id: UUID,
+    page: int = Query(1, ge=1, description="Page number to retrieve"),
+    per_page: int = Query(50, ge=1, le=500, description="Number of values per page"),
+    sort_order: str = Query("desc", pattern="^(asc|desc)$", description="Sort order: asc or desc"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor for keyset pagination, empty for the first page"),
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    metadata = get_statistic_metadata(db, statistic_id)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="Statistic not found")
+
+    if not verify_token(db, metadata["user_id"], token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    values, next_cursor = paginate_statistic_values(db, statistic_id, page, per_page, sort_order, cursor)
+
+    # Počet z rollupů, bez COUNT(*) přes celou historii; bez ukládání surových hodnot není k dispozici
+    total_items = None
+    if stores_raw_value(metadata["type"]):
+        totals = get_statistic_totals(db, [statistic_id]).get(statistic_id)
+        total_items = int(totals["value_count"]) if totals else 0
+
+    return {
+        "values": values,
+        "pagination": {
+            "page": page,
+            "per_page": per_page,
+            "total_pages": (total_items + per_page - 1) // per_page if total_items is not None else None,
+            "total_items": total_items,
+            "next_cursor": next_cursor
+        }
+    }
 
 @router.delete("/delete-statistic/{statistic_id}")
 def remove_statistic(statistic_id: UUID, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -90,7 +136,8 @@ def remove_statistic(statistic_id: UUID, token: str = Depends(oauth2_scheme), db
     if not verify_token(db, statistic.user_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
     
-    delete_statistic(db, statistic_id)
+    if delete_statistic(db, statistic_id) == 202:
+        return JSONResponse(status_code=202, content={"detail": "Statistic deletion scheduled"})
     return {"detail": "Statistic deleted"}
 
 @router.put("/update-statistic/{statistic_id}", response_model=StatisticSchema)
@@ -113,39 +160,40 @@ def add_statistic_value(
     token: Optional[str] = Depends(get_optional_token),
     db: Session = Depends(get_db)
 ):
-    statistic_type = get_statistic_type(db, statistic_id)
-    if not statistic_type:
+    metadata = get_statistic_metadata(db, statistic_id)
+    if not metadata:
         raise HTTPException(status_code=404, detail="Statistic not found")
 
-    statistic = get_statistic(db, statistic_id)
-    if not statistic:
-        raise HTTPException(status_code=404, detail="Statistic not found")
-
-    user = get_user(db, statistic.user_id)
-    if not user:
+    if not metadata["user_id"]:
         raise HTTPException(status_code=404, detail="User not found")
     
     request_origin = request.headers.get("origin")
 
     if request_origin and "localhost" in request_origin:
-        if not verify_token(db, user.id, token):
+        if not verify_token(db, metadata["user_id"], token):
             raise HTTPException(status_code=401, detail="Unauthorized for localhost")
 
-    elif request_origin not in origins and request_origin != f"https://{user.web_url}":
+    elif request_origin not in origins and request_origin != f"https://{metadata['web_url']}":
         raise HTTPException(status_code=403, detail="Forbidden: Origin not allowed")
 
-    if statistic_type == "number" and value.number is not None:
-        new_value = create_statistic_value(db, statistic_id, value)
-    elif statistic_type == "boolean" and value.boolean is not None:
-        new_value = create_statistic_value(db, statistic_id, value)
-    elif statistic_type == "text" and value.text is not None:
-        new_value = create_statistic_value(db, statistic_id, value)
-    elif statistic_type == "time" and value.time is not None:
-        new_value = create_statistic_value(db, statistic_id, value)
-    else:
+    statistic_type = metadata["type"]
+
+    if statistic_type not in ("number", "boolean", "text", "time") or getattr(value, statistic_type) is None:
         raise HTTPException(status_code=400, detail="Invalid value for statistic type")
 
-    return new_value
+    # Hodnota se zapíše do DB hromadně při dalším flushi, do té doby je v journalu
+    if STATISTICS_BUFFER_ENABLED:
+        statistic_buffer.add(make_statistic_event(statistic_id, statistic_type, value))
+        return JSONResponse(status_code=202, content={"message": "Value accepted"})
+
+    return create_statistic_value(db, statistic_id, statistic_type, value)
+
+@router.get("/buffer-metrics")
+def get_buffer_metrics(token: str = Depends(oauth2_scheme)):
+    if not verify_metrics_token(token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return statistic_buffer.metrics()
 
 @router.get("/value/{statistic_id}")
 def get_statistic_value(
@@ -176,6 +224,27 @@ def get_statistic_value(
         raise HTTPException(status_code=404, detail="Statistic not found or invalid type.")
     return result
 
+@router.get("/{statistic_id}/series", response_model=StatisticSeriesSchema)
+def read_statistic_series(
+    statistic_id: UUID,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: str = Query("day", pattern="^(hour|day|week)$"),
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    metadata = get_statistic_metadata(db, statistic_id)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="Statistic not found")
+
+    if not verify_token(db, metadata["user_id"], token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    start, end = resolve_series_range(bucket, start, end)
+    series = get_statistic_series(db, statistic_id, metadata["type"], bucket, start, end)
+
+    return {"statistic_id": statistic_id, "type": metadata["type"], "bucket": bucket, "start": start, "end": end, **series}
+
 @router.post("/delete-statistic-value/{statistic_id}")
 def remove_statistic_value(statistic_id: UUID, db: Session = Depends(get_db)):
     if not delete_statistic_value(db, statistic_id):
@@ -183,11 +252,16 @@ def remove_statistic_value(statistic_id: UUID, db: Session = Depends(get_db)):
     return {"detail": "Statistic value deleted"}
 
 @router.delete("/reset/{statistic_id}")
-def read_user_statistics(statistic_id: UUID, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    statistic = get_statistic(db, statistic_id)
-    if not verify_token(db, statistic.user_id, token):
+def reset_statistic_endpoint(statistic_id: UUID, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    metadata = get_statistic_metadata(db, statistic_id)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="Statistic not found")
+
+    if not verify_token(db, metadata["user_id"], token):
         raise HTTPException(status_code=401, detail="Unauthorized")
-    reset_statistic(db, statistic_id)
+
+    if reset_statistic(db, statistic_id) == 202:
+        return JSONResponse(status_code=202, content={"detail": "Statistic reset scheduled."})
     return { "detail": "Successfully reseted statistic." }
 
 @router.delete("/reset-user-statistics/{user_id}")
@@ -199,23 +273,24 @@ def reset_user_statistics_endpoint(
     if not verify_token(db, user_id, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    reset_user_statistics(db, user_id)
+    if reset_user_statistics(db, user_id) == 202:
+        return JSONResponse(status_code=202, content={"detail": "Reset of all statistics for the user scheduled."})
     return {"detail": "Successfully reset all statistics for the user."}
 
-@router.get("/random-statistics/{user_id}", response_model=List[StatisticSchema])
-def get_random_statistics(user_id: UUID, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    one_week_ago = datetime.now() - timedelta(weeks=1)
+@router.get("/random-statistics/{user_id}", response_model=List[StatisticSummarySchema])
+def get_random_statistics(
+    user_id: UUID, 
+    values_limit: int = Query(STATISTIC_SUMMARY_VALUES_LIMIT, ge=0, le=STATISTIC_SUMMARY_MAX_VALUES_LIMIT),
+    token: str = Depends(oauth2_scheme), 
+    db: Session = Depends(get_db)
+):
+    one_week_ago = datetime.now(timezone.utc) - timedelta(weeks=1)
 
-    statistics = db.query(Statistic).join(Statistic.values).filter(Statistic.user_id == user_id, StatisticValue.created_at >= one_week_ago).all()
+    statistics = get_recently_active_statistics(db, user_id, one_week_ago)
     
     if not statistics:
         return []
-
-
-    if len(statistics) == 0:
-        raise HTTPException(status_code=404, detail="No statistics found for this week.")
     
     random_statistics = random.sample(statistics, min(len(statistics), 3))
 
-    return random_statistics
-
+    return build_statistic_summaries(db, random_statistics, values_limit)
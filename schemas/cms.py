@@ -2,7 +2,7 @@
 
 from pydantic import BaseModel
 from uuid import UUID
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal, Union
 from datetime import datetime
 
 class RootContentLight(BaseModel):
@@ -65,4 +65,28 @@ class ContentWithProperties(BaseModel):
 
 class ReorderRequest(BaseModel):
     new_order: List[int]
- 
\ No newline at end of file
+ 
+class ContentBatchOperation(BaseModel):
+    # content_id/property_id může být "$<ref>" z dřívější operace téže dávky,
+    # "$<ref>" jako content_id je content nově vytvořené property
+    op: Literal[
+        "update_content",
+        "create_property",
+        "update_property",
+        "delete_property",
+        "create_list_item",
+        "add_list_item_property",
+        "delete_list_item",
+        "reorder_list_item_content",
+    ]
+    ref: Optional[str] = None
+    content_id: Optional[Union[UUID, str]] = None
+    property_id: Optional[Union[UUID, str]] = None
+    root_id: Optional[UUID] = None
+    index: Optional[int] = None
+    key: Optional[str] = None
+    new_order: Optional[List[int]] = None
+    content: Optional[ContentUpdate] = None
+
+class ContentBatchRequest(BaseModel):
+    operations: List[ContentBatchOperation]
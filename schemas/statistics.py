@@ -3,7 +3,7 @@
 from pydantic import BaseModel, validator
 from uuid import UUID
 from datetime import datetime, time
-from typing import Optional, List
+from typing import Optional, List, Any
 
 class StatisticCreate(BaseModel):
     name: str
@@ -64,3 +64,30 @@ class Statistic(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
+class StatisticSeries(BaseModel):
+    statistic_id: UUID
+    type: str
+    bucket: str
+    start: datetime
+    end: datetime
+    timestamps: List[datetime]
+    counts: List[int]
+    values: List[Optional[float]]
+    false_values: Optional[List[int]] = None
+
+class StatisticSummary(BaseModel):
+    id: UUID
+    name: str
+    description: Optional[str] = None
+    icon: Optional[str] = None
+    type: str
+    user_id: UUID
+    created_at: datetime
+    updated_at: datetime
+    value_count: int = 0
+    aggregate: Optional[Any] = None
+    values: List[StatisticValue] = []
+
+class StatisticValuePage(BaseModel):
+    values: List[StatisticValue]
+    pagination: dict
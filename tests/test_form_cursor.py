@@ -0,0 +1,38 @@
+# tests/test_form_cursor.py
+
+import pytest
+from types import SimpleNamespace
+from base64 import urlsafe_b64encode
+from datetime import datetime, timezone
+from uuid import uuid4
+from fastapi import HTTPException
+from crud.form import encode_response_cursor, decode_response_cursor
+
+def encode_payload(payload: str) -> str:
+    return urlsafe_b64encode(payload.encode()).decode()
+
+def test_cursor_round_trip():
+    response = SimpleNamespace(id=uuid4(), created_at=datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc))
+
+    assert decode_response_cursor(encode_response_cursor(response)) == (response.created_at, response.id)
+
+def test_cursor_is_url_safe():
+    response = SimpleNamespace(id=uuid4(), created_at=datetime.now(timezone.utc))
+    cursor = encode_response_cursor(response)
+
+    assert all(c not in cursor for c in "+/")
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    encode_payload("not json"),
+    encode_payload('{"id": "%s"}' % uuid4()),
+    encode_payload('{"created_at": "2024-05-01T12:00:00+00:00"}'),
+    encode_payload('{"created_at": "yesterday", "id": "%s"}' % uuid4()),
+    encode_payload('{"created_at": "2024-05-01T12:00:00+00:00", "id": "not-a-uuid"}'),
+    encode_payload('["2024-05-01T12:00:00+00:00"]'),
+])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_response_cursor(cursor)
+
+    assert error.value.status_code == 400
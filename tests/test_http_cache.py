@@ -0,0 +1,37 @@
+# tests/test_http_cache.py
+
+import pytest
+from starlette.requests import Request
+from utils.http_cache import make_etag, etag_matches
+
+ETAG = make_etag("root", "2024-05-01T12:00:00+00:00")
+
+def request_with(if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+def test_make_etag_is_quoted_and_stable():
+    assert ETAG.startswith('"') and ETAG.endswith('"')
+    assert make_etag("root", "2024-05-01T12:00:00+00:00") == ETAG
+    assert make_etag("root", "2024-05-02T12:00:00+00:00") != ETAG
+
+@pytest.mark.parametrize("if_none_match", [
+    ETAG,
+    f"W/{ETAG}",
+    f'"other", {ETAG}',
+    f'"other",W/{ETAG} , "another"',
+    "*",
+    " * ",
+])
+def test_etag_matches(if_none_match):
+    assert etag_matches(request_with(if_none_match), ETAG)
+
+@pytest.mark.parametrize("if_none_match", [
+    None,
+    "",
+    '"other"',
+    '"other", W/"another"',
+    ETAG.strip('"'),
+])
+def test_etag_does_not_match(if_none_match):
+    assert not etag_matches(request_with(if_none_match), ETAG)
@@ -0,0 +1,171 @@
+# tests/test_ingest.py
+
+import time
+import sqlite3
+import pytest
+from uuid import UUID, uuid4
+import crud.form as form
+import utils.ingest as ingest
+from utils.ingest import IngestQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    return IngestQueue(str(tmp_path / "form_ingest_queue.db"), "test-secret")
+
+def entry_row(queue: IngestQueue, entry_id: str):
+    connection = sqlite3.connect(queue.path)
+    try:
+        return connection.execute("SELECT status, attempts, payload, response_id FROM form_ingest_queue WHERE id = ?", (entry_id,)).fetchone()
+    finally:
+        connection.close()
+
+def test_enqueue_and_claim_round_trip(queue):
+    form_id = uuid4()
+    entry_id, created = queue.enqueue(form_id, {"email": "a@b.cz"})
+
+    assert created
+    assert queue.depth() == 1
+    assert b"a@b.cz" not in entry_row(queue, entry_id)[2]
+    assert queue.claim_batch(10) == [(entry_id, str(form_id), {"email": "a@b.cz"})]
+    assert queue.claim_batch(10) == []
+
+def test_duplicate_idempotency_key_returns_existing_entry(queue):
+    form_id = uuid4()
+    entry_id, created = queue.enqueue(form_id, {"n": 1}, "key-1")
+    duplicate_id, duplicate_created = queue.enqueue(form_id, {"n": 2}, "key-1")
+
+    assert created and not duplicate_created
+    assert duplicate_id == entry_id
+    assert queue.depth() == 1
+    assert queue.counters["duplicates"] == 1
+
+    # Stejný klíč u jiného formuláře je jiná položka
+    assert queue.enqueue(uuid4(), {"n": 3}, "key-1")[1]
+
+def test_reserve_blocks_the_key_until_released(queue):
+    form_id = uuid4()
+    entry_id, created = queue.reserve(form_id, "key-1")
+
+    assert created
+    assert queue.enqueue(form_id, {}, "key-1") == (entry_id, False)
+    assert queue.reserve(form_id, "key-1") == (entry_id, False)
+
+    queue.release(entry_id)
+    assert queue.enqueue(form_id, {}, "key-1")[1]
+
+def test_stale_claim_is_reclaimed(queue, monkeypatch):
+    entry_id, _ = queue.enqueue(uuid4(), {})
+    assert len(queue.claim_batch(10)) == 1
+    assert queue.claim_batch(10) == []
+
+    now = time.time()
+    monkeypatch.setattr(ingest.time, "time", lambda: now + ingest.FORM_INGEST_CLAIM_TIMEOUT_SECONDS + 1)
+
+    assert [row[0] for row in queue.claim_batch(10)] == [entry_id]
+    assert entry_row(queue, entry_id)[:2] == ("processing", 2)
+
+def test_fail_retries_until_max_attempts(queue, monkeypatch):
+    monkeypatch.setattr(ingest, "FORM_INGEST_MAX_ATTEMPTS", 2)
+    entry_id, _ = queue.enqueue(uuid4(), {})
+
+    queue.claim_batch(10)
+    queue.fail(entry_id, "db down")
+    assert entry_row(queue, entry_id)[0] == "pending"
+
+    queue.claim_batch(10)
+    queue.fail(entry_id, "db down")
+    status, attempts, payload, _ = entry_row(queue, entry_id)
+    assert (status, attempts, payload) == ("failed", 2, None)
+
+def test_fail_without_retry_is_final(queue):
+    entry_id, _ = queue.enqueue(uuid4(), {})
+    queue.claim_batch(10)
+    queue.fail(entry_id, "Form not found", retry=False)
+
+    assert entry_row(queue, entry_id)[0] == "failed"
+    assert queue.claim_batch(10) == []
+
+def test_prune_removes_only_old_done_entries(queue, monkeypatch):
+    done_id, _ = queue.enqueue(uuid4(), {})
+    pending_id, _ = queue.enqueue(uuid4(), {})
+    queue.claim_batch(1)
+    queue.complete(done_id, done_id)
+
+    now = time.time()
+    monkeypatch.setattr(ingest.time, "time", lambda: now + ingest.FORM_INGEST_RETENTION_SECONDS + 1)
+    queue.prune()
+
+    assert entry_row(queue, done_id) is None
+    assert entry_row(queue, pending_id)[0] == "pending"
+
+class StubQuery:
+    def __init__(self, existing_ids: set):
+        self.existing_ids = existing_ids
+        self.response_id = None
+
+    def filter(self, condition):
+        self.response_id = condition.right.value
+        return self
+
+    def first(self):
+        return (self.response_id,) if self.response_id in self.existing_ids else None
+
+class StubSession:
+    def __init__(self, existing_ids: set):
+        self.existing_ids = existing_ids
+        self.rollbacks = 0
+
+    def query(self, *columns):
+        return StubQuery(self.existing_ids)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+@pytest.fixture
+def drain(queue, monkeypatch):
+    created = []
+
+    def create_response(db, form_id, data, response_id):
+        created.append(response_id)
+        db.existing_ids.add(response_id)
+        return response_id
+
+    monkeypatch.setattr(form, "ingest_queue", queue)
+    monkeypatch.setattr(form, "create_response", create_response)
+    monkeypatch.setattr(form, "send_form_follow_up_emails", lambda form_id, data: None)
+
+    return created
+
+def test_drain_stores_each_entry_once(queue, drain):
+    entry_id, _ = queue.enqueue(uuid4(), {"email": "a@b.cz"})
+    db = StubSession(set())
+
+    assert form.drain_form_ingest_queue(db) == 1
+    assert drain == [UUID(entry_id)]
+    assert entry_row(queue, entry_id)[0] == "done"
+    assert form.drain_form_ingest_queue(db) == 0
+
+def test_drain_skips_response_stored_before_a_crash(queue, drain, monkeypatch):
+    # Worker uložil odpověď, ale spadl před complete(); položka se po timeoutu vrátí do fronty
+    entry_id, _ = queue.enqueue(uuid4(), {"email": "a@b.cz"})
+    queue.claim_batch(10)
+    db = StubSession({UUID(entry_id)})
+
+    now = time.time()
+    monkeypatch.setattr(ingest.time, "time", lambda: now + ingest.FORM_INGEST_CLAIM_TIMEOUT_SECONDS + 1)
+
+    assert form.drain_form_ingest_queue(db) == 0
+    assert drain == []
+    assert entry_row(queue, entry_id)[0::3] == ("done", entry_id)
+
+def test_drain_fails_entry_of_missing_form_without_retry(queue, drain, monkeypatch):
+    def create_response(db, form_id, data, response_id):
+        raise form.HTTPException(status_code=404, detail="Form not found")
+
+    monkeypatch.setattr(form, "create_response", create_response)
+    entry_id, _ = queue.enqueue(uuid4(), {})
+    db = StubSession(set())
+
+    assert form.drain_form_ingest_queue(db) == 0
+    assert db.rollbacks == 1
+    assert entry_row(queue, entry_id)[0] == "failed"
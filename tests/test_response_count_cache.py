@@ -0,0 +1,36 @@
+# tests/test_response_count_cache.py
+
+import pytest
+import crud.form as form
+from crud.form import cache_response_count, get_cached_response_count
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(form, "_response_count_cache", form.OrderedDict())
+    monkeypatch.setattr(form, "RESPONSE_COUNT_CACHE_MAX_SIZE", 3)
+
+def test_cache_is_bounded_and_evicts_least_recently_used():
+    for owner in range(3):
+        cache_response_count((owner,), owner)
+
+    assert get_cached_response_count((0,)) == 0
+    cache_response_count((3,), 3)
+
+    assert list(form._response_count_cache) == [(2,), (0,), (3,)]
+
+def test_expired_entries_are_purged(monkeypatch):
+    monkeypatch.setattr(form, "RESPONSE_COUNT_CACHE_TTL_SECONDS", -1)
+    cache_response_count(("expired",), 1)
+    monkeypatch.setattr(form, "RESPONSE_COUNT_CACHE_TTL_SECONDS", 60)
+
+    assert get_cached_response_count(("expired",)) is None
+    assert ("expired",) not in form._response_count_cache
+
+    cache_response_count(("old",), 1)
+    monkeypatch.setattr(form, "RESPONSE_COUNT_CACHE_TTL_SECONDS", -1)
+    cache_response_count(("stale",), 2)
+    monkeypatch.setattr(form, "RESPONSE_COUNT_CACHE_TTL_SECONDS", 60)
+    form._response_count_cache.move_to_end(("old",))
+    cache_response_count(("new",), 3)
+
+    assert list(form._response_count_cache) == [("old",), ("new",)]
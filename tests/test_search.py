@@ -0,0 +1,33 @@
+# tests/test_search.py
+
+from uuid import uuid4
+from utils.search import normalize_text, split_words, blind_token, index_tokens, query_tokens, SEARCH_PREFIX_MIN_LENGTH, SEARCH_WORD_MAX_LENGTH
+
+USER_ID = uuid4()
+
+def test_normalize_text_strips_diacritics_and_case():
+    assert normalize_text("Šťastný Člověk") == "stastny clovek"
+
+def test_split_words_on_punctuation():
+    assert split_words("Jan.Novák@Example.cz, +420 123") == ["jan", "novak", "example", "cz", "420", "123"]
+
+def test_split_words_truncates_long_words():
+    assert split_words("a" * (SEARCH_WORD_MAX_LENGTH + 10)) == ["a" * SEARCH_WORD_MAX_LENGTH]
+
+def test_index_tokens_contain_word_and_prefixes():
+    tokens = index_tokens(USER_ID, "Novák")
+
+    assert tokens == {blind_token(USER_ID, prefix) for prefix in ("nov", "nova", "novak")}
+
+def test_index_tokens_skip_short_prefixes():
+    tokens = index_tokens(USER_ID, "novak")
+
+    assert blind_token(USER_ID, "novak"[:SEARCH_PREFIX_MIN_LENGTH - 1]) not in tokens
+    assert index_tokens(USER_ID, "ab") == {blind_token(USER_ID, "ab")}
+
+def test_query_matches_prefix_regardless_of_diacritics():
+    assert query_tokens(USER_ID, "NOV") <= index_tokens(USER_ID, "Novák")
+    assert query_tokens(USER_ID, "novák") <= index_tokens(USER_ID, "Novak")
+
+def test_tokens_differ_between_users():
+    assert blind_token(USER_ID, "novak") != blind_token(uuid4(), "novak")
@@ -0,0 +1,56 @@
+# tests/test_security.py
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import serialization
+from utils.security import generate_key_pair, generate_data_key, wrap_data_key, unwrap_data_key, aes_encrypt_data, rsa_encrypt_data, decrypt_value, is_aes_encrypted
+
+@pytest.fixture(scope="module")
+def key_pair():
+    private_key, public_key = generate_key_pair()
+    private_key_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ).decode('utf-8')
+    public_key_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('utf-8')
+    return private_key_pem, public_key_pem
+
+def test_envelope_round_trip(key_pair):
+    private_key_pem, public_key_pem = key_pair
+    data_key = generate_data_key()
+    wrapped_data_key = wrap_data_key(data_key, public_key_pem)
+
+    encrypted = aes_encrypt_data("Příliš žluťoučký kůň", data_key)
+
+    assert is_aes_encrypted(encrypted)
+    assert decrypt_value(encrypted, private_key_pem, unwrap_data_key(wrapped_data_key, private_key_pem)) == "Příliš žluťoučký kůň"
+
+def test_envelope_uses_fresh_nonce():
+    data_key = generate_data_key()
+    assert aes_encrypt_data("same value", data_key) != aes_encrypt_data("same value", data_key)
+
+def test_envelope_rejects_wrong_data_key(key_pair):
+    private_key_pem, _ = key_pair
+    encrypted = aes_encrypt_data("secret", generate_data_key())
+
+    with pytest.raises(InvalidTag):
+        decrypt_value(encrypted, private_key_pem, generate_data_key())
+
+def test_envelope_requires_data_key(key_pair):
+    private_key_pem, _ = key_pair
+    encrypted = aes_encrypt_data("secret", generate_data_key())
+
+    with pytest.raises(ValueError):
+        decrypt_value(encrypted, private_key_pem)
+
+def test_legacy_rsa_value_without_data_key(key_pair):
+    private_key_pem, public_key_pem = key_pair
+    encrypted = rsa_encrypt_data("legacy value", public_key_pem)
+
+    assert not is_aes_encrypted(encrypted)
+    assert decrypt_value(encrypted, private_key_pem) == "legacy value"
+    assert decrypt_value(encrypted, private_key_pem, None) == "legacy value"
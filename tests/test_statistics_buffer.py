@@ -0,0 +1,116 @@
+# tests/test_statistics_buffer.py
+
+import os
+import pytest
+from types import SimpleNamespace
+from datetime import datetime, timezone, timedelta
+from utils.statistics_buffer import StatisticBuffer, make_statistic_event, rollup_increments, truncate_to_bucket
+
+def number_event(statistic_id: str, number: int, created_at: datetime = None) -> dict:
+    event = make_statistic_event(statistic_id, "number", SimpleNamespace(time=None, number=number, boolean=None, text=None))
+    if created_at:
+        event["created_at"] = created_at.isoformat()
+    return event
+
+def crash(buffer: StatisticBuffer):
+    # Zavřený journal pustí zámek stejně jako ukončený proces workeru
+    buffer._journal[1].close()
+
+@pytest.fixture
+def journal_dir(tmp_path):
+    return str(tmp_path / "journal")
+
+def test_truncate_to_bucket_uses_utc():
+    created_at = datetime(2024, 3, 10, 1, 45, 30, tzinfo=timezone(timedelta(hours=2)))
+
+    assert truncate_to_bucket(created_at, "hour") == datetime(2024, 3, 9, 23, 0, tzinfo=timezone.utc)
+    assert truncate_to_bucket(created_at, "day") == datetime(2024, 3, 9, tzinfo=timezone.utc)
+    assert truncate_to_bucket(created_at, "week") == datetime(2024, 3, 4, tzinfo=timezone.utc)
+
+def test_rollup_increments_merge_by_hour_and_day_bucket():
+    events = [
+        number_event("a", 2, datetime(2024, 3, 9, 23, 10, tzinfo=timezone.utc)),
+        number_event("a", 3, datetime(2024, 3, 9, 23, 50, tzinfo=timezone.utc)),
+        number_event("a", 5, datetime(2024, 3, 10, 0, 5, tzinfo=timezone.utc)),
+    ]
+
+    increments = rollup_increments(events)
+
+    assert increments[("a", "hour", datetime(2024, 3, 9, 23, tzinfo=timezone.utc))] == (2, 5, 0, 0, 0)
+    assert increments[("a", "hour", datetime(2024, 3, 10, 0, tzinfo=timezone.utc))] == (1, 5, 0, 0, 0)
+    assert increments[("a", "day", datetime(2024, 3, 9, tzinfo=timezone.utc))] == (2, 5, 0, 0, 0)
+    assert increments[("a", "day", datetime(2024, 3, 10, tzinfo=timezone.utc))] == (1, 5, 0, 0, 0)
+    assert rollup_increments(events[:1], sign=-1)[("a", "day", datetime(2024, 3, 9, tzinfo=timezone.utc))] == (-1, -2, 0, 0, 0)
+
+def test_flush_writes_events_and_removes_journal(journal_dir):
+    buffer = StatisticBuffer(journal_dir, 100, False)
+    buffer.add(number_event("a", 1))
+    buffer.add(number_event("a", 2))
+    written = []
+
+    assert buffer.flush(lambda events, journal_names: written.append((events, journal_names))) == 2
+    assert [event["number"] for event in written[0][0]] == [1, 2]
+    assert os.listdir(journal_dir) == []
+    assert buffer.flush(lambda events, journal_names: written.append(events)) == 0
+
+def test_failed_flush_keeps_events_for_next_attempt(journal_dir):
+    buffer = StatisticBuffer(journal_dir, 100, False)
+    buffer.add(number_event("a", 1))
+
+    def failing_writer(events, journal_names):
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        buffer.flush(failing_writer)
+
+    assert buffer.metrics()["pending"] == 1
+    assert buffer.flush(lambda events, journal_names: None) == 1
+    assert os.listdir(journal_dir) == []
+
+def test_recover_replays_journal_of_crashed_worker(journal_dir):
+    crashed = StatisticBuffer(journal_dir, 100, False)
+    crashed.add(number_event("a", 1))
+    crashed.add(number_event("a", 2))
+    crash(crashed)
+
+    buffer = StatisticBuffer(journal_dir, 100, False)
+    written = []
+
+    assert buffer.recover(lambda journal_names: set()) == 2
+    assert buffer.flush(lambda events, journal_names: written.append(events)) == 2
+    assert [event["number"] for event in written[0]] == [1, 2]
+    assert os.listdir(journal_dir) == []
+
+def test_recover_skips_journal_of_live_worker(journal_dir):
+    live = StatisticBuffer(journal_dir, 100, False)
+    live.add(number_event("a", 1))
+
+    assert StatisticBuffer(journal_dir, 100, False).recover() == 0
+    assert len(os.listdir(journal_dir)) == 1
+
+def test_recover_deletes_already_flushed_journal(journal_dir):
+    crashed = StatisticBuffer(journal_dir, 100, False)
+    crashed.add(number_event("a", 1))
+    journal_name = os.path.basename(crashed._journal[0])
+    crash(crashed)
+
+    requested = []
+
+    def flushed_journals(journal_names):
+        requested.extend(journal_names)
+        return {journal_name}
+
+    buffer = StatisticBuffer(journal_dir, 100, False)
+
+    assert buffer.recover(flushed_journals) == 0
+    assert requested == [journal_name]
+    assert os.listdir(journal_dir) == []
+    assert buffer.metrics()["pending"] == 0
+
+def test_recover_ignores_truncated_last_line(journal_dir):
+    crashed = StatisticBuffer(journal_dir, 100, False)
+    crashed.add(number_event("a", 1))
+    crashed._journal[1].write('{"id": "trunc')
+    crash(crashed)
+
+    assert StatisticBuffer(journal_dir, 100, False).recover() == 1
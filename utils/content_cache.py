@@ -0,0 +1,132 @@
+# utils/content_cache
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONTENT_SNAPSHOT_CACHE_MAX_SIZE = int(os.getenv("CONTENT_SNAPSHOT_CACHE_MAX_SIZE", "1000"))
+CONTENT_SNAPSHOT_TTL_SECONDS = int(os.getenv("CONTENT_SNAPSHOT_TTL_SECONDS", "3600"))
+CONTENT_SNAPSHOT_REDIS_URL = os.getenv("CONTENT_SNAPSHOT_REDIS_URL") or os.getenv("REDIS_URL")
+CONTENT_SNAPSHOT_KEY_PREFIX = "brandoo:content-snapshot:"
+CONTENT_SNAPSHOT_CHANNEL = "brandoo:content-snapshot-invalidation"
+
+class PublicContentCache:
+    """
+    Rendered public CMS snapshots keyed by root content id.
+    In-process LRU in front of an optional shared Redis store, invalidated by CMS writes.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._redis = None
+        self._lock = threading.Lock()
+
+    def enable_redis(self, redis_url: str):
+        # Snapshot sdílí všechny workery, invalidace lokálních LRU jde přes pub/sub
+        import redis
+
+        self._redis = redis.Redis.from_url(redis_url)
+
+        def listen():
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CONTENT_SNAPSHOT_CHANNEL)
+            for message in pubsub.listen():
+                self.invalidate(message["data"].decode(), propagate=False)
+
+        threading.Thread(target=listen, name="content-snapshot-invalidation", daemon=True).start()
+
+    def get_or_build(self, root_id, builder):
+        cache_key = str(root_id)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self._entries.pop(cache_key, None)
+            generation = self._generations.get(cache_key, 0)
+
+        snapshot = self._get_shared(cache_key)
+        if snapshot is not None:
+            with self._lock:
+                self.shared_hits += 1
+        else:
+            with self._lock:
+                self.misses += 1
+            snapshot = builder()
+            if snapshot is None:
+                return None
+
+        with self._lock:
+            # Zápis během sestavování snapshot zneplatnil, neukládáme ho
+            if self._generations.get(cache_key, 0) != generation:
+                return snapshot
+            self._entries[cache_key] = (snapshot, now + self.ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        self._set_shared(cache_key, snapshot)
+
+        return snapshot
+
+    def invalidate(self, root_id, propagate: bool = True):
+        cache_key = str(root_id)
+
+        with self._lock:
+            self._entries.pop(cache_key, None)
+            self._generations[cache_key] = self._generations.get(cache_key, 0) + 1
+
+        if propagate and self._redis:
+            try:
+                self._redis.delete(CONTENT_SNAPSHOT_KEY_PREFIX + cache_key)
+                self._redis.publish(CONTENT_SNAPSHOT_CHANNEL, cache_key)
+            except Exception as e:
+                logging.error(f"Content snapshot invalidation failed: {e}")
+
+    def _get_shared(self, cache_key: str):
+        if not self._redis:
+            return None
+        try:
+            payload = self._redis.get(CONTENT_SNAPSHOT_KEY_PREFIX + cache_key)
+            return json.loads(payload) if payload else None
+        except Exception as e:
+            logging.error(f"Content snapshot read failed: {e}")
+            return None
+
+    def _set_shared(self, cache_key: str, snapshot: dict):
+        if not self._redis:
+            return
+        try:
+            self._redis.set(CONTENT_SNAPSHOT_KEY_PREFIX + cache_key, json.dumps(snapshot), ex=self.ttl)
+        except Exception as e:
+            logging.error(f"Content snapshot write failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "shared_store": self._redis is not None,
+            }
+
+public_content_cache = PublicContentCache(CONTENT_SNAPSHOT_CACHE_MAX_SIZE, CONTENT_SNAPSHOT_TTL_SECONDS)
+
+if CONTENT_SNAPSHOT_REDIS_URL:
+    public_content_cache.enable_redis(CONTENT_SNAPSHOT_REDIS_URL)
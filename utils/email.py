@@ -1,84 +1,243 @@
-import smtplib
+import asyncio
+import logging
+import queue
+import threading
+import time
+import uuid
+import aiosmtplib
+from collections import OrderedDict
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 from dotenv import load_dotenv
 from typing import Optional
+from jinja2 import Environment
 
-def getEmailHtml(title: str, subtitle: str, code: str = None):
-    code_html = f"<strong style='font-size: 32px; color: white; padding: 20px 0px;'>{code}</strong>" if code else ""
-    logo_url = "https://www.brandoo.cz/brandoo-logo-white.png"
-    
-    return f"""
+jinja_env = Environment(autoescape=True)
+
+CODE_EMAIL_TEMPLATE = """
             <div style="text-align: center; background: #006fee; padding: 20px;">
-                <h1 style="font-size: 24px; margin: 0; color: white;">{title}</h1>
-                <p style="margin: 5px 0; color: white;">{subtitle}</p>
-                <p style="margin: 5px 0; color: white;">{code_html}</p>
-                <img src="{logo_url}" alt="Logo" style="width: 150px; height: auto; margin-bottom: 20px;" />
+                <h1 style="font-size: 24px; margin: 0; color: white;">{{ title }}</h1>
+                <p style="margin: 5px 0; color: white;">{{ subtitle }}</p>
+                <p style="margin: 5px 0; color: white;">{% if code %}<strong style='font-size: 32px; color: white; padding: 20px 0px;'>{{ code }}</strong>{% endif %}</p>
+                <img src="{{ logo_url }}" alt="Logo" style="width: 150px; height: auto; margin-bottom: 20px;" />
             </div>
         """
 
+LOGO_URL = "https://www.brandoo.cz/brandoo-logo-white.png"
+
+compiled_code_email_template = jinja_env.from_string(CODE_EMAIL_TEMPLATE)
+
+def getEmailHtml(title: str, subtitle: str, code: str = None):
+    return compiled_code_email_template.render(title=title, subtitle=subtitle, code=code, logo_url=LOGO_URL)
+
 load_dotenv()
 
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
-def send_email(subject: str, recipient: str, body: str):
-    sender_email = EMAIL_ADDRESS
+# Pro lokální testování stačí SMTP_HOST=localhost SMTP_PORT=1025 SMTP_STARTTLS=false SMTP_LOGIN=false
+# a debugovací server, např. `python -m aiosmtpd -n -l localhost:1025`
+SMTP_HOST = os.getenv("SMTP_HOST", "wes1-smtp.wedos.net")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_LOGIN = os.getenv("SMTP_LOGIN", "true").lower() == "true"
+SMTP_TIMEOUT_SECONDS = int(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+SMTP_IDLE_TIMEOUT_SECONDS = int(os.getenv("SMTP_IDLE_TIMEOUT_SECONDS", "60"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BACKOFF_SECONDS = int(os.getenv("EMAIL_RETRY_BACKOFF_SECONDS", "5"))
+EMAIL_STATUS_HISTORY_SIZE = 10000
+
+def build_message(subject: str, recipient: str, body_part: MIMEText) -> MIMEMultipart:
+    # body_part je už zakódovaná MIMEText část, může být sdílená více zprávami
     msg = MIMEMultipart()
-    msg["From"] = sender_email
+    msg["From"] = EMAIL_ADDRESS
     msg["To"] = recipient
     msg["Subject"] = subject
 
-    msg.attach(MIMEText(body, "html"))
+    msg.attach(body_part)
+    return msg
 
-    try:
-        server = smtplib.SMTP('wes1-smtp.wedos.net', 587)
-        server.starttls()
-        server.login(sender_email, EMAIL_PASSWORD)
-        server.sendmail(sender_email, recipient, msg.as_string())
-        server.close()
-    except Exception as e:
-        print(f"Error sending email: {e}")
+class EmailOutbox:
+    """
+    In-process outbox drained by a background thread over one reused, authenticated
+    SMTP connection. Failed messages are retried with exponential backoff.
+    """
 
-def send_verification_email(email: str, code: str):
-    subject = "Brandoo - Verifikace uživatele"
-    body = getEmailHtml(
-        'Verifikace Uživatele', 
-        'Zde je kód pro verifikaci, nesdílejte tento kód s nikým.',
-        code
-    )
-    send_email(subject, email, body)
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._statuses = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._smtp = None
 
-def send_free_subscription_on_month_email(email: str, code: str):
-    subject = "Brandoo na měsíc zdarma!"
-    body = getEmailHtml(
-        'Vítejte, zde je váš unikátní kód pro váš bezstarostný měsíc zdarma.', 
-        'Pokud byste měli problém s napojením na váš web, kontaktujte nás na info@brandoo.cz',
-        code
-    )
-    send_email(subject, email, body)
+    def enqueue(self, message: MIMEMultipart) -> str:
+        message_id = str(uuid.uuid4())
+        self._set_status(message_id, "queued", attempts=0)
+        self._queue.put((message_id, message, 0))
+        self._ensure_worker()
+        return message_id
 
-def send_free_subscription_on_three_month_email(email: str, code: str):
-    subject = "Brandoo na tři měsíce zdarma!"
-    body = getEmailHtml(
-        'Vítejte, zde je váš unikátní kód pro vaše bezstarostné tři měsíc ezdarma.', 
-        'Jakmile bude vaše stránka hotová, napojíme vám na ní na Brandoo za již slíbenou jednu korunu.',
-        code
-    )
-    send_email(subject, email, body)
+    def get_status(self, message_id: str) -> Optional[dict]:
+        with self._lock:
+            status = self._statuses.get(message_id)
+            return dict(status) if status else None
 
-def send_thank_you(email: str):
-    subject = "Brandoo Enterprises - Překvapení!"
-    body = getEmailHtml(
-        'Máme pro vás překvapení, napojíme vaší webovou stránku na Brandoo za 1 Kč!', 
-        'Nemáte ještě webovou stránku? Můžete nás rovnou kontaktovat na info@brandoo.cz',
-    )
-    send_email(subject, email, body)
+    def pending(self) -> int:
+        return self._queue.qsize()
 
-def send_form_for_our_services(email: str):
-    subject = "Jeden dotazník vás dělí od úspěchu!"
-    body = """
+    def _set_status(self, message_id: str, status: str, **details):
+        with self._lock:
+            self._statuses[message_id] = {"status": status, "updated_at": time.time(), **details}
+            self._statuses.move_to_end(message_id)
+            while len(self._statuses) > EMAIL_STATUS_HISTORY_SIZE:
+                self._statuses.popitem(last=False)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=SMTP_IDLE_TIMEOUT_SECONDS)]
+        except queue.Empty:
+            return []
+
+        while len(batch) < EMAIL_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        while True:
+            batch = self._next_batch()
+            if batch:
+                loop.run_until_complete(self._send_batch(batch))
+            else:
+                # Nečinné spojení zavřeme, server by ho stejně ukončil
+                loop.run_until_complete(self._disconnect())
+
+    async def _connect(self):
+        if self._smtp and self._smtp.is_connected:
+            return self._smtp
+
+        self._smtp = aiosmtplib.SMTP(
+            hostname=SMTP_HOST,
+            port=SMTP_PORT,
+            username=EMAIL_ADDRESS if SMTP_LOGIN else None,
+            password=EMAIL_PASSWORD if SMTP_LOGIN else None,
+            start_tls=SMTP_STARTTLS,
+            timeout=SMTP_TIMEOUT_SECONDS,
+        )
+        await self._smtp.connect()
+        return self._smtp
+
+    async def _disconnect(self):
+        if self._smtp and self._smtp.is_connected:
+            try:
+                await self._smtp.quit()
+            except aiosmtplib.SMTPException:
+                self._smtp.close()
+        self._smtp = None
+
+    async def _send_batch(self, batch: list):
+        for message_id, message, attempts in batch:
+            attempts += 1
+            try:
+                smtp = await self._connect()
+                await smtp.send_message(message)
+                self._set_status(message_id, "sent", attempts=attempts)
+            except Exception as e:
+                logging.error(f"Error sending email {message_id}: {e}")
+                await self._disconnect()
+                self._retry_later(message_id, message, attempts, str(e))
+
+    def _retry_later(self, message_id: str, message: MIMEMultipart, attempts: int, error: str):
+        if attempts >= EMAIL_MAX_ATTEMPTS:
+            self._set_status(message_id, "failed", attempts=attempts, error=error)
+            return
+
+        delay = EMAIL_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+        self._set_status(message_id, "retrying", attempts=attempts, error=error, retry_in=delay)
+
+        timer = threading.Timer(delay, self._queue.put, args=((message_id, message, attempts),))
+        timer.daemon = True
+        timer.start()
+
+outbox = EmailOutbox()
+
+def send_email(subject: str, recipient: str, body: str) -> str:
+    # Jen zařadí zprávu do outboxu, odeslání proběhne na pozadí
+    return outbox.enqueue(build_message(subject, recipient, MIMEText(body, "html", "utf-8")))
+
+class EmailTemplate:
+    """
+    Email type compiled once. Bodies without variables are rendered and MIME encoded
+    only on the first use and the encoded part is shared by every message.
+    """
+
+    def __init__(self, subject: str, source: str, **defaults):
+        self.subject = subject
+        self.template = jinja_env.from_string(source)
+        self.defaults = defaults
+        self._static_part = None
+
+    def body_part(self, **context) -> MIMEText:
+        if not context:
+            if self._static_part is None:
+                self._static_part = MIMEText(self.template.render(**self.defaults), "html", "utf-8")
+            return self._static_part
+        return MIMEText(self.template.render(**self.defaults, **context), "html", "utf-8")
+
+    def render_message(self, recipient: str, **context) -> MIMEMultipart:
+        return build_message(self.subject, recipient, self.body_part(**context))
+
+    def render_bulk(self, recipients: list, **context) -> list:
+        # Tělo se vyrenderuje a zakóduje jednou pro celou kampaň, mění se jen příjemce
+        body_part = self.body_part(**context)
+        return [build_message(self.subject, recipient, body_part) for recipient in recipients]
+
+def code_email(subject: str, title: str, subtitle: str) -> EmailTemplate:
+    return EmailTemplate(subject, CODE_EMAIL_TEMPLATE, title=title, subtitle=subtitle, logo_url=LOGO_URL)
+
+EMAIL_TEMPLATES = {
+    "verification": code_email(
+        "Brandoo - Verifikace uživatele",
+        'Verifikace Uživatele',
+        'Zde je kód pro verifikaci, nesdílejte tento kód s nikým.',
+    ),
+    "free_subscription_on_month": code_email(
+        "Brandoo na měsíc zdarma!",
+        'Vítejte, zde je váš unikátní kód pro váš bezstarostný měsíc zdarma.',
+        'Pokud byste měli problém s napojením na váš web, kontaktujte nás na info@brandoo.cz',
+    ),
+    "free_subscription_on_three_month": code_email(
+        "Brandoo na tři měsíce zdarma!",
+        'Vítejte, zde je váš unikátní kód pro vaše bezstarostné tři měsíc ezdarma.',
+        'Jakmile bude vaše stránka hotová, napojíme vám na ní na Brandoo za již slíbenou jednu korunu.',
+    ),
+    "thank_you": code_email(
+        "Brandoo Enterprises - Překvapení!",
+        'Máme pro vás překvapení, napojíme vaší webovou stránku na Brandoo za 1 Kč!',
+        'Nemáte ještě webovou stránku? Můžete nás rovnou kontaktovat na info@brandoo.cz',
+    ),
+    "reset": code_email(
+        "Brandoo - Změna hesla",
+        'Změna Hesla',
+        'Zde je kód pro změnu hesla, nesdílejte tento kód s nikým.',
+    ),
+    "delete_user": code_email(
+        "Brandoo - Smazání vašeho účtu",
+        'Smazání Vašeho Účtu',
+        'Váš účet byl smazán z důvodu neověření vaší identity.',
+    ),
+    "form_for_our_services": EmailTemplate("Jeden dotazník vás dělí od úspěchu!", """
     <html>
         <body style="background-color: #ffffff; color: #000000;">
             <p>Zdravíme,</p>
@@ -100,29 +259,8 @@ def send_form_for_our_services(email: str):
             <p>S pozdravem, <br/>Tým Brandoo</p>
         </body>
     </html>
-    """
-    send_email(subject, email, body)
-
-def send_reset_email(email: str, code: str):
-    subject = "Brandoo - Změna hesla"
-    body = getEmailHtml(
-        'Změna Hesla', 
-        'Zde je kód pro změnu hesla, nesdílejte tento kód s nikým.',
-        code
-    )
-    send_email(subject, email, body)
-
-def send_delete_user_email(email: str):
-    subject = "Brandoo - Smazání vašeho účtu"
-    body = getEmailHtml(
-        'Smazání Vašeho Účtu', 
-        'Váš účet byl smazán z důvodu neověření vaší identity.',
-    )
-    send_email(subject, email, body)
-
-def send_business_improvement_tip_email(email: str):
-    subject = "Tip na zlepšení vašeho podnikání – Jak psát pro vyšší zisky"
-    body = """
+    """),
+    "business_improvement_tip": EmailTemplate("Tip na zlepšení vašeho podnikání – Jak psát pro vyšší zisky", """
     <html>
         <body style="background-color: #ffffff; color: #000000;">
             <p>Zdravíme,</p>
@@ -147,12 +285,8 @@ def send_business_improvement_tip_email(email: str):
             <p>S pozdravem, <br/>Tým Brandoo</p>
         </body>
     </html>
-    """
-    send_email(subject, email, body)
-
-def send_extra_tip_video_email(email: str):
-    subject = "Extra tip – Zvyšte účinnost textů pomocí videa"
-    body = """
+    """),
+    "extra_tip_video": EmailTemplate("Extra tip – Zvyšte účinnost textů pomocí videa", """
     <html>
         <body style="background-color: #ffffff; color: #000000;">
             <p>Zdravíme,</p>
@@ -178,5 +312,38 @@ def send_extra_tip_video_email(email: str):
             <p>S pozdravem, <br/>Tým Brandoo</p>
         </body>
     </html>
-    """
-    send_email(subject, email, body)
+    """),
+}
+
+def send_template(name: str, recipient: str, **context) -> str:
+    return outbox.enqueue(EMAIL_TEMPLATES[name].render_message(recipient, **context))
+
+def send_template_bulk(name: str, recipients: list, **context) -> list:
+    return [outbox.enqueue(message) for message in EMAIL_TEMPLATES[name].render_bulk(recipients, **context)]
+
+def send_verification_email(email: str, code: str):
+    send_template("verification", email, code=code)
+
+def send_free_subscription_on_month_email(email: str, code: str):
+    send_template("free_subscription_on_month", email, code=code)
+
+def send_free_subscription_on_three_month_email(email: str, code: str):
+    send_template("free_subscription_on_three_month", email, code=code)
+
+def send_thank_you(email: str):
+    send_template("thank_you", email)
+
+def send_form_for_our_services(email: str):
+    send_template("form_for_our_services", email)
+
+def send_reset_email(email: str, code: str):
+    send_template("reset", email, code=code)
+
+def send_delete_user_email(email: str):
+    send_template("delete_user", email)
+
+def send_business_improvement_tip_email(email: str):
+    send_template("business_improvement_tip", email)
+
+def send_extra_tip_video_email(email: str):
+    send_template("extra_tip_video", email)
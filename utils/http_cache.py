@@ -0,0 +1,39 @@
+# utils/http_cache
+
+import os
+import hashlib
+from fastapi import Request
+from starlette.responses import Response
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Výchozí hodnoty nutí klienta i CDN revalidovat, 304 je levné
+PUBLIC_CONTENT_CACHE_CONTROL = os.getenv("PUBLIC_CONTENT_CACHE_CONTROL", "public, max-age=0, must-revalidate")
+PUBLIC_FORM_CACHE_CONTROL = os.getenv("PUBLIC_FORM_CACHE_CONTROL", "public, max-age=0, must-revalidate")
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match se porovnává slabě, W/ prefix ignorujeme
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return etag in [candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates]
+
+def cache_headers(etag: str, cache_control: str) -> dict:
+    # Odpověď je stejná pro všechny originy, ale 403 se liší, proto Vary: Origin
+    return {"ETag": etag, "Cache-Control": cache_control, "Vary": "Origin"}
+
+def set_cache_headers(response: Response, etag: str, cache_control: str):
+    response.headers.update(cache_headers(etag, cache_control))
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, cache_control))
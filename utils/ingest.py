@@ -0,0 +1,208 @@
+# utils/ingest
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from cryptography.fernet import Fernet
+from dotenv import load_dotenv
+from utils.security import generate_key_from_password
+
+load_dotenv()
+
+FORM_INGEST_QUEUE_ENABLED = os.getenv("FORM_INGEST_QUEUE_ENABLED", "false").lower() == "true"
+FORM_INGEST_QUEUE_PATH = os.getenv("FORM_INGEST_QUEUE_PATH", "form_ingest_queue.db")
+FORM_INGEST_BATCH_SIZE = int(os.getenv("FORM_INGEST_BATCH_SIZE", "50"))
+FORM_INGEST_WORKERS = int(os.getenv("FORM_INGEST_WORKERS", "2"))
+FORM_INGEST_POLL_SECONDS = int(os.getenv("FORM_INGEST_POLL_SECONDS", "2"))
+FORM_INGEST_MAX_PENDING = int(os.getenv("FORM_INGEST_MAX_PENDING", "10000"))
+FORM_INGEST_MAX_ATTEMPTS = int(os.getenv("FORM_INGEST_MAX_ATTEMPTS", "5"))
+FORM_INGEST_CLAIM_TIMEOUT_SECONDS = 300
+FORM_INGEST_RETENTION_SECONDS = 24 * 60 * 60
+
+class IngestQueue:
+    """
+    Durable SQLite queue of accepted public form submissions.
+    Payloads are Fernet encrypted at rest and removed once the response is stored.
+    """
+
+    def __init__(self, path: str, secret: str):
+        self.path = path
+        self.fernet = Fernet(generate_key_from_password(secret))
+        self.counters = {"accepted": 0, "duplicates": 0, "overflow": 0, "processed": 0, "failed": 0, "retried": 0}
+        self._counters_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS form_ingest_queue (
+                    id TEXT PRIMARY KEY,
+                    idempotency_key TEXT UNIQUE,
+                    form_id TEXT NOT NULL,
+                    payload BLOB,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    response_id TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    claimed_at REAL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_form_ingest_queue_status ON form_ingest_queue (status, created_at)")
+            self._initialized = True
+        return connection
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._counters_lock:
+            self.counters[counter] += amount
+
+    def enqueue(self, form_id, data: dict, idempotency_key: str = None):
+        # Idempotency klíč je platný jen v rámci jednoho formuláře
+        scoped_key = f"{form_id}:{idempotency_key}" if idempotency_key else None
+        entry_id = str(uuid.uuid4())
+        payload = self.fernet.encrypt(json.dumps(data).encode())
+
+        connection = self._connect()
+        try:
+            connection.execute(
+                "INSERT INTO form_ingest_queue (id, idempotency_key, form_id, payload, status, created_at) VALUES (?, ?, ?, ?, 'pending', ?)",
+                (entry_id, scoped_key, str(form_id), payload, time.time())
+            )
+            self._count("accepted")
+            return entry_id, True
+        except sqlite3.IntegrityError:
+            existing = connection.execute("SELECT id FROM form_ingest_queue WHERE idempotency_key = ?", (scoped_key,)).fetchone()
+            self._count("duplicates")
+            return existing[0], False
+        finally:
+            connection.close()
+
+    def reserve(self, form_id, idempotency_key: str):
+        # Přímý zápis při plné frontě, klíč se zarezervuje jako hotová položka bez payloadu
+        scoped_key = f"{form_id}:{idempotency_key}"
+        entry_id = str(uuid.uuid4())
+
+        connection = self._connect()
+        try:
+            connection.execute(
+                "INSERT INTO form_ingest_queue (id, idempotency_key, form_id, status, created_at) VALUES (?, ?, ?, 'done', ?)",
+                (entry_id, scoped_key, str(form_id), time.time())
+            )
+            return entry_id, True
+        except sqlite3.IntegrityError:
+            existing = connection.execute("SELECT id FROM form_ingest_queue WHERE idempotency_key = ?", (scoped_key,)).fetchone()
+            self._count("duplicates")
+            return existing[0], False
+        finally:
+            connection.close()
+
+    def release(self, entry_id: str):
+        # Přímý zápis selhal, klient může požadavek se stejným klíčem zopakovat
+        connection = self._connect()
+        try:
+            connection.execute("DELETE FROM form_ingest_queue WHERE id = ?", (entry_id,))
+        finally:
+            connection.close()
+
+    def claim_batch(self, size: int):
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            # Položky po pádu workeru se po timeoutu vrací zpět do fronty
+            connection.execute(
+                "UPDATE form_ingest_queue SET status = 'pending' WHERE status = 'processing' AND claimed_at < ?",
+                (now - FORM_INGEST_CLAIM_TIMEOUT_SECONDS,)
+            )
+            rows = connection.execute(
+                "SELECT id, form_id, payload FROM form_ingest_queue WHERE status = 'pending' ORDER BY created_at LIMIT ?",
+                (size,)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE form_ingest_queue SET status = 'processing', claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                [(now, row[0]) for row in rows]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+        return [(entry_id, form_id, json.loads(self.fernet.decrypt(payload))) for entry_id, form_id, payload in rows]
+
+    def complete(self, entry_id: str, response_id):
+        connection = self._connect()
+        try:
+            connection.execute(
+                "UPDATE form_ingest_queue SET status = 'done', payload = NULL, response_id = ?, error = NULL WHERE id = ?",
+                (str(response_id), entry_id)
+            )
+        finally:
+            connection.close()
+        self._count("processed")
+
+    def fail(self, entry_id: str, error: str, retry: bool = True):
+        connection = self._connect()
+        try:
+            attempts = connection.execute("SELECT attempts FROM form_ingest_queue WHERE id = ?", (entry_id,)).fetchone()[0]
+            if retry and attempts < FORM_INGEST_MAX_ATTEMPTS:
+                connection.execute("UPDATE form_ingest_queue SET status = 'pending', error = ? WHERE id = ?", (error, entry_id))
+                self._count("retried")
+            else:
+                connection.execute("UPDATE form_ingest_queue SET status = 'failed', payload = NULL, error = ? WHERE id = ?", (error, entry_id))
+                self._count("failed")
+        finally:
+            connection.close()
+
+    def prune(self):
+        connection = self._connect()
+        try:
+            connection.execute(
+                "DELETE FROM form_ingest_queue WHERE status = 'done' AND created_at < ?",
+                (time.time() - FORM_INGEST_RETENTION_SECONDS,)
+            )
+        finally:
+            connection.close()
+
+    def depth(self) -> int:
+        connection = self._connect()
+        try:
+            return connection.execute("SELECT COUNT(*) FROM form_ingest_queue WHERE status IN ('pending', 'processing')").fetchone()[0]
+        finally:
+            connection.close()
+
+    def is_full(self) -> bool:
+        return self.depth() >= FORM_INGEST_MAX_PENDING
+
+    def record_overflow(self):
+        self._count("overflow")
+
+    def metrics(self) -> dict:
+        connection = self._connect()
+        try:
+            statuses = dict(connection.execute("SELECT status, COUNT(*) FROM form_ingest_queue GROUP BY status").fetchall())
+            oldest_pending = connection.execute("SELECT MIN(created_at) FROM form_ingest_queue WHERE status = 'pending'").fetchone()[0]
+        finally:
+            connection.close()
+
+        with self._counters_lock:
+            counters = dict(self.counters)
+
+        return {
+            "enabled": FORM_INGEST_QUEUE_ENABLED,
+            "pending": statuses.get("pending", 0),
+            "processing": statuses.get("processing", 0),
+            "failed": statuses.get("failed", 0),
+            "done": statuses.get("done", 0),
+            "max_pending": FORM_INGEST_MAX_PENDING,
+            "oldest_pending_age_seconds": time.time() - oldest_pending if oldest_pending else 0,
+            **counters
+        }
+
+ingest_queue = IngestQueue(FORM_INGEST_QUEUE_PATH, os.getenv("AUTH_TOKEN_SECRET_KEY") or "")
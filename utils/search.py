@@ -0,0 +1,42 @@
+# utils/search
+
+import os
+import re
+import hmac
+import hashlib
+import unicodedata
+from uuid import UUID
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SEARCH_INDEX_SECRET_KEY = (os.getenv("SEARCH_INDEX_SECRET_KEY") or os.getenv("AUTH_TOKEN_SECRET_KEY") or "").encode()
+SEARCH_PREFIX_MIN_LENGTH = 3
+SEARCH_WORD_MAX_LENGTH = 32
+
+WORD_SPLIT_REGEX = re.compile(r"[^\w]+")
+
+def normalize_text(text: str) -> str:
+    # "Šťastný Člověk" -> "stastny clovek", aby vyhledávání nezáviselo na diakritice
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def split_words(text: str) -> list:
+    return [word[:SEARCH_WORD_MAX_LENGTH] for word in WORD_SPLIT_REGEX.split(normalize_text(text)) if word]
+
+def blind_token(user_id: UUID, word: str) -> str:
+    # Klíč je odvozený pro každého uživatele zvlášť, tokeny nejdou porovnat napříč účty
+    user_key = hmac.new(SEARCH_INDEX_SECRET_KEY, str(user_id).encode(), hashlib.sha256).digest()
+    return hmac.new(user_key, word.encode(), hashlib.sha256).hexdigest()[:32]
+
+def index_tokens(user_id: UUID, text: str) -> set:
+    # Indexujeme celé slovo i jeho prefixy, hledání "nov" najde "novak"
+    tokens = set()
+    for word in split_words(text):
+        tokens.add(blind_token(user_id, word))
+        for length in range(SEARCH_PREFIX_MIN_LENGTH, len(word)):
+            tokens.add(blind_token(user_id, word[:length]))
+    return tokens
+
+def query_tokens(user_id: UUID, search_query: str) -> set:
+    return {blind_token(user_id, word) for word in split_words(search_query)}
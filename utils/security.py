@@ -2,18 +2,26 @@
 
 import os
 import jwt
+import hmac
 import hashlib
 from dotenv import load_dotenv
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from datetime import datetime, timedelta
 from cryptography.fernet import Fernet, InvalidToken
 import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from models.user import Token
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from base64 import b64encode, b64decode, urlsafe_b64encode, urlsafe_b64decode
 
 from urllib.parse import unquote
@@ -25,6 +33,26 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 SECRET_KEY_FOR_FE_ENCRYPTION = urlsafe_b64decode(os.getenv("SECRET_KEY_FOR_FE_ENCRYPTION"))
 
+# Values encrypted with a per-response AES-GCM data key carry this prefix,
+# legacy values are plain hex of the RSA-OAEP ciphertext
+AES_GCM_PREFIX = "aes:"
+AES_GCM_NONCE_SIZE = 12
+
+KEY_CACHE_MAX_SIZE = int(os.getenv("KEY_CACHE_MAX_SIZE", "256"))
+KEY_CACHE_TTL_SECONDS = int(os.getenv("KEY_CACHE_TTL_SECONDS", "900"))
+
+# cryptography releases the GIL during RSA operations, so threads scale across cores
+DECRYPTION_WORKERS = int(os.getenv("DECRYPTION_WORKERS", str(os.cpu_count() or 1)))
+DECRYPTION_PARALLEL_THRESHOLD = int(os.getenv("DECRYPTION_PARALLEL_THRESHOLD", "8"))
+
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+TOKEN_CACHE_MAX_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_MAX_TTL_SECONDS", "300"))
+TOKEN_INVALIDATION_REDIS_URL = os.getenv("REDIS_URL")
+TOKEN_INVALIDATION_CHANNEL = "brandoo:token-invalidation"
+
+# Bearer token pro interní metriky, bez něj jsou metriky nedostupné
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 logging.basicConfig(level=logging.INFO)
@@ -41,8 +69,87 @@ def create_access_token(user_id: str) -> str:
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(db: Session, user_id: str, token: str) -> bool:
-    db_token = db.query(Token).filter(Token.user_id == user_id).first()
+class TokenCache:
+    """
+    Positive verify_token results keyed on (user_id, SHA-256 of the token).
+    Entries live at most TOKEN_CACHE_MAX_TTL_SECONDS and never past the JWT `exp`.
+    """
+
+    def __init__(self, max_size: int, max_ttl: int):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._invalidation_hooks = []
+        self._lock = threading.Lock()
+
+    def _key(self, user_id, token: str):
+        return str(user_id), hashlib.sha256(token.encode()).digest()
+
+    def get(self, user_id, token: str) -> bool:
+        cache_key = self._key(user_id, token)
+        with self._lock:
+            expires_at = self._entries.get(cache_key)
+            if expires_at and expires_at > time.time():
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return True
+            self._entries.pop(cache_key, None)
+            self.misses += 1
+            return False
+
+    def set(self, user_id, token: str, token_exp: float):
+        cache_key = self._key(user_id, token)
+        with self._lock:
+            self._entries[cache_key] = min(token_exp, time.time() + self.max_ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id, propagate: bool = True):
+        with self._lock:
+            for cache_key in [key for key in self._entries if key[0] == str(user_id)]:
+                del self._entries[cache_key]
+
+        if propagate:
+            for hook in self._invalidation_hooks:
+                try:
+                    hook(user_id)
+                except Exception as e:
+                    logging.error(f"Token invalidation hook failed: {e}")
+
+    def add_invalidation_hook(self, hook):
+        self._invalidation_hooks.append(hook)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+token_cache = TokenCache(TOKEN_CACHE_MAX_SIZE, TOKEN_CACHE_MAX_TTL_SECONDS)
+
+def enable_redis_token_invalidation(redis_url: str):
+    # Ostatní uvicorn workery dostanou invalidaci přes Redis pub/sub
+    import redis
+
+    client = redis.Redis.from_url(redis_url)
+    token_cache.add_invalidation_hook(lambda user_id: client.publish(TOKEN_INVALIDATION_CHANNEL, str(user_id)))
+
+    def listen():
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(TOKEN_INVALIDATION_CHANNEL)
+        for message in pubsub.listen():
+            token_cache.invalidate(message["data"].decode(), propagate=False)
+
+    threading.Thread(target=listen, name="token-invalidation", daemon=True).start()
+
+if TOKEN_INVALIDATION_REDIS_URL:
+    enable_redis_token_invalidation(TOKEN_INVALIDATION_REDIS_URL)
+
+def invalidate_token_cache(user_id):
+    token_cache.invalidate(user_id)
+
+def check_token(db_token: Token, user_id: str, token: str) -> bool:
     if not db_token:
         return False
     try:
@@ -52,10 +159,30 @@ def verify_token(db: Session, user_id: str, token: str) -> bool:
             return False
         if token != db_token.auth_token:
             return False
+        token_cache.set(user_id, token, payload["exp"])
         return True
     except jwt.PyJWTError:
         return False
 
+def verify_token(db: Session, user_id: str, token: str) -> bool:
+    if token and token_cache.get(user_id, token):
+        return True
+
+    db_token = db.query(Token).filter(Token.user_id == user_id).first()
+    return check_token(db_token, user_id, token)
+
+def verify_metrics_token(token: str) -> bool:
+    if not METRICS_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())
+
+async def verify_token_async(db: AsyncSession, user_id: str, token: str) -> bool:
+    if token and token_cache.get(user_id, token):
+        return True
+
+    result = await db.execute(select(Token).where(Token.user_id == user_id).limit(1))
+    return check_token(result.scalars().first(), user_id, token)
+
 def generate_key_from_password(password: str) -> str:
     digest = hashlib.sha256(password.encode()).digest()
     return urlsafe_b64encode(digest)
@@ -87,34 +214,92 @@ def decrypt_private_key_via_password(data: str, password: str) -> str:
             return None
     return data
 
-def rsa_encrypt_data(data: str, public_key_pem: str) -> str:
-    public_key = serialization.load_pem_public_key(public_key_pem.encode(), backend=default_backend())
-    encrypted_data = public_key.encrypt(
-        data.encode(),
-        padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
+OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+
+class KeyCache:
+    """
+    Bounded LRU cache of parsed key objects keyed by SHA-256 of the PEM.
+    The PEM itself is never stored, entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, pem: str, loader):
+        cache_key = hashlib.sha256(pem.encode()).digest()
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                self._evict(cache_key)
+            self.misses += 1
+
+        key = loader(pem)
+
+        with self._lock:
+            self._entries[cache_key] = (key, now + self.ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._evict(next(iter(self._entries)))
+
+        return key
+
+    def _evict(self, cache_key: bytes):
+        # Drop the only reference to the key object so OpenSSL frees (and clears) its memory
+        key, _ = self._entries.pop(cache_key)
+        del key
+
+    def clear(self):
+        with self._lock:
+            for cache_key in list(self._entries):
+                self._evict(cache_key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+public_key_cache = KeyCache(KEY_CACHE_MAX_SIZE, KEY_CACHE_TTL_SECONDS)
+private_key_cache = KeyCache(KEY_CACHE_MAX_SIZE, KEY_CACHE_TTL_SECONDS)
+
+def _parse_public_key(public_key_pem: str):
+    return serialization.load_pem_public_key(public_key_pem.encode(), backend=default_backend())
+
+def _parse_private_key(private_key_pem: str):
+    return serialization.load_pem_private_key(
+        private_key_pem.encode(),
+        password=None,
+        backend=default_backend()
     )
+
+def load_public_key(public_key_pem: str):
+    return public_key_cache.get_or_load(public_key_pem, _parse_public_key)
+
+def load_private_key(private_key_pem: str):
+    return private_key_cache.get_or_load(unquote(private_key_pem), _parse_private_key)
+
+def rsa_encrypt_data(data: str, public_key_pem: str) -> str:
+    public_key = load_public_key(public_key_pem)
+    encrypted_data = public_key.encrypt(data.encode(), OAEP_PADDING)
     return encrypted_data.hex()
 
 def rsa_decrypt_data(encrypted_data: str, private_key_pem: str) -> str:
     try:
-        decoded_private_key = unquote(private_key_pem)
-        private_key = serialization.load_pem_private_key(
-            decoded_private_key.encode(),
-            password=None,
-            backend=default_backend()
-        )
-        decrypted_data = private_key.decrypt(
-            bytes.fromhex(encrypted_data),
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
+        private_key = load_private_key(private_key_pem)
+        decrypted_data = private_key.decrypt(bytes.fromhex(encrypted_data), OAEP_PADDING)
         return decrypted_data.decode()
     except ValueError:
         logging.error("Invalid private key")
@@ -123,6 +308,62 @@ def rsa_decrypt_data(encrypted_data: str, private_key_pem: str) -> str:
         logging.error(f"Error during decryption: {e}")
         raise
 
+def generate_data_key() -> bytes:
+    return AESGCM.generate_key(bit_length=256)
+
+def wrap_data_key(data_key: bytes, public_key_pem: str) -> str:
+    public_key = load_public_key(public_key_pem)
+    return public_key.encrypt(data_key, OAEP_PADDING).hex()
+
+def unwrap_data_key(wrapped_data_key: str, private_key_pem: str) -> bytes:
+    try:
+        private_key = load_private_key(private_key_pem)
+        return private_key.decrypt(bytes.fromhex(wrapped_data_key), OAEP_PADDING)
+    except Exception as e:
+        logging.error(f"Error during data key unwrapping: {e}")
+        raise
+
+def aes_encrypt_data(data: str, data_key: bytes) -> str:
+    nonce = os.urandom(AES_GCM_NONCE_SIZE)
+    encrypted_data = AESGCM(data_key).encrypt(nonce, data.encode(), None)
+    return AES_GCM_PREFIX + b64encode(nonce + encrypted_data).decode('utf-8')
+
+def aes_decrypt_data(encrypted_data: str, data_key: bytes) -> str:
+    raw = b64decode(encrypted_data[len(AES_GCM_PREFIX):])
+    nonce, ciphertext = raw[:AES_GCM_NONCE_SIZE], raw[AES_GCM_NONCE_SIZE:]
+    return AESGCM(data_key).decrypt(nonce, ciphertext, None).decode()
+
+def is_aes_encrypted(encrypted_data: str) -> bool:
+    return encrypted_data.startswith(AES_GCM_PREFIX)
+
+def decrypt_value(encrypted_data: str, private_key_pem: str, data_key: bytes = None) -> str:
+    # Envelope encrypted values need the unwrapped data key, legacy hex values fall back to RSA
+    if is_aes_encrypted(encrypted_data):
+        if data_key is None:
+            raise ValueError("Missing data key for AES encrypted value")
+        return aes_decrypt_data(encrypted_data, data_key)
+    return rsa_decrypt_data(encrypted_data, private_key_pem)
+
+_decryption_pool = None
+_decryption_pool_lock = threading.Lock()
+
+def get_decryption_pool() -> ThreadPoolExecutor:
+    global _decryption_pool
+    with _decryption_pool_lock:
+        if _decryption_pool is None:
+            _decryption_pool = ThreadPoolExecutor(max_workers=DECRYPTION_WORKERS, thread_name_prefix="decrypt")
+        return _decryption_pool
+
+def decrypt_in_parallel(func, items) -> list:
+    """
+    Applies `func` to every item and returns the results in the original order.
+    Batches smaller than DECRYPTION_PARALLEL_THRESHOLD are decrypted inline.
+    """
+    items = list(items)
+    if DECRYPTION_WORKERS <= 1 or len(items) < DECRYPTION_PARALLEL_THRESHOLD:
+        return [func(item) for item in items]
+    return list(get_decryption_pool().map(func, items))
+
 def generate_key_pair():
     private_key = rsa.generate_private_key(
         public_exponent=65537,
@@ -0,0 +1,244 @@
+# utils/statistics_buffer
+
+import os
+import json
+import uuid
+import fcntl
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATISTICS_BUFFER_ENABLED = os.getenv("STATISTICS_BUFFER_ENABLED", "false").lower() == "true"
+STATISTICS_STORE_RAW_VALUES = os.getenv("STATISTICS_STORE_RAW_VALUES", "true").lower() == "true"
+STATISTICS_FLUSH_SECONDS = int(os.getenv("STATISTICS_FLUSH_SECONDS", "5"))
+STATISTICS_FLUSH_MAX_EVENTS = int(os.getenv("STATISTICS_FLUSH_MAX_EVENTS", "1000"))
+STATISTICS_JOURNAL_DIR = os.getenv("STATISTICS_JOURNAL_DIR", "statistics_journal")
+STATISTICS_JOURNAL_FSYNC = os.getenv("STATISTICS_JOURNAL_FSYNC", "false").lower() == "true"
+
+ROLLUP_BUCKETS = ("hour", "day")
+ROLLUP_FIELDS = ("value_count", "number_sum", "time_seconds_sum", "true_count", "false_count")
+
+def time_to_seconds(value: str) -> int:
+    hours, minutes, seconds = (int(part) for part in value.split(":"))
+    return hours * 3600 + minutes * 60 + seconds
+
+def truncate_to_bucket(created_at: datetime, bucket: str) -> datetime:
+    created_at = created_at.astimezone(timezone.utc)
+    if bucket == "week":
+        return (created_at - timedelta(days=created_at.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return created_at.replace(minute=0, second=0, microsecond=0)
+
+def stores_raw_value(statistic_type: str) -> bool:
+    # Text nemá agregát, bez surové hodnoty by se ztratil
+    return STATISTICS_STORE_RAW_VALUES or statistic_type == "text"
+
+def make_statistic_event(statistic_id, statistic_type: str, value) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "statistic_id": str(statistic_id),
+        "type": statistic_type,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "time": value.time,
+        "number": value.number,
+        "boolean": value.boolean,
+        "text": value.text,
+    }
+
+def merge_increments(target: dict, increments: dict):
+    for key, deltas in increments.items():
+        current = target.get(key)
+        target[key] = deltas if current is None else tuple(a + b for a, b in zip(current, deltas))
+
+def rollup_increments(events, sign: int = 1) -> dict:
+    increments = {}
+
+    for event in events:
+        created_at = datetime.fromisoformat(event["created_at"])
+        deltas = (
+            sign,
+            sign * (event["number"] or 0),
+            sign * (time_to_seconds(event["time"]) if event["time"] else 0),
+            sign if event["boolean"] is True else 0,
+            sign if event["boolean"] is False else 0,
+        )
+        merge_increments(increments, {
+            (event["statistic_id"], bucket, truncate_to_bucket(created_at, bucket)): deltas
+            for bucket in ROLLUP_BUCKETS
+        })
+
+    return increments
+
+class StatisticBuffer:
+    """
+    Accepted statistic values kept in memory and written to the DB in bulk, rollups are computed by the writer.
+    Every event is appended to a locked local journal first, journals of a crashed worker are replayed on start.
+    """
+
+    def __init__(self, journal_dir: str, flush_max_events: int, fsync: bool):
+        self.journal_dir = journal_dir
+        self.flush_max_events = flush_max_events
+        self.fsync = fsync
+        self.on_full = None
+        self.counters = {"accepted": 0, "flushed": 0, "recovered": 0, "failed_flushes": 0}
+        self._events = []
+        self._journal = None
+        self._sealed = []
+        self._flush_requested = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _open_journal(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        name = str(uuid.uuid4())
+        temporary_path = os.path.join(self.journal_dir, f"{name}.tmp")
+        path = os.path.join(self.journal_dir, f"{name}.jsonl")
+
+        # Zámek se bere před přejmenováním, recover() tak nikdy neuvidí odemčený journal živého workeru
+        journal = open(temporary_path, "a", encoding="utf-8")
+        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(temporary_path, path)
+
+        return path, journal
+
+    def add(self, event: dict):
+        line = json.dumps(event) + "\n"
+
+        with self._lock:
+            if self._journal is None:
+                self._journal = self._open_journal()
+
+            journal = self._journal[1]
+            journal.write(line)
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+
+            self._events.append(event)
+            self.counters["accepted"] += 1
+
+            request_flush = len(self._events) >= self.flush_max_events and not self._flush_requested
+            if request_flush:
+                self._flush_requested = True
+
+        if request_flush and self.on_full:
+            self.on_full()
+
+    def recover(self, flushed_journals=None) -> int:
+        if not os.path.isdir(self.journal_dir):
+            return 0
+
+        journals = []
+
+        for name in sorted(os.listdir(self.journal_dir)):
+            if not name.endswith(".jsonl"):
+                continue
+
+            path = os.path.join(self.journal_dir, name)
+            try:
+                journal = open(path, "r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+
+            # Zamčený journal patří živému workeru
+            try:
+                fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                journal.close()
+                continue
+
+            # Mezitím ho mohl úspěšný flush smazat
+            try:
+                if os.stat(path).st_ino != os.fstat(journal.fileno()).st_ino:
+                    raise FileNotFoundError(path)
+            except FileNotFoundError:
+                journal.close()
+                continue
+
+            journals.append((name, path, journal))
+
+        # Journal zapsaný do DB, který worker nestihl smazat, by rollupy započítal podruhé
+        already_flushed = flushed_journals([name for name, _, _ in journals]) if flushed_journals and journals else set()
+
+        recovered = 0
+
+        for name, path, journal in journals:
+            if name in already_flushed:
+                os.remove(path)
+                journal.close()
+                continue
+
+            events = []
+            for line in journal:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Neúplný poslední řádek po pádu, hodnota nebyla potvrzena klientovi
+                    logging.warning(f"Skipping truncated statistics journal line in {path}")
+
+            with self._lock:
+                self._events.extend(events)
+                self._sealed.append((path, journal))
+                self.counters["recovered"] += len(events)
+
+            recovered += len(events)
+
+        if recovered:
+            logging.info(f"Recovered {recovered} buffered statistic values")
+
+        return recovered
+
+    def flush(self, writer, wait: bool = False) -> int:
+        # Souběžný flush by zapsal stejné journaly dvakrát, s wait=True se počká na jeho dokončení
+        if not self._flush_lock.acquire(blocking=wait):
+            return 0
+
+        try:
+            with self._lock:
+                self._flush_requested = False
+                if not self._events and not self._sealed:
+                    return 0
+
+                events = self._events
+                sealed = self._sealed + ([self._journal] if self._journal else [])
+                self._events = []
+                self._sealed, self._journal = [], None
+
+            try:
+                # Writer zapíše názvy journalů ve stejné transakci jako data
+                writer(events, [os.path.basename(path) for path, _ in sealed])
+            except Exception:
+                # Data zůstávají v paměti i v journalech do dalšího pokusu
+                with self._lock:
+                    self._events = events + self._events
+                    self._sealed = sealed + self._sealed
+                    self.counters["failed_flushes"] += 1
+                raise
+
+            for path, journal in sealed:
+                os.remove(path)
+                journal.close()
+
+            with self._lock:
+                self.counters["flushed"] += len(events)
+
+            return len(events)
+        finally:
+            self._flush_lock.release()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": STATISTICS_BUFFER_ENABLED,
+                "store_raw_values": STATISTICS_STORE_RAW_VALUES,
+                "pending": len(self._events),
+                "journals": len(self._sealed) + (1 if self._journal else 0),
+                "flush_max_events": self.flush_max_events,
+                **self.counters
+            }
+
+statistic_buffer = StatisticBuffer(STATISTICS_JOURNAL_DIR, STATISTICS_FLUSH_MAX_EVENTS, STATISTICS_JOURNAL_FSYNC)